@@ -1,14 +1,42 @@
 from django.contrib import admin
-from .models import Torb, Colony, Game, EvolutionEngine, StoryText, Army, ArmyTorb, Player
+from django.db.models import Avg, Max
+from .models import Torb, Colony, Game, EvolutionEngine, StoryText, Army, ArmyTorb, Player, RoundJob, RoundMetrics, GameAction, TorbArchive
 
 class TorbAdmin(admin.ModelAdmin):
     list_display = ('name', 'private_ID', 'colony', 'is_alive', 'hp', 'max_hp', 'action', 'action_desc')
+    readonly_fields = ('genes',)
 
 class ColonyAdmin(admin.ModelAdmin):
-    list_display = ('name', 'player', 'game', 'food', 'ready')
+    list_display = ('name', 'player', 'game', 'food', 'ready', 'soldier_count', 'training_count')
+
+class RoundMetricsInline(admin.TabularInline):
+    model = RoundMetrics
+    fields = ('round_number', 'created', 'colonies', 'torbs', 'total_ms', 'queries', 'rows_written', 'slowest_phase')
+    readonly_fields = fields
+    ordering = ('-round_number',)
+    extra = 0
+    can_delete = False
+    show_change_link = True
+
+    def has_add_permission(self, request, obj=None):
+        return False
 
 class GameAdmin(admin.ModelAdmin):
-    list_display = ('description', 'starting_torbs', 'round_number', 'private', 'closed', 'max_colonies_per_player')
+    list_display = ('description', 'starting_torbs', 'round_number', 'private', 'closed', 'max_colonies_per_player', 'round_deadline', 'avg_round_ms', 'max_round_ms')
+    inlines = [RoundMetricsInline]
+
+    def get_queryset(self, request):
+        return super().get_queryset(request).annotate(
+            avg_round_ms=Avg('round_metrics__total_ms'),
+            max_round_ms=Max('round_metrics__total_ms'))
+
+    @admin.display(description="Avg. round ms", ordering='avg_round_ms')
+    def avg_round_ms(self, game):
+        return round(game.avg_round_ms, 1) if game.avg_round_ms is not None else None
+
+    @admin.display(description="Max. round ms", ordering='max_round_ms')
+    def max_round_ms(self, game):
+        return round(game.max_round_ms, 1) if game.max_round_ms is not None else None
 
 class EvolutionEngineAdmin(admin.ModelAdmin):
     list_display = ('game', 'random_gene_min', 'random_gene_max', 'mutation_chance', 'mutation_dev', 'alleles_per_gene')
@@ -16,6 +44,56 @@ class EvolutionEngineAdmin(admin.ModelAdmin):
 class ArmyAdmin(admin.ModelAdmin):
     list_display = ('colony', 'scout_target', 'attack_target', 'morale')
 
+class RoundJobAdmin(admin.ModelAdmin):
+    list_display = ('game', 'round_number', 'status', 'created', 'started', 'finished')
+    list_filter = ('status',)
+
+class RoundMetricsAdmin(admin.ModelAdmin):
+    # Ordered by game and round, so each Game's rows read as a trend
+    list_display = ('game', 'round_number', 'colonies', 'torbs', 'total_ms', 'queries', 'rows_written', 'slowest_phase',
+                    'load_ms', 'breed_ms', 'army_ms', 'flush_ms')
+    list_filter = ('game',)
+    ordering = ('game', '-round_number')
+    readonly_fields = [field.name for field in RoundMetrics._meta.fields]
+
+    @admin.display(description="Load ms")
+    def load_ms(self, round_metrics):
+        return round_metrics.phase_ms('load')
+
+    @admin.display(description="Breed ms")
+    def breed_ms(self, round_metrics):
+        return round_metrics.phase_ms('call_breed_torbs')
+
+    @admin.display(description="Army ms")
+    def army_ms(self, round_metrics):
+        return round_metrics.phase_ms('army_round')
+
+    @admin.display(description="Flush ms")
+    def flush_ms(self, round_metrics):
+        return round_metrics.phase_ms('flush')
+
+class GameActionAdmin(admin.ModelAdmin):
+    # The journal is append-only, entries can be read and deleted with their Game
+    list_display = ('game', 'round_number', 'colony', 'action', 'torbs', 'target', 'created')
+    list_filter = ('action',)
+    ordering = ('game', 'id')
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+class TorbArchiveAdmin(admin.ModelAdmin):
+    list_display = ('name', 'private_ID', 'colony', 'generation', 'max_hp', 'died_round', 'archived')
+    readonly_fields = ('genes',)
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
 admin.site.register(Torb, TorbAdmin)
 admin.site.register(Colony, ColonyAdmin)
 admin.site.register(Game, GameAdmin)
@@ -23,4 +101,8 @@ admin.site.register(EvolutionEngine, EvolutionEngineAdmin)
 admin.site.register(Army, ArmyAdmin)
 admin.site.register(StoryText)
 admin.site.register(ArmyTorb)
-admin.site.register(Player)
\ No newline at end of file
+admin.site.register(Player)
+admin.site.register(RoundJob, RoundJobAdmin)
+admin.site.register(RoundMetrics, RoundMetricsAdmin)
+admin.site.register(GameAction, GameActionAdmin)
+admin.site.register(TorbArchive, TorbArchiveAdmin)
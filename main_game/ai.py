@@ -0,0 +1,169 @@
+"""Turns of AI colonies, planned for all AI colonies of a Game in one pass per round.
+
+RoundEngine.run plays them once it has claimed the round, just before loading it: plan_turns
+scores the genomes of every living Torb of every AI colony as one numpy array and picks each
+colony's orders from it, take_turns issues them through Player.perform_action, so they are
+journaled like any other order. The round's flush readies the AI colonies again in the same
+transaction, so human players never wait for them, see end_turns.
+"""
+import logging
+import time
+
+import numpy as np
+from django.conf import settings
+from django.db import transaction
+
+from . import cache, rng
+from .rules import decode_genome, GENOME_DTYPE
+
+logger = logging.getLogger('hereditus')
+
+# Share of its living Torbs a colony keeps in its army
+SOLDIER_SHARE = 1 / 3
+# Soldiers needed per defending soldier before attacking a discovered colony
+ATTACK_MARGIN = 1.2
+# Torbs that can take new orders, the others are busy until the round is done
+IDLE_ACTIONS = ('gathering', 'resting')
+MAX_DIFFICULTY = 10
+
+def genome_arrays(torbs, num_genes):
+    # (Torbs, genes, alleles), one buffer when every genome has as many alleles, as is usual
+    genomes = [torb.genome for torb in torbs]
+    if len({len(genome) for genome in genomes}) == 1:
+        return np.frombuffer(b''.join(genomes), dtype=GENOME_DTYPE).reshape(len(genomes), num_genes, -1)
+    # Some Torb has fewer alleles, every Torb is scored on as many as it has
+    alleles = min(len(genome) for genome in genomes) // (GENOME_DTYPE.itemsize * num_genes)
+    return np.stack([decode_genome(genome, num_genes)[:, :alleles] for genome in genomes])
+
+def torb_scores(genomes, gene_list):
+    # (fitness, combat) per Torb: the mean of all alleles is what breeding passes on, soldiers
+    # fight with one allele of each gene drawn when they enlist, see rules.combat_stats
+    gene_means = genomes.mean(axis=2)
+    fitness = gene_means.mean(axis=1)
+    genes = {gene: i for i, gene in enumerate(gene_list)}
+    if {'strength', 'agility', 'vitality', 'sturdiness'} <= genes.keys():
+        combat = np.sqrt(gene_means[:, genes['strength']] * gene_means[:, genes['agility']]
+                         * gene_means[:, genes['vitality']] * gene_means[:, genes['sturdiness']])
+    else:
+        combat = fitness
+    return fitness, combat
+
+def plan_turns(game, colonies):
+    """{colony id: [(action, {perform_action arguments})]} for the given AI colonies of the Game.
+
+    Reads every living Torb of the colonies, their genomes, the Game's colonies and what each
+    AI colony has discovered in a fixed number of queries, then scores all Torbs at once.
+    Lower difficulties blur the scores with noise from the Game's AI stream.
+    """
+    from .models import Colony, Torb
+    colony_ids = [colony.pk for colony in colonies]
+    position = {pk: i for i, pk in enumerate(colony_ids)}
+    torbs = cache.attach_genomes(list(Torb.objects.filter(colony__in=colony_ids, is_alive=True)
+                                      .defer('genome').order_by('colony_id', 'id')))
+    soldiers = dict(Colony.objects.filter(game=game).values_list('id', 'soldier_count'))
+    discovered = {pk: set() for pk in colony_ids}
+    for from_colony_id, to_colony_id in Colony.discovered_colonies.through.objects.filter(
+            from_colony_id__in=colony_ids).values_list('from_colony_id', 'to_colony_id'):
+        discovered[from_colony_id].add(to_colony_id)
+    generator = rng.ai_generator(game.rng_seed, game.round_number)
+    orders = {pk: [] for pk in colony_ids}
+    if not torbs:
+        return orders
+
+    gene_list = cache.evolution_engine(game.pk).gene_list
+    fitness, combat = torb_scores(genome_arrays(torbs, len(gene_list)), gene_list)
+    colony_index = np.array([position[torb.colony_id] for torb in torbs])
+    blur = np.array([(MAX_DIFFICULTY - min(colony.player.aiplayer.difficulty, MAX_DIFFICULTY)) / MAX_DIFFICULTY
+                     for colony in colonies])[colony_index]
+    fitness = fitness + blur * fitness.std() * generator.standard_normal(len(torbs))
+    combat = combat + blur * combat.std() * generator.standard_normal(len(torbs))
+    idle = np.array([torb.action in IDLE_ACTIONS and not torb.growing for torb in torbs])
+    fertile = idle & np.array([torb.fertile and not torb.starving for torb in torbs])
+    gathering = np.array([torb.action == 'gathering' for torb in torbs])
+    ids = np.array([torb.pk for torb in torbs])
+    # Torbs are ordered by colony, so every colony's Torbs are one slice
+    bounds = np.searchsorted(colony_index, np.arange(len(colonies) + 1))
+
+    for i, colony in enumerate(colonies):
+        start, end = bounds[i], bounds[i + 1]
+        colony_orders = orders[colony.pk]
+        busy = np.zeros(end - start, dtype=bool)
+
+        # Breed the two fittest fertile Torbs while the food would feed the newborn too
+        candidates = np.flatnonzero(fertile[start:end])
+        if len(candidates) >= 2 and colony.food > end - start:
+            pair = candidates[np.argsort(-fitness[start:end][candidates], kind='stable')[:2]]
+            busy[pair] = True
+            colony_orders.append(('breed', {'torb_ids': ids[start:end][pair].tolist()}))
+
+        # Enlist the strongest idle Torbs until the army makes its share of the colony
+        wanted = round((end - start) * SOLDIER_SHARE) - colony.soldier_count - colony.training_count
+        candidates = np.flatnonzero(idle[start:end] & ~busy)
+        if wanted > 0 and len(candidates):
+            recruits = candidates[np.argsort(-combat[start:end][candidates], kind='stable')[:wanted]]
+            busy[recruits] = True
+            colony_orders.append(('enlist', {'torb_ids': ids[start:end][recruits].tolist()}))
+
+        # Everyone else gathers
+        gatherers = np.flatnonzero(idle[start:end] & ~busy & ~gathering[start:end])
+        if len(gatherers):
+            colony_orders.append(('gather', {'torb_ids': ids[start:end][gatherers].tolist()}))
+
+        # Scout an unknown colony, attack the weakest known one the army clearly outnumbers
+        others = sorted(set(soldiers) - {colony.pk})
+        unknown = [pk for pk in others if pk not in discovered[colony.pk]]
+        if unknown and colony.army.scout_target_id not in unknown:
+            colony_orders.append(('scout', {'target_colony_id': int(generator.choice(unknown))}))
+        known = [pk for pk in others if pk in discovered[colony.pk]]
+        if known and colony.soldier_count:
+            weakest = min(known, key=lambda pk: (soldiers[pk], pk))
+            if colony.soldier_count >= ATTACK_MARGIN * soldiers[weakest] and colony.army.attack_target_id != weakest:
+                colony_orders.append(('attack', {'target_colony_id': weakest}))
+    return orders
+
+def ai_colonies(game, **filters):
+    from .models import Colony
+    return list(Colony.objects.filter(game=game, player__aiplayer__isnull=False, **filters)
+                .select_related('player__aiplayer', 'army').order_by('id'))
+
+def issue_orders(colony, orders, round_number=None):
+    # One commit per colony rather than one per write
+    with transaction.atomic():
+        for action, arguments in orders:
+            colony.player.perform_action(colony, action, round_number=round_number, **arguments)
+
+def take_turns(game, round_number=None):
+    """Plans and issues the orders of every AI colony of the Game, returns the colonies.
+
+    Orders are issued colony by colony until settings.AI_TURN_BUDGET_MS runs out, colonies
+    left over keep their orders from the rounds before. round_number is the round the orders
+    are journaled under, RoundEngine.run has already moved the Game past it when it plays.
+    """
+    colonies = ai_colonies(game)
+    if not colonies:
+        return colonies
+    started = time.perf_counter()
+    budget = settings.AI_TURN_BUDGET_MS / 1000
+    plans = plan_turns(game, colonies)
+    for played, colony in enumerate(colonies):
+        if time.perf_counter() - started > budget:
+            logger.warning("AI turns of Game '%s' ran over %s ms, %s colonies keep their last orders",
+                           game, settings.AI_TURN_BUDGET_MS, len(colonies) - played)
+            break
+        issue_orders(colony, plans[colony.pk], round_number)
+    logger.debug("Played %s AI colonies of Game '%s' in %.3f s", len(colonies), game, time.perf_counter() - started)
+    return colonies
+
+def end_turns(game, colonies, round_number):
+    # AI colonies end their turn as soon as the round starts, journaled like an end_turn order
+    from .models import GameAction
+    return [GameAction(game_id=game.pk, round_number=round_number, colony_id=colony.pk, action=GameAction.END_TURN)
+            for colony in colonies]
+
+def ready_colonies(game, colonies):
+    # Outside of a round, as for a newly founded AI colony, see RoundEngine.flush otherwise
+    from .models import Colony, GameAction
+    if not colonies:
+        return
+    Colony.objects.filter(pk__in=[colony.pk for colony in colonies]).update(ready=True)
+    GameAction.objects.bulk_create(end_turns(game, colonies, game.round_number))
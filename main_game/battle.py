@@ -0,0 +1,131 @@
+import logging
+import random
+from collections import Counter
+
+from django.db import transaction
+from django.db.models import F
+
+logger = logging.getLogger('hereditus')
+
+# Safety net for armies that can no longer hurt each other, e.g. two sides of 1-power Torbs
+MAX_EXCHANGES = 10000
+
+class BattleSide:
+    def __init__(self, army, army_torbs, colony_name):
+        self.army = army
+        self.colony_name = colony_name
+        self.army_torbs = list(army_torbs)
+        self.power = [army_torb.power for army_torb in self.army_torbs]
+        self.resilience = [army_torb.resilience for army_torb in self.army_torbs]
+        self.agility = [army_torb.active_alleles['agility'] for army_torb in self.army_torbs]
+        self.hp = [army_torb.torb.hp for army_torb in self.army_torbs]
+        self.max_hp = [army_torb.torb.max_hp for army_torb in self.army_torbs]
+        self.alive = list(range(len(self.army_torbs)))
+        self.morale = army.morale
+
+    def adjust_morale(self, adjust_amount):
+        self.morale = max(0, min(100, self.morale + adjust_amount))
+
+class Battle:
+    """Simulates a fight between two Armies on snapshots of their ArmyTorbs.
+
+    Nothing is written while fighting; HP, deaths and morale are kept on the BattleSides
+    and either saved in one batch with commit() or applied by the caller (see RoundEngine).
+    """
+
+    def __init__(self, ally, enemy, rnd=random):
+        self.ally = ally
+        self.enemy = enemy
+        self.random = rnd
+        self.deaths = [] # (side, index, context) in the order the Torbs died
+        self.exchanges = 0
+
+    def fight(self) -> bool:
+        ally, enemy, rnd = self.ally, self.enemy, self.random
+        ally_enough_morale = ally.morale > rnd.randrange(1, 50)
+        while ally.alive and enemy.alive and ally_enough_morale and self.exchanges < MAX_EXCHANGES:
+            self.torb_fight(rnd.choice(ally.alive), rnd.choice(enemy.alive))
+            self.exchanges += 1
+        logger.debug("%s fought %s for %s exchanges, %s Torbs died", ally.colony_name, enemy.colony_name, self.exchanges, len(self.deaths))
+        return not enemy.alive
+
+    def torb_fight(self, ally_index, enemy_index):
+        ally, enemy, uniform = self.ally, self.enemy, self.random.uniform
+        ally_attack   = uniform(1, ally.power[ally_index])
+        ally_defense  = uniform(1, ally.resilience[ally_index])
+
+        enemy_attack  = uniform(1, enemy.power[enemy_index])
+        enemy_defense = uniform(1, enemy.resilience[enemy_index])
+
+        ally_speed    = uniform(1, ally.agility[ally_index])
+        enemy_speed   = uniform(1, enemy.agility[enemy_index])
+
+        ally_hp_adjust = 0
+        enemy_hp_adjust = 0
+
+        if ally_speed > enemy_speed:
+            enemy_hp_adjust = round(min(0, enemy_defense - ally_attack), 0)
+            self.adjust_hp(enemy, enemy_index, enemy_hp_adjust, context=f"defending against {ally.colony_name}'s Army")
+            if enemy.hp[enemy_index] > 0:
+                ally_hp_adjust = round(min(0, ally_defense - enemy_attack), 0)
+                self.adjust_hp(ally, ally_index, ally_hp_adjust, context=f"in a battle against {enemy.colony_name}")
+        else:
+            ally_hp_adjust = round(min(0, ally_defense - enemy_attack), 0)
+            self.adjust_hp(ally, ally_index, ally_hp_adjust, context=f"in a battle against {enemy.colony_name}")
+            if enemy.hp[enemy_index] > 0:
+                enemy_hp_adjust = round(min(0, enemy_defense - ally_attack), 0)
+                self.adjust_hp(enemy, enemy_index, enemy_hp_adjust, context=f"defending against {ally.colony_name}'s Army")
+
+        if ally_hp_adjust > enemy_hp_adjust:
+            ally.adjust_morale(1)
+            enemy.adjust_morale(-1)
+        else:
+            ally.adjust_morale(-1)
+            enemy.adjust_morale(1)
+
+    def adjust_hp(self, side, index, adjust_amount, context):
+        side.hp[index] = min(max(0, side.hp[index] + int(adjust_amount)), side.max_hp[index])
+        if side.hp[index] > 0:
+            return
+        side.alive.remove(index)
+        self.deaths.append((side, index, context))
+
+    def commit(self, round_number):
+        from .models import Army, ArmyTorb, Colony, StoryText, Torb
+        from .models.torb import COLONY_COUNTERS
+
+        dead = set()
+        counter_changes = Counter()
+        story_texts = []
+        for side, index, context in self.deaths:
+            torb = side.army_torbs[index].torb
+            counter = COLONY_COUNTERS.get(torb.action)
+            if counter:
+                counter_changes[(torb.colony_id, counter)] += 1
+            torb.is_alive = False
+            torb.fertile = False
+            torb.died_round = round_number
+            torb.action = "dead"
+            torb.action_desc = "💀 Dead"
+            dead.add(torb.pk)
+            story_texts.append(StoryText(
+                colony_id=torb.colony_id,
+                story_text_type="death",
+                story_text=f"'{torb.name}' (Torb {torb.private_ID}) died from {context}.",
+                game_round=round_number))
+
+        torbs = []
+        for side in (self.ally, self.enemy):
+            for army_torb, hp in zip(side.army_torbs, side.hp):
+                if army_torb.torb.hp != hp or army_torb.torb.pk in dead:
+                    army_torb.torb.hp = hp
+                    torbs.append(army_torb.torb)
+            side.army.morale = side.morale
+
+        with transaction.atomic():
+            Torb.objects.bulk_update(torbs, ['hp', 'is_alive', 'fertile', 'action', 'action_desc', 'died_round'])
+            ArmyTorb.objects.filter(torb_id__in=dead).delete()
+            Army.objects.bulk_update([self.ally.army, self.enemy.army], ['morale'])
+            StoryText.objects.bulk_create(story_texts)
+            for (colony_id, counter), num_dead in counter_changes.items():
+                Colony.objects.filter(pk=colony_id).update(**{counter: F(counter) - num_dead})
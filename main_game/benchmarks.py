@@ -0,0 +1,152 @@
+import logging
+import math
+import random
+import statistics
+import time
+
+from django.contrib.auth.models import User
+from django.db import connection
+
+from .models import Army, ArmyTorb, Colony, EvolutionEngine, Game, Player, StoryText, Torb
+from .models.torb import COLONY_COUNTERS, encode_genome
+
+logger = logging.getLogger('hereditus')
+
+# Share of seeded Torbs per state, the rest are alive and gathering
+SEED_DEAD = 0.3
+SEED_GROWING = 0.1
+SEED_ACTIONS = [
+    ('soldiering', "🏹 Soldiering"),
+    ('training', "🏋 Training"),
+    ('resting', "🛌 Resting"),
+    ('gathering', "🌾 Gathering"),
+    ('gathering', "🌾 Gathering"),
+]
+
+def seed_games(num_games, colonies_per_game=4, torbs_per_colony=50, story_texts_per_colony=200, round_number=50, seed=0):
+    """Fills the database with mid-game Games for benchmarks, written in bulk.
+
+    Seeded Torbs mix living, dead and growing ones; soldiers are enlisted in their Army and
+    the Colony counters match. Meant for scratch databases or a transaction that is rolled back.
+    """
+    rnd = random.Random(seed)
+    games = [Game.objects.create(description=f"Benchmark Game {i}", round_number=round_number, rng_seed=seed + i) for i in range(num_games)]
+    engines = {engine.game_id: engine for engine in EvolutionEngine.objects.filter(game__in=games)}
+
+    colonies = Colony.objects.bulk_create([
+        Colony(name=f"Benchmark Colony {game.id}-{i}", game=game, food=rnd.randrange(0, 200), ready=rnd.random() < 0.5)
+        for game in games for i in range(colonies_per_game)])
+    armies = Army.objects.bulk_create([Army(colony=colony, morale=rnd.randrange(50, 101)) for colony in colonies])
+    for colony, army in zip(colonies, armies):
+        colony.army = army
+
+    torbs = []
+    for colony in colonies:
+        engine = engines[colony.game_id]
+        for _ in range(torbs_per_colony):
+            private_ID, name = colony.take_torb_identity()
+            torb = Torb(
+                colony=colony,
+                private_ID=private_ID,
+                name=name,
+                generation=rnd.randrange(0, 10),
+                genome=encode_genome({gene: [rnd.uniform(engine.random_gene_min, engine.random_gene_max) for _ in range(engine.alleles_per_gene)]
+                                      for gene in engine.gene_list}, engine.gene_list))
+            torb.gene_list = engine.gene_list
+            torb.max_hp = torb.hp = rnd.randrange(5, 20)
+            state = rnd.random()
+            if state < SEED_DEAD:
+                torb.is_alive, torb.fertile, torb.hp, torb.died_round = False, False, 0, 0
+                torb.action, torb.action_desc = "dead", "💀 Dead"
+            elif state < SEED_DEAD + SEED_GROWING:
+                torb.growing, torb.fertile = True, False
+                torb.action, torb.action_desc = "growing", "🍼 Growing"
+            else:
+                torb.action, torb.action_desc = rnd.choice(SEED_ACTIONS)
+                counter = COLONY_COUNTERS.get(torb.action)
+                if counter:
+                    setattr(colony, counter, getattr(colony, counter) + 1)
+            torbs.append(torb)
+    Torb.objects.bulk_create(torbs, batch_size=1000)
+    Colony.objects.bulk_update(colonies, ['army', 'soldier_count', 'training_count', 'next_private_ID', 'names_allocated'], batch_size=1000)
+
+    ArmyTorb.objects.bulk_create([
+        ArmyTorb.enlist(torb.colony.army, torb, rnd)
+        for torb in torbs if torb.action == 'soldiering'], batch_size=1000)
+
+    through = Colony.discovered_colonies.through
+    discoveries = []
+    for game_colonies in (colonies[i:i + colonies_per_game] for i in range(0, len(colonies), colonies_per_game)):
+        for colony in game_colonies:
+            known = [colony] + rnd.sample(game_colonies, rnd.randrange(0, len(game_colonies)))
+            discoveries += [through(from_colony_id=colony.id, to_colony_id=other.id) for other in known]
+    through.objects.bulk_create(discoveries, batch_size=1000, ignore_conflicts=True)
+
+    StoryText.objects.bulk_create([
+        StoryText(colony=colony, story_text_type="default", story_text=f"Benchmark entry {i}",
+                  game_round=i * round_number // story_texts_per_colony)
+        for colony in colonies for i in range(story_texts_per_colony)], batch_size=1000)
+
+    logger.info(f"Seeded {num_games} benchmark Games with {len(colonies)} colonies and {len(torbs)} Torbs")
+    return games
+
+def seed_played_games(num_games, colonies_per_game=4, torbs_per_colony=20, seed=0):
+    """Creates Games the way players do, each Colony owned by its own Player.
+
+    Slower than seed_games() but goes through Colony.save and EvolutionEngine.protogenesis_torb,
+    so the Games are exactly what a real round would see. Game i rolls its founding genes and
+    rounds from seed + i.
+    """
+    games = []
+    for i in range(num_games):
+        game = Game.objects.create(description=f"Benchmark Game {i}", starting_torbs=torbs_per_colony, rng_seed=seed + i)
+        for j in range(colonies_per_game):
+            user = User.objects.create(username=f"bench{game.id}_{j}")
+            colony = Colony(name=f"Benchmark Colony {game.id}-{j}", game=game)
+            colony.player = Player.objects.create(user=user)
+            colony.save()
+        games.append(game)
+    logger.info(f"Seeded {num_games} played benchmark Games with {colonies_per_game} colonies of {torbs_per_colony} Torbs")
+    return games
+
+def random_actions(game, rnd):
+    # One turn of random orders for every Colony of the Game, issued through Player.perform_action
+    colonies = list(game.colony_set.select_related('player', 'army').order_by('id'))
+    for colony in colonies:
+        torbs = [torb for torb in colony.torb_set.filter(is_alive=True, growing=False) if torb.action != "soldiering"]
+        rnd.shuffle(torbs)
+        fertile = [torb for torb in torbs if torb.fertile]
+        if len(fertile) >= 2 and rnd.random() < 0.5:
+            colony.player.perform_action(colony=colony, action='breed', torb_ids=[fertile[0].id, fertile[1].id])
+            torbs = [torb for torb in torbs if torb not in fertile[:2]]
+        num_enlisted = rnd.randrange(0, len(torbs) // 4 + 1)
+        colony.player.perform_action(colony=colony, action='enlist', torb_ids=[torb.id for torb in torbs[:num_enlisted]])
+        colony.player.perform_action(colony=colony, action='gather', torb_ids=[torb.id for torb in torbs[num_enlisted:]])
+
+        others = [other for other in colonies if other.pk != colony.pk]
+        if others and rnd.random() < 0.7:
+            colony.player.perform_action(colony=colony, action='scout', target_colony_id=rnd.choice(others).id)
+        if others and rnd.random() < 0.3:
+            colony.player.perform_action(colony=colony, action='attack', target_colony_id=rnd.choice(others).id)
+
+def percentile(values, p):
+    # Nearest-rank percentile, p between 0 and 100
+    ordered = sorted(values)
+    return ordered[max(0, math.ceil(p / 100 * len(ordered)) - 1)]
+
+def summarize(values):
+    return {'p50': percentile(values, 50), 'p95': percentile(values, 95), 'max': max(values)}
+
+def analyze():
+    # Refreshes planner statistics so EXPLAIN reflects freshly seeded data
+    with connection.cursor() as cursor:
+        cursor.execute("ANALYZE")
+
+def time_call(func, repeat):
+    # Median wall time in milliseconds
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        func()
+        timings.append((time.perf_counter() - started) * 1000)
+    return statistics.median(timings)
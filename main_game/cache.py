@@ -0,0 +1,131 @@
+"""Read-through cache for Game data that never or rarely changes.
+
+Torb genomes are fixed at birth, EvolutionEngine settings only change in the admin and a
+Game's round number once per round. They are read through the Django cache named by
+settings.HEREDITUS_CACHE, and hits and misses are counted per kind so the cache can be
+sized, see stats().
+"""
+import logging
+import threading
+from collections import defaultdict
+
+from django.conf import settings
+from django.core.cache import caches
+
+logger = logging.getLogger('hereditus')
+
+GENOME = 'genome'
+ENGINE = 'engine'
+ROUND = 'round'
+COLONY_GAME = 'colony_game'
+
+# Seconds per kind. Entries that can change are invalidated where they change, but a
+# local-memory cache only hears about changes made in its own process, e.g. not about
+# rounds resolved by run_round_worker, so those expire quickly.
+TIMEOUTS = {
+    GENOME: 24 * 60 * 60,
+    COLONY_GAME: 24 * 60 * 60,
+    ENGINE: 5 * 60,
+    ROUND: 5,
+}
+
+class CacheStats:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.counts = defaultdict(lambda: {'hits': 0, 'misses': 0})
+
+    def count(self, kind, hits=0, misses=0):
+        with self.lock:
+            self.counts[kind]['hits'] += hits
+            self.counts[kind]['misses'] += misses
+
+    def as_dict(self):
+        with self.lock:
+            return {
+                kind: {**counts, 'hit_rate': round(counts['hits'] / max(1, counts['hits'] + counts['misses']), 3)}
+                for kind, counts in self.counts.items()}
+
+    def reset(self):
+        with self.lock:
+            self.counts.clear()
+
+cache_stats = CacheStats()
+
+def get_cache():
+    return caches[settings.HEREDITUS_CACHE]
+
+def cache_key(kind, key):
+    return f"hereditus:{kind}:{key}"
+
+def get_or_load(kind, key, load):
+    cache = get_cache()
+    value = cache.get(cache_key(kind, key))
+    if value is not None:
+        cache_stats.count(kind, hits=1)
+        return value
+    cache_stats.count(kind, misses=1)
+    value = load()
+    cache.set(cache_key(kind, key), value, TIMEOUTS[kind])
+    return value
+
+def get_or_load_many(kind, keys, load_many):
+    # load_many gets the keys missing from the cache and returns a dict for them
+    cache = get_cache()
+    cached = cache.get_many([cache_key(kind, key) for key in keys])
+    values = {key: cached[cache_key(kind, key)] for key in keys if cache_key(kind, key) in cached}
+    missing = [key for key in keys if key not in values]
+    cache_stats.count(kind, hits=len(values), misses=len(missing))
+    if missing:
+        loaded = load_many(missing)
+        cache.set_many({cache_key(kind, key): value for key, value in loaded.items()}, TIMEOUTS[kind])
+        values.update(loaded)
+    return values
+
+def invalidate(kind, key):
+    get_cache().delete(cache_key(kind, key))
+
+def stats():
+    return cache_stats.as_dict()
+
+# Kinds
+
+def genomes(torb_ids):
+    # Stored bytes, the database may hand them out as memoryviews
+    from .models import Torb
+    return get_or_load_many(GENOME, list(torb_ids), lambda missing: {
+        torb_id: bytes(genome) for torb_id, genome in Torb.objects.filter(pk__in=missing).values_list('id', 'genome')})
+
+def attach_genomes(torbs):
+    # For Torbs loaded with .defer('genome'), one query for the genomes missing from the cache
+    torb_genomes = genomes(torb.pk for torb in torbs)
+    for torb in torbs:
+        torb.genome = torb_genomes[torb.pk]
+    return torbs
+
+def evolution_engine(game_id):
+    from .models import EvolutionEngine
+    return get_or_load(ENGINE, game_id, lambda: EvolutionEngine.objects.get(game_id=game_id))
+
+def colony_game_id(colony_id):
+    from .models import Colony
+    return get_or_load(COLONY_GAME, colony_id, lambda: Colony.objects.filter(pk=colony_id).values_list('game_id', flat=True).get())
+
+def game_round(game_id):
+    from .models import Game
+    return get_or_load(ROUND, game_id, lambda: Game.objects.filter(pk=game_id).values_list('round_number', flat=True).get())
+
+def colony_round(colony_id):
+    # Colonies never change Game, so only the round itself expires. A Colony seen for the first
+    # time costs one joined query that fills both entries.
+    from .models import Colony
+    cache = get_cache()
+    game_id = cache.get(cache_key(COLONY_GAME, colony_id))
+    if game_id is not None:
+        cache_stats.count(COLONY_GAME, hits=1)
+        return game_round(game_id)
+    cache_stats.count(COLONY_GAME, misses=1)
+    cache_stats.count(ROUND, misses=1)
+    game_id, round_number = Colony.objects.filter(pk=colony_id).values_list('game_id', 'game__round_number').get()
+    cache.set(cache_key(COLONY_GAME, colony_id), game_id, TIMEOUTS[COLONY_GAME])
+    cache.set(cache_key(ROUND, game_id), round_number, TIMEOUTS[ROUND])
+    return round_number
@@ -0,0 +1,137 @@
+import json
+import logging
+import queue
+import threading
+import time
+from collections import defaultdict
+
+from django.db import close_old_connections, connection, models
+
+logger = logging.getLogger('hereditus')
+
+KEEPALIVE_SECONDS = 15
+# Each open stream holds a server thread, so streams end after this long and the browser
+# reconnects after RETRY_MS, see the README
+STREAM_SECONDS = 300
+RETRY_MS = 3000
+
+class GameEventBroker:
+    """In-process fan-out of per-game events to Server-Sent Event streams.
+
+    publish() can be called from any thread and feeds every subscriber's queue. stream() is a
+    plain generator, so it works under WSGI as well as ASGI, and it ends after STREAM_SECONDS.
+    Rounds resolved in another process (see run_round_worker) are picked up by a single watcher
+    thread per process that checks every subscribed game in one query.
+    """
+
+    def __init__(self, poll_interval=5.0):
+        self.poll_interval = poll_interval
+        self.subscribers = defaultdict(set)
+        self.last_events = defaultdict(dict)
+        self.lock = threading.Lock()
+        self.watcher = None
+
+    def subscribe(self, game_id):
+        subscriber = queue.SimpleQueue()
+        with self.lock:
+            self.subscribers[game_id].add(subscriber)
+            if self.watcher is None:
+                self.watcher = threading.Thread(target=self.watch, name="game-events-watcher", daemon=True)
+                self.watcher.start()
+        return subscriber
+
+    def unsubscribe(self, game_id, subscriber):
+        with self.lock:
+            self.subscribers[game_id].discard(subscriber)
+            if not self.subscribers[game_id]:
+                del self.subscribers[game_id]
+                self.last_events.pop(game_id, None)
+
+    def publish(self, game_id, event, data):
+        with self.lock:
+            self.last_events[game_id][event] = data
+            subscribers = list(self.subscribers.get(game_id, ()))
+        message = self.format(event, data)
+        for subscriber in subscribers:
+            subscriber.put(message)
+        logger.debug("Published '%s' %s to %s listeners of Game %s", event, data, len(subscribers), game_id)
+
+    def publish_if_changed(self, game_id, event, data):
+        with self.lock:
+            changed = self.last_events[game_id].get(event) != data
+        if changed:
+            self.publish(game_id, event, data)
+
+    @staticmethod
+    def format(event, data):
+        return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+    def stream(self, game_id, initial_events=(), lifetime=STREAM_SECONDS):
+        subscriber = self.subscribe(game_id)
+        ends = time.monotonic() + lifetime
+        try:
+            yield f"retry: {RETRY_MS}\n\n"
+            for event, data in initial_events:
+                with self.lock:
+                    self.last_events[game_id].setdefault(event, data)
+                yield self.format(event, data)
+            while (remaining := ends - time.monotonic()) > 0:
+                try:
+                    yield subscriber.get(timeout=min(KEEPALIVE_SECONDS, remaining))
+                except queue.Empty:
+                    yield ": keepalive\n\n"
+        finally:
+            self.unsubscribe(game_id, subscriber)
+
+    def watch(self):
+        # Stops once nobody listens, the next subscribe() starts a new watcher. Deciding to stop and
+        # clearing self.watcher happen under one lock, so no subscribe() can see a watcher that is leaving
+        try:
+            while True:
+                time.sleep(self.poll_interval)
+                with self.lock:
+                    if not self.subscribers:
+                        self.stop_watching()
+                        return
+                self.check_games()
+                close_old_connections()
+        except BaseException:
+            with self.lock:
+                self.stop_watching()
+            raise
+        finally:
+            # The watcher's own connection, threads don't share them
+            connection.close()
+
+    def stop_watching(self):
+        # Called with self.lock held
+        if self.watcher is threading.current_thread():
+            self.watcher = None
+
+    def check_games(self):
+        with self.lock:
+            game_ids = list(self.subscribers)
+        if not game_ids:
+            return
+        try:
+            states = game_states(game_ids)
+        except Exception:
+            logger.exception("Failed to check game states for event listeners")
+            return
+        for game_id, events in states.items():
+            for event, data in events:
+                self.publish_if_changed(game_id, event, data)
+
+def game_states(game_ids):
+    from .models import Game
+    games = Game.objects.filter(id__in=game_ids).annotate(
+        unready=models.Count('colony', filter=models.Q(colony__ready=False)))
+    return {game.id: game_events_for(game.round_number, game.unready) for game in games}
+
+def game_events_for(round_number, unready):
+    return [
+        ('round', {'round_number': round_number}),
+        ('unready', {'unready': unready}),
+    ]
+
+game_events = GameEventBroker()
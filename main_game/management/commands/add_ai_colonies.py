@@ -0,0 +1,23 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from main_game.models import AIPlayer, Game
+
+class Command(BaseCommand):
+    help = "Founds AI colonies in a Game, they give their orders every round just before it resolves"
+
+    def add_arguments(self, parser):
+        parser.add_argument('game_id', type=int)
+        parser.add_argument('--count', type=int, default=1, help="Number of AI colonies to found")
+        parser.add_argument('--difficulty', type=int, default=10, help="1 to 10, lower AIs choose less carefully")
+
+    def handle(self, *args, **options):
+        try:
+            game = Game.objects.get(pk=options['game_id'])
+        except Game.DoesNotExist:
+            raise CommandError(f"Game {options['game_id']} does not exist")
+        if not 1 <= options['difficulty'] <= 10:
+            raise CommandError("--difficulty must be between 1 and 10")
+        first = game.colony_set.count() + 1
+        for number in range(first, first + options['count']):
+            colony = AIPlayer.found_colony(game, f"AI Colony {number}", options['difficulty'])
+            self.stdout.write(f"Founded AI colony {colony.pk} '{colony.name}'")
@@ -0,0 +1,25 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from main_game.models import Game, TorbArchive
+
+class Command(BaseCommand):
+    help = ("Moves Torbs that died long enough ago into the TorbArchive table. Games do this themselves every "
+            "TORB_ARCHIVE_AFTER_ROUNDS rounds, run it once after upgrading or to catch up")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--game', type=int, help="Only archive the Torbs of this Game id")
+        parser.add_argument('--after-rounds', type=int, default=settings.TORB_ARCHIVE_AFTER_ROUNDS,
+                            help="Rounds a Torb must have been dead for")
+
+    def handle(self, *args, **options):
+        games = Game.objects.order_by('id')
+        if options['game']:
+            games = games.filter(pk=options['game'])
+        total = 0
+        for game in games:
+            archived = TorbArchive.archive_dead_torbs(game, after_rounds=options['after_rounds'])
+            if archived:
+                self.stdout.write(f"Game {game.pk} '{game}': archived {archived} Torbs")
+            total += archived
+        self.stdout.write(self.style.SUCCESS(f"Archived {total} dead Torbs"))
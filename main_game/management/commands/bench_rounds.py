@@ -0,0 +1,117 @@
+import json
+import logging
+import random
+import resource
+import time
+import tracemalloc
+from collections import defaultdict
+
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.test import RequestFactory
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from main_game import cache, views
+from main_game.benchmarks import random_actions, seed_played_games, summarize
+
+logger = logging.getLogger('hereditus')
+
+PAGES = {
+    'colony_view': views.colony_view,
+    'army_view': views.army_view,
+}
+
+class Command(BaseCommand):
+    help = ("Seeds Games, plays rounds of random orders and reports p50/p95 latency, query counts and peak "
+            "memory of next_round, its phases and the colony pages as JSON, with the cache hit rates. "
+            "Everything is rolled back unless --keep is given")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--games', type=int, default=5, help="Number of Games to seed")
+        parser.add_argument('--colonies', type=int, default=4, help="Colonies per Game")
+        parser.add_argument('--torbs', type=int, default=20, help="Starting Torbs per Colony")
+        parser.add_argument('--rounds', type=int, default=5, help="Rounds to play in every Game")
+        parser.add_argument('--seed', type=int, default=0, help="Seed for the random orders, Game i founds its Torbs and rolls its rounds with seed + i")
+        parser.add_argument('--output', help="Write the JSON report to this file instead of stdout")
+        parser.add_argument('--keep', action='store_true', help="Commit the seeded Games instead of rolling them back")
+        parser.add_argument('--trace-memory', action='store_true',
+                            help="Report the peak memory of each round with tracemalloc, this slows every timing down")
+
+    def handle(self, *args, **options):
+        rnd = random.Random(options['seed'])
+        samples = defaultdict(list)
+        cache.cache_stats.reset()
+
+        with transaction.atomic():
+            games = seed_played_games(options['games'], options['colonies'], options['torbs'], seed=options['seed'])
+            if options['trace_memory']:
+                tracemalloc.start()
+            try:
+                for round_index in range(options['rounds']):
+                    for game in games:
+                        random_actions(game, rnd)
+                        game.refresh_from_db()
+                        self.measure_round(game, samples)
+                        self.measure_pages(game, samples)
+                    logger.info(f"Benchmark round {round_index + 1}/{options['rounds']} played in {len(games)} Games")
+            finally:
+                tracemalloc.stop()
+            if not options['keep']:
+                transaction.set_rollback(True)
+
+        report = {
+            'config': {key: options[key] for key in ('games', 'colonies', 'torbs', 'rounds', 'seed', 'trace_memory')},
+            # ru_maxrss is in kilobytes on Linux
+            'peak_rss_kb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+            **{name: {metric: self.rounded(summarize(values)) for metric, values in metrics.items()}
+               for name, metrics in self.group(samples).items()},
+            'cache': cache.stats(),
+        }
+        output = json.dumps(report, indent=2)
+        if options['output']:
+            with open(options['output'], 'w') as report_file:
+                report_file.write(output + "\n")
+            self.stdout.write(self.style.SUCCESS(f"Wrote benchmark report to {options['output']}"))
+        else:
+            self.stdout.write(output)
+
+    @staticmethod
+    def measure_round(game, samples):
+        if tracemalloc.is_tracing():
+            tracemalloc.reset_peak()
+        with CaptureQueriesContext(connection) as queries:
+            started = time.perf_counter()
+            round_engine = game.next_round()
+            elapsed = time.perf_counter() - started
+        samples[('next_round', 'ms')].append(elapsed * 1000)
+        samples[('next_round', 'queries')].append(len(queries))
+        if tracemalloc.is_tracing():
+            samples[('next_round', 'peak_memory_kb')].append(tracemalloc.get_traced_memory()[1] / 1024)
+        for phase, metrics in round_engine.phase_metrics.items():
+            if phase != 'round':
+                samples[('phases', phase)].append(metrics['ms'])
+
+    @staticmethod
+    def measure_pages(game, samples):
+        colony = game.colony_set.select_related('player__user').order_by('?').first()
+        for name, view in PAGES.items():
+            request = RequestFactory().get(reverse(name, args=[colony.id]))
+            request.user = colony.player.user
+            with CaptureQueriesContext(connection) as queries:
+                started = time.perf_counter()
+                view(request, colony_id=colony.id)
+                elapsed = time.perf_counter() - started
+            samples[(name, 'ms')].append(elapsed * 1000)
+            samples[(name, 'queries')].append(len(queries))
+
+    @staticmethod
+    def group(samples):
+        grouped = defaultdict(dict)
+        for (name, metric), values in samples.items():
+            grouped[name][metric] = values
+        return grouped
+
+    @staticmethod
+    def rounded(summary):
+        return {key: round(value, 3) for key, value in summary.items()}
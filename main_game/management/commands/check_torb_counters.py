@@ -0,0 +1,36 @@
+import logging
+
+from django.core.management.base import BaseCommand
+
+from main_game.models import Colony
+
+logger = logging.getLogger('hereditus')
+
+class Command(BaseCommand):
+    help = "Compares each Colony's stored soldier/training counters with its Torb rows, --fix repairs any drift"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--fix', action='store_true', help="Repair drifted counters, otherwise they are only reported")
+        parser.add_argument('--game', type=int, help="Only check the colonies of this Game id")
+
+    def handle(self, *args, **options):
+        colonies = Colony.objects.all()
+        if options['game']:
+            colonies = colonies.filter(game_id=options['game'])
+
+        drifted = []
+        for colony in Colony.with_counted_torbs(colonies).order_by('id'):
+            if colony.soldier_count == colony.counted_soldiers and colony.training_count == colony.counted_training:
+                continue
+            self.stdout.write(
+                f"Colony {colony.id} '{colony.name}': soldiers {colony.soldier_count} -> {colony.counted_soldiers}, "
+                f"training {colony.training_count} -> {colony.counted_training}")
+            colony.soldier_count = colony.counted_soldiers
+            colony.training_count = colony.counted_training
+            drifted.append(colony)
+
+        if drifted and options['fix']:
+            Colony.objects.bulk_update(drifted, ['soldier_count', 'training_count'])
+            logger.warning(f"Repaired Torb counters of {len(drifted)} colonies")
+        verb = "Repaired" if options['fix'] else "Found"
+        self.stdout.write(self.style.SUCCESS(f"{verb} {len(drifted)} colonies with drifted counters"))
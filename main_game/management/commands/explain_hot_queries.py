@@ -0,0 +1,73 @@
+import logging
+
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.utils.timezone import now
+
+from main_game.benchmarks import analyze, seed_games, time_call
+from main_game.models import ArmyTorb, Colony, Game, StoryText, Torb
+
+logger = logging.getLogger('hereditus')
+
+INDEXED_MODELS = [Torb, Colony, StoryText, ArmyTorb, Game]
+
+class Command(BaseCommand):
+    help = ("Seeds benchmark Games and shows EXPLAIN plans and timings of the hot queries without and with "
+            "the Meta.indexes, everything is rolled back afterwards. Run it against a scratch database, "
+            "it holds table locks while it works")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--games', type=int, default=100, help="Number of Games to seed")
+        parser.add_argument('--colonies', type=int, default=4, help="Colonies per Game")
+        parser.add_argument('--torbs', type=int, default=50, help="Torbs per Colony")
+        parser.add_argument('--story-texts', type=int, default=200, help="StoryTexts per Colony")
+        parser.add_argument('--repeat', type=int, default=50, help="Runs per query, the median is reported")
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            games = seed_games(options['games'], options['colonies'], options['torbs'], options['story_texts'])
+            # A colony in the middle of the table, so the planner can't get lucky on the first rows
+            game = games[len(games) // 2]
+            colony = Colony.objects.select_related('army').filter(game=game).first()
+            army_torb = ArmyTorb.objects.filter(army=colony.army).first()
+            queries = [
+                ("Living grown Torbs", Torb.objects.filter(colony=colony, is_alive=True, growing=False)),
+                ("Growing Torbs", Torb.objects.filter(colony=colony, is_alive=True, growing=True)),
+                ("Living Torb count", Torb.objects.filter(colony=colony, is_alive=True).values('id')),
+                ("Soldiers", Torb.objects.filter(colony=colony, action='soldiering')),
+                ("Recent StoryTexts", StoryText.objects.filter(colony=colony).recent(game.round_number)),
+                ("StoryText page", StoryText.objects.filter(colony=colony).order_by('-id')[:51]),
+                ("Unready colonies", Colony.objects.filter(game=game, ready=False).values('id')),
+                ("ArmyTorb membership", ArmyTorb.objects.filter(army=colony.army, torb_id=army_torb and army_torb.torb_id)),
+                ("Overdue Games", Game.objects.past_deadline(now()).values('id', 'round_number')),
+            ]
+
+            self.execute_index_sql('remove_sql')
+            analyze()
+            before = self.measure(queries, options['repeat'])
+
+            self.execute_index_sql('create_sql')
+            analyze()
+            after = self.measure(queries, options['repeat'])
+
+            for (name, _), (plan_before, ms_before), (plan_after, ms_after) in zip(queries, before, after):
+                self.stdout.write(self.style.MIGRATE_HEADING(f"{name}: {ms_before:.3f}ms -> {ms_after:.3f}ms"))
+                self.stdout.write("  Without indexes:")
+                self.stdout.write("\n".join(f"    {line}" for line in plan_before.splitlines()))
+                self.stdout.write("  With indexes:")
+                self.stdout.write("\n".join(f"    {line}" for line in plan_after.splitlines()))
+            transaction.set_rollback(True)
+
+    @staticmethod
+    def execute_index_sql(statement):
+        # Plain SQL rather than schema_editor(), which SQLite refuses inside a transaction
+        schema_editor = connection.SchemaEditorClass(connection)
+        schema_editor.deferred_sql = []
+        with connection.cursor() as cursor:
+            for model in INDEXED_MODELS:
+                for index in model._meta.indexes:
+                    cursor.execute(str(getattr(index, statement)(model, schema_editor)))
+
+    @staticmethod
+    def measure(queries, repeat):
+        return [(queryset.explain(), time_call(lambda: list(queryset.all()), repeat)) for _, queryset in queries]
@@ -0,0 +1,59 @@
+import cProfile
+import io
+import json
+import pstats
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from main_game.models import Game, GameAction
+from main_game.simulation import SimGame, state_differences
+
+class Command(BaseCommand):
+    help = ("Rebuilds a Game in memory from its journal of orders and its seed and reports how long it took "
+            "and how the Game stands. With --check the result is compared with the database")
+
+    def add_arguments(self, parser):
+        parser.add_argument('game_id', type=int)
+        parser.add_argument('--round', type=int, help="Replay up to this round, defaults to the Game's current round")
+        parser.add_argument('--check', action='store_true', help="Compare the replayed Game with the saved one, needs the current round")
+        parser.add_argument('--profile', type=int, nargs='?', const=25, metavar='LINES',
+                            help="Run the replay under cProfile and print the slowest functions")
+
+    def handle(self, *args, **options):
+        try:
+            game = Game.objects.get(pk=options['game_id'])
+        except Game.DoesNotExist:
+            raise CommandError(f"Game {options['game_id']} does not exist")
+        until_round = options['round'] or game.round_number
+        if options['check'] and until_round != game.round_number:
+            raise CommandError(f"--check compares with the saved Game, which is at round {game.round_number}")
+        journal = GameAction.objects.filter(game=game)
+        if not journal.filter(action=GameAction.FOUND).exists():
+            raise CommandError(f"Game {game.pk} has no journal, it predates GameAction")
+
+        profiler = cProfile.Profile() if options['profile'] else None
+        started = time.perf_counter()
+        if profiler:
+            profiler.enable()
+        sim = SimGame.from_journal(game, until_round)
+        if profiler:
+            profiler.disable()
+        elapsed = time.perf_counter() - started
+
+        report = {
+            'game': game.pk,
+            'round': sim.round_number,
+            'actions': journal.filter(round_number__lte=until_round).count(),
+            'seconds': round(elapsed, 3),
+            **sim.summary(),
+        }
+        if options['check']:
+            report['differences'] = state_differences(SimGame.from_game(game).state(), sim.state())
+        self.stdout.write(json.dumps(report, indent=2))
+        if profiler:
+            stats = io.StringIO()
+            pstats.Stats(profiler, stream=stats).sort_stats('cumulative').print_stats(options['profile'])
+            self.stdout.write(stats.getvalue())
+        if report.get('differences'):
+            raise CommandError(f"The replay of Game {game.pk} differs from the saved Game")
@@ -0,0 +1,57 @@
+import logging
+import os
+import time
+from collections import Counter
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+from django.utils.timezone import now
+
+from main_game.models import RoundJob
+from main_game.models.round_job import STALE_AFTER
+from main_game.round_scheduler import RoundScheduler
+
+logger = logging.getLogger('hereditus')
+
+class Command(BaseCommand):
+    help = ("Queues a round for every Game whose colonies are all ready and resolves the queued rounds "
+            "of all Games in parallel on a pool of worker processes")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--processes', type=int, default=os.cpu_count(), help="Worker processes, defaults to one per core")
+        parser.add_argument('--once', action='store_true', help="Resolve the rounds that are due now and exit instead of polling")
+        parser.add_argument('--poll-interval', type=float, default=1.0, help="Seconds to sleep when no round is due")
+        parser.add_argument('--stale-after', type=int, default=int(STALE_AFTER.total_seconds()), help="Requeue jobs left running for this many seconds")
+
+    def handle(self, *args, **options):
+        requeued = RoundJob.requeue_stale(now() - timedelta(seconds=options['stale_after']))
+        if requeued:
+            logger.warning(f"Requeued {requeued} stale RoundJobs")
+        logger.info(f"Round scheduler started with {options['processes']} processes")
+
+        scheduler = RoundScheduler(options['processes'])
+        try:
+            while True:
+                close_old_connections()
+                scheduler.enqueue_due_games()
+                started = time.perf_counter()
+                statuses = Counter()
+                for result in scheduler.run_queued():
+                    if result['status'] is None:
+                        continue
+                    statuses[result['status']] += 1
+                    if result['status'] == RoundJob.FAILED:
+                        self.stderr.write(f"RoundJob {result['job']} failed: {result['error']}")
+                    else:
+                        self.stdout.write(f"Round {result['round_number']} of Game {result['game']} finished as {result['status']} in {result['seconds']:.2f}s")
+                if statuses:
+                    elapsed = time.perf_counter() - started
+                    summary = ", ".join(f"{count} {status}" for status, count in sorted(statuses.items()))
+                    self.stdout.write(f"Resolved {sum(statuses.values())} rounds in {elapsed:.2f}s ({summary})")
+                if options['once']:
+                    return
+                if not statuses:
+                    time.sleep(options['poll_interval'])
+        finally:
+            scheduler.close()
@@ -0,0 +1,29 @@
+import logging
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+from django.utils.timezone import now
+
+from main_game.round_scheduler import ready_overdue_games
+
+logger = logging.getLogger('hereditus')
+
+class Command(BaseCommand):
+    help = ("Readies the idle colonies of Games past their round deadline and queues those rounds for "
+            "run_round_worker or run_round_scheduler")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--once', action='store_true', help="Check the deadlines once and exit instead of ticking")
+        parser.add_argument('--interval', type=float, default=5.0, help="Seconds between deadline checks")
+
+    def handle(self, *args, **options):
+        logger.info("Round ticker started")
+        while True:
+            games = ready_overdue_games(now())
+            if games:
+                self.stdout.write(f"Queued {len(games)} overdue rounds")
+            if options['once']:
+                return
+            time.sleep(options['interval'])
+            close_old_connections()
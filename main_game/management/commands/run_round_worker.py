@@ -0,0 +1,38 @@
+import logging
+import time
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+from django.utils.timezone import now
+
+from main_game.models import RoundJob
+from main_game.models.round_job import STALE_AFTER
+
+logger = logging.getLogger('hereditus')
+
+class Command(BaseCommand):
+    help = "Resolves queued game rounds in the background so ready-up requests return immediately"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--once', action='store_true', help="Run every queued job and exit instead of polling")
+        parser.add_argument('--poll-interval', type=float, default=1.0, help="Seconds to sleep when the queue is empty")
+        parser.add_argument('--stale-after', type=int, default=int(STALE_AFTER.total_seconds()), help="Requeue jobs left running for this many seconds")
+
+    def handle(self, *args, **options):
+        requeued = RoundJob.requeue_stale(now() - timedelta(seconds=options['stale_after']))
+        if requeued:
+            logger.warning(f"Requeued {requeued} stale RoundJobs")
+        logger.info("Round worker started")
+
+        while True:
+            close_old_connections()
+            job = RoundJob.claim_next()
+            if job is None:
+                if options['once']:
+                    return
+                time.sleep(options['poll_interval'])
+                continue
+            started = time.perf_counter()
+            status = job.run()
+            self.stdout.write(f"Round {job.round_number} of Game '{job.game}' finished as {status} in {time.perf_counter() - started:.2f}s")
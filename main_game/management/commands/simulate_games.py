@@ -0,0 +1,86 @@
+import json
+import logging
+import random
+import statistics
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from main_game.benchmarks import seed_played_games
+from main_game.simulation import SimGame, check_equivalence
+
+logger = logging.getLogger('hereditus')
+
+class Command(BaseCommand):
+    help = ("Plays Games of random orders entirely in memory with the round rules and reports the rounds per "
+            "second and how the Games ended as JSON. With --check-equivalence rounds of saved Games are also "
+            "played through RoundEngine under the same seed and compared, inside a transaction that is rolled back")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--games', type=int, default=100, help="Number of Games to play")
+        parser.add_argument('--colonies', type=int, default=4, help="Colonies per Game")
+        parser.add_argument('--torbs', type=int, default=20, help="Starting Torbs per Colony")
+        parser.add_argument('--rounds', type=int, default=100, help="Rounds to play in every Game")
+        parser.add_argument('--seed', type=int, default=0, help="Seed for the orders, genes and every round, Game i plays with seed + i")
+        parser.add_argument('--check-equivalence', type=int, default=0, metavar='ROUNDS',
+                            help="Also play this many rounds of saved Games through the ORM and compare them")
+        parser.add_argument('--output', help="Write the JSON report to this file instead of stdout")
+
+    def handle(self, *args, **options):
+        summaries = []
+        stories = {}
+        started = time.perf_counter()
+        for game_index in range(options['games']):
+            rnd = random.Random(options['seed'] + game_index)
+            game = SimGame.new(options['colonies'], options['torbs'],
+                               first_colony_id=game_index * options['colonies'] + 1,
+                               seed=options['seed'] + game_index)
+            for _ in range(options['rounds']):
+                game.random_orders(rnd)
+                game.play_round()
+            summaries.append(game.summary())
+            for story_text_type, count in game.story_counts.items():
+                stories[story_text_type] = stories.get(story_text_type, 0) + count
+        elapsed = time.perf_counter() - started
+        rounds = options['games'] * options['rounds']
+
+        report = {
+            'config': {key: options[key] for key in ('games', 'colonies', 'torbs', 'rounds', 'seed')},
+            'seconds': round(elapsed, 3),
+            'rounds_per_second': round(rounds / elapsed, 1) if elapsed else None,
+            'games': {key: {'mean': round(statistics.mean(summary[key] for summary in summaries), 2),
+                            'max': max(summary[key] for summary in summaries)}
+                      for key in summaries[0]} if summaries else {},
+            'story_texts': dict(sorted(stories.items())),
+        }
+        if options['check_equivalence']:
+            report['equivalence'] = self.check_equivalence(options)
+
+        output = json.dumps(report, indent=2)
+        if options['output']:
+            with open(options['output'], 'w') as report_file:
+                report_file.write(output + "\n")
+            self.stdout.write(self.style.SUCCESS(f"Wrote simulation report to {options['output']}"))
+        else:
+            self.stdout.write(output)
+        if report.get('equivalence', {}).get('mismatched_rounds'):
+            raise CommandError("The simulation and RoundEngine disagree, see the equivalence report")
+
+    @staticmethod
+    def check_equivalence(options):
+        # Few Games, every round is played twice and read back from the database
+        mismatches = []
+        with transaction.atomic():
+            games = seed_played_games(min(options['games'], 3), options['colonies'], options['torbs'], seed=options['seed'])
+            for game in games:
+                for result in check_equivalence(game, options['check_equivalence'], seed=options['seed']):
+                    if result['differences']:
+                        logger.warning(f"Game {game.pk} round {result['round']} differs: {', '.join(result['differences'][:10])}")
+                        mismatches.append({'game': game.pk, **result})
+            transaction.set_rollback(True)
+        return {
+            'games': len(games),
+            'rounds': len(games) * options['check_equivalence'],
+            'mismatched_rounds': mismatches,
+        }
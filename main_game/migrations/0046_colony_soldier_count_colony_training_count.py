@@ -0,0 +1,35 @@
+# Generated by Django 5.1 on 2026-10-18 10:07
+
+from django.db import migrations, models
+
+
+def count_torbs(apps, schema_editor):
+    Colony = apps.get_model('main_game', 'Colony')
+    colonies = Colony.objects.annotate(
+        counted_soldiers=models.Count('torb', filter=models.Q(torb__is_alive=True, torb__action="soldiering")),
+        counted_training=models.Count('torb', filter=models.Q(torb__is_alive=True, torb__action="training")))
+    for colony in colonies:
+        colony.soldier_count = colony.counted_soldiers
+        colony.training_count = colony.counted_training
+    Colony.objects.bulk_update(colonies, ['soldier_count', 'training_count'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main_game', '0045_player_aiplayer_alter_colony_player'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='colony',
+            name='soldier_count',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='colony',
+            name='training_count',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.RunPython(count_torbs, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,31 @@
+# Generated by Django 5.1 on 2026-10-18 10:08
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main_game', '0046_colony_soldier_count_colony_training_count'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RoundJob',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('round_number', models.IntegerField()),
+                ('status', models.CharField(choices=[('queued', 'queued'), ('running', 'running'), ('done', 'done'), ('skipped', 'skipped'), ('failed', 'failed')], default='queued', max_length=16)),
+                ('created', models.DateTimeField(default=django.utils.timezone.now)),
+                ('started', models.DateTimeField(blank=True, null=True)),
+                ('finished', models.DateTimeField(blank=True, null=True)),
+                ('error', models.TextField(blank=True, default='')),
+                ('game', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='round_jobs', to='main_game.game')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('game', 'round_number'), name='unique_round_job')],
+            },
+        ),
+    ]
@@ -0,0 +1,41 @@
+# Generated by Django 5.1 on 2026-10-18 10:13
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main_game', '0047_roundjob'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='armytorb',
+            index=models.Index(fields=['army', 'torb'], name='army_torb_army_torb'),
+        ),
+        migrations.AddIndex(
+            model_name='colony',
+            index=models.Index(condition=models.Q(('ready', False)), fields=['game'], name='colony_game_unready'),
+        ),
+        migrations.AddIndex(
+            model_name='storytext',
+            index=models.Index(fields=['colony', 'game_round'], name='story_text_colony_round'),
+        ),
+        migrations.AddIndex(
+            model_name='storytext',
+            index=models.Index(fields=['colony', 'id'], name='story_text_colony_id'),
+        ),
+        migrations.AddIndex(
+            model_name='torb',
+            index=models.Index(fields=['colony', 'is_alive', 'growing'], name='torb_colony_alive_growing'),
+        ),
+        migrations.AddIndex(
+            model_name='torb',
+            index=models.Index(condition=models.Q(('is_alive', True)), fields=['colony'], name='torb_colony_living'),
+        ),
+        migrations.AddIndex(
+            model_name='torb',
+            index=models.Index(fields=['colony', 'action'], name='torb_colony_action'),
+        ),
+    ]
@@ -0,0 +1,34 @@
+# Generated by Django 5.1 on 2026-10-18 10:18
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main_game', '0048_hot_query_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RoundMetrics',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('round_number', models.IntegerField()),
+                ('created', models.DateTimeField(default=django.utils.timezone.now)),
+                ('colonies', models.IntegerField(default=0)),
+                ('torbs', models.IntegerField(default=0)),
+                ('total_ms', models.FloatField(default=0)),
+                ('queries', models.IntegerField(default=0)),
+                ('rows_written', models.IntegerField(default=0)),
+                ('phases', models.JSONField(default=dict)),
+                ('game', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='round_metrics', to='main_game.game')),
+            ],
+            options={
+                'verbose_name_plural': 'round metrics',
+                'constraints': [models.UniqueConstraint(fields=('game', 'round_number'), name='unique_round_metrics')],
+            },
+        ),
+    ]
@@ -0,0 +1,41 @@
+# Generated by Django 5.1 on 2026-10-18 10:23
+
+from django.db import migrations, models
+
+from main_game.models.torb_names import torb_names
+
+
+def start_sequences(apps, schema_editor):
+    # Existing names were picked at random, so new ones start at the first numbered pass
+    # past any suffix already in use
+    Colony = apps.get_model('main_game', 'Colony')
+    Torb = apps.get_model('main_game', 'Torb')
+    colonies = {colony.pk: colony for colony in Colony.objects.all()}
+    for colony_id, private_ID, name in Torb.objects.values_list('colony_id', 'private_ID', 'name').iterator():
+        colony = colonies[colony_id]
+        base_name, _, suffix = name.rpartition(" ")
+        passes = int(suffix) if base_name and suffix.isdigit() else 1
+        colony.next_private_ID = max(colony.next_private_ID, private_ID + 1)
+        colony.names_allocated = max(colony.names_allocated, passes * len(torb_names))
+    Colony.objects.bulk_update(list(colonies.values()), ['next_private_ID', 'names_allocated'], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main_game', '0049_roundmetrics'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='colony',
+            name='names_allocated',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='colony',
+            name='next_private_ID',
+            field=models.IntegerField(default=1),
+        ),
+        migrations.RunPython(start_sequences, migrations.RunPython.noop),
+    ]
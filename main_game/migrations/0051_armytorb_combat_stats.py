@@ -0,0 +1,35 @@
+# Generated by Django 5.1 on 2026-10-18 10:25
+
+from django.db import migrations, models
+
+
+def store_combat_stats(apps, schema_editor):
+    # Same formula as ArmyTorb.combat_stats, historical models don't have its methods
+    ArmyTorb = apps.get_model('main_game', 'ArmyTorb')
+    army_torbs = list(ArmyTorb.objects.only('active_alleles'))
+    for army_torb in army_torbs:
+        alleles = army_torb.active_alleles
+        army_torb.power = round((alleles['strength'] * alleles['agility'])**0.5, 2)
+        army_torb.resilience = round((alleles['vitality'] * alleles['sturdiness'])**0.5, 2)
+    ArmyTorb.objects.bulk_update(army_torbs, ['power', 'resilience'], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main_game', '0050_colony_torb_sequences'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='armytorb',
+            name='power',
+            field=models.FloatField(default=0),
+        ),
+        migrations.AddField(
+            model_name='armytorb',
+            name='resilience',
+            field=models.FloatField(default=0),
+        ),
+        migrations.RunPython(store_combat_stats, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,72 @@
+# Generated by Django 5.1 on 2026-10-18 11:02
+
+import numpy as np
+from django.db import migrations, models
+
+# Copies of main_game.rules at the time of this migration, later changes there must not change it
+GENOME_DTYPE = np.dtype('<f4')
+# Torbs of a Colony without a Game, or of a Game without an EvolutionEngine, get the default genes
+DEFAULT_GENE_LIST = ["vitality", "sturdiness", "agility", "strength"]
+
+
+def encode_genome(genes, gene_list):
+    return np.asarray([genes[gene] for gene in gene_list], dtype=GENOME_DTYPE).tobytes()
+
+
+def decode_genome(genome, num_genes):
+    return np.frombuffer(genome, dtype=GENOME_DTYPE).reshape(num_genes, -1)
+
+
+def gene_lists(apps):
+    EvolutionEngine = apps.get_model('main_game', 'EvolutionEngine')
+    return dict(EvolutionEngine.objects.values_list('game_id', 'gene_list'))
+
+
+def encode_genomes(apps, schema_editor):
+    # Genes missing from a Torb are stored as no alleles, uneven genes are cut to the shortest one
+    Torb = apps.get_model('main_game', 'Torb')
+    games = gene_lists(apps)
+    batch = []
+    for torb_id, game_id, genes in Torb.objects.values_list('id', 'colony__game_id', 'genes').iterator(chunk_size=2000):
+        gene_list = games.get(game_id) or DEFAULT_GENE_LIST
+        num_alleles = min((len(genes.get(gene, [])) for gene in gene_list), default=0)
+        genome = encode_genome({gene: genes.get(gene, [])[:num_alleles] for gene in gene_list}, gene_list)
+        batch.append(Torb(id=torb_id, genome=genome))
+        if len(batch) >= 2000:
+            Torb.objects.bulk_update(batch, ['genome'])
+            batch = []
+    Torb.objects.bulk_update(batch, ['genome'])
+
+
+def decode_genomes(apps, schema_editor):
+    Torb = apps.get_model('main_game', 'Torb')
+    games = gene_lists(apps)
+    batch = []
+    for torb_id, game_id, genome in Torb.objects.values_list('id', 'colony__game_id', 'genome').iterator(chunk_size=2000):
+        gene_list = games.get(game_id) or DEFAULT_GENE_LIST
+        alleles = decode_genome(bytes(genome), len(gene_list)).tolist()
+        batch.append(Torb(id=torb_id, genes=dict(zip(gene_list, alleles))))
+        if len(batch) >= 2000:
+            Torb.objects.bulk_update(batch, ['genes'])
+            batch = []
+    Torb.objects.bulk_update(batch, ['genes'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main_game', '0052_game_round_deadline'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='torb',
+            name='genome',
+            field=models.BinaryField(default=b''),
+        ),
+        migrations.RunPython(encode_genomes, decode_genomes),
+        migrations.RemoveField(
+            model_name='torb',
+            name='genes',
+        ),
+    ]
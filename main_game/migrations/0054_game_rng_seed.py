@@ -0,0 +1,29 @@
+# Generated by Django 5.1 on 2026-10-18 10:45
+
+import main_game.rng
+from django.db import migrations, models
+
+
+def seed_games(apps, schema_editor):
+    # AddField gives every existing row the same default, each Game needs its own streams
+    Game = apps.get_model('main_game', 'Game')
+    games = list(Game.objects.only('id'))
+    for game in games:
+        game.rng_seed = main_game.rng.new_seed()
+    Game.objects.bulk_update(games, ['rng_seed'], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main_game', '0053_torb_genome'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='game',
+            name='rng_seed',
+            field=models.BigIntegerField(default=main_game.rng.new_seed),
+        ),
+        migrations.RunPython(seed_games, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 5.1 on 2026-10-18 10:49
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main_game', '0054_game_rng_seed'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='GameAction',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('round_number', models.IntegerField()),
+                ('action', models.CharField(choices=[('found', 'found'), ('breed', 'breed'), ('gather', 'gather'), ('enlist', 'enlist'), ('scout', 'scout'), ('attack', 'attack'), ('end_turn', 'end_turn')], max_length=16)),
+                ('torbs', models.JSONField(blank=True, default=list)),
+                ('target', models.IntegerField(blank=True, null=True)),
+                ('created', models.DateTimeField(default=django.utils.timezone.now)),
+                ('colony', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='actions', to='main_game.colony')),
+                ('game', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='actions', to='main_game.game')),
+            ],
+        ),
+    ]
@@ -0,0 +1,58 @@
+# Generated by Django 5.1 on 2026-10-18 11:02
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+from django.db.models import OuterRef, Subquery
+
+
+def date_deaths(apps, schema_editor):
+    # When Torbs died was never recorded, the dead so far count as dying in their Game's current round
+    Colony = apps.get_model('main_game', 'Colony')
+    Torb = apps.get_model('main_game', 'Torb')
+    Torb.objects.filter(is_alive=False, died_round__isnull=True).update(
+        died_round=Subquery(Colony.objects.filter(pk=OuterRef('colony_id')).values('game__round_number')[:1]))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main_game', '0055_game_action'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TorbArchive',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('torb_id', models.BigIntegerField()),
+                ('private_ID', models.IntegerField()),
+                ('name', models.CharField(max_length=16)),
+                ('generation', models.IntegerField()),
+                ('genome', models.BinaryField()),
+                ('max_hp', models.IntegerField()),
+                ('trained', models.BooleanField()),
+                ('died_round', models.IntegerField(blank=True, null=True)),
+                ('archived', models.DateTimeField(default=django.utils.timezone.now)),
+            ],
+        ),
+        migrations.AddField(
+            model_name='torb',
+            name='died_round',
+            field=models.IntegerField(blank=True, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='torb',
+            index=models.Index(condition=models.Q(('is_alive', False)), fields=['colony', 'died_round'], name='torb_colony_dead'),
+        ),
+        migrations.AddField(
+            model_name='torbarchive',
+            name='colony',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='archived_torbs', to='main_game.colony'),
+        ),
+        migrations.AddIndex(
+            model_name='torbarchive',
+            index=models.Index(fields=['colony', 'private_ID'], name='torb_archive_colony_torb'),
+        ),
+        migrations.RunPython(date_deaths, migrations.RunPython.noop),
+    ]
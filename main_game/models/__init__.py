@@ -4,4 +4,8 @@ from .game import Game
 from .story_text import StoryText
 from .torb import Torb
 from .army import Army, ArmyTorb
-from .player import Player
\ No newline at end of file
+from .player import AIPlayer, Player
+from .round_job import RoundJob
+from .round_metrics import RoundMetrics
+from .game_action import GameAction
+from .torb_archive import TorbArchive
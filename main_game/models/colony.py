@@ -1,13 +1,14 @@
 import logging
-import random
 
 from django.contrib.auth.models import User
-from django.db import models
+from django.db import models, transaction
+from django.db.models import F
 from django.db.models.functions import Now
 
 from .game import Game
+from .. import cache
 from .story_text import StoryText
-from .torb_names import torb_names
+from ..rules import torb_name
 
 logger = logging.getLogger('hereditus')
 
@@ -23,6 +24,18 @@ class Colony(models.Model):
     gather_rate = models.FloatField(default=1.7)
     discovered_colonies = models.ManyToManyField('self', symmetrical=False, related_name='discoverers', blank=True)
     army = models.OneToOneField('main_game.Army', on_delete=models.SET_NULL, null=True, blank=True, related_name='colony_army')
+    # Kept up to date by Torb.set_action, Battle.commit and RoundEngine, check with manage.py check_torb_counters
+    soldier_count = models.IntegerField(default=0)
+    training_count = models.IntegerField(default=0)
+    # Sequences for new Torbs, advanced by reserve_torb_identities and RoundEngine
+    next_private_ID = models.IntegerField(default=1)
+    names_allocated = models.IntegerField(default=0)
+    
+    class Meta:
+        indexes = [
+            # Game.unready_colonies runs on every ready-up
+            models.Index(fields=['game'], condition=models.Q(ready=False), name='colony_game_unready'),
+        ]
     
     @property
     def torb_count(self):
@@ -30,162 +43,124 @@ class Colony(models.Model):
     
     @property
     def num_soldiers(self):
-        return len([torb for torb in self.torb_set.all() if torb.action == "soldiering" and torb.is_alive])
+        return self.soldier_count
     
     @property
     def num_training(self):
-        return len([torb for torb in self.torb_set.all() if torb.action == "training" and torb.is_alive])
+        return self.training_count
     
-    def new_round(self, round_number: int):
-        self.reset_fertility()
-        self.gather_phase()
-        self.grow_torbs()
-        self.call_breed_torbs()
-        self.rest_torbs()
-        self.army.new_round()
-        self.colony_meal()
-        #self.scout_target = None # Moved to army
-        self.save()
-        StoryText.objects.create(
-            colony=self,
-            story_text_type="system",
-            story_text=f"It is now year {round_number+1}.",
-            timestamp=Now())
-                
-    def reset_fertility(self):
-        for torb in self.torb_set.filter(is_alive=True, growing=False):
-            torb.fertile = True
-            torb.save()
-            
-    def grow_torbs(self):
-        growing_torbs = self.torb_set.filter(growing=True)
-        for torb in growing_torbs:
-            torb.growing = False
-            torb.set_action("gathering", "🌾 Gathering")
-            torb.save()
+    @classmethod
+    def lock(cls, colony_id):
+        # Rounds lock their Colony rows before they read any Torb, orders take the same lock before they
+        # read or write theirs. An order placed during a round then waits for it and works on what it wrote.
+        list(cls.objects.select_for_update().filter(pk=colony_id).values_list('pk', flat=True))
+    
+    @classmethod
+    def with_counted_torbs(cls, colonies=None):
+        colonies = colonies if colonies is not None else cls.objects.all()
+        return colonies.annotate(
+            counted_soldiers=models.Count('torb', filter=models.Q(torb__is_alive=True, torb__action="soldiering")),
+            counted_training=models.Count('torb', filter=models.Q(torb__is_alive=True, torb__action="training")))
     
-    def call_breed_torbs(self):
-        checked_torbs = []
-        for torb in self.torb_set.all():
-            if torb.action == "breeding" and torb not in checked_torbs:
-                checked_torbs.append(torb)
-                checked_torbs.append(torb.context_torb)
-                torb1 = torb.context_torb
-                new_torb = self.game.evolution_engine_instance.breed_torbs(colony=self, torb0=torb, torb1=torb.context_torb)
-                if new_torb:
-                    StoryText.objects.create(
-                        colony=self,
-                        story_text_type="breeding",
-                        story_text=f"A new Torb, '{new_torb.name}', was born",
-                        timestamp=Now())
-                torb.set_action("gathering", "🌾 Gathering")
-                torb1.set_action("gathering", "🌾 Gathering")
-        
     def set_breed_torbs(self, torbs):
         from .torb import Torb
-        self.discovered_colonies.add(self)
-        torb0 = Torb.objects.get(id=torbs[0])
-        torb1 = Torb.objects.get(id=torbs[1])
-        
-        torb0.set_action("breeding", f"💦 Breeding with {torb1.name}", torb1)
-        torb1.set_action("breeding", f"💦 Breeding with {torb0.name}", torb0)
+        with transaction.atomic():
+            Colony.lock(self.pk)
+            self.discovered_colonies.add(self)
+            try:
+                torb0 = Torb.objects.get(id=torbs[0], colony=self, is_alive=True)
+                torb1 = Torb.objects.get(id=torbs[1], colony=self, is_alive=True)
+            except Torb.DoesNotExist:
+                raise ValueError("Only two living Torbs of the colony can breed")
+            
+            torb0.set_action("breeding", f"💦 Breeding with {torb1.name}", torb1)
+            # Read again, torb0 may have just released it from an earlier pairing
+            torb1.refresh_from_db()
+            torb1.set_action("breeding", f"💦 Breeding with {torb0.name}", torb0)
 
     def assign_torbs_action(self, torb_ids, action, description):
         from .torb import Torb
-        torbs = Torb.objects.filter(id__in=torb_ids, colony=self)
-        for torb in torbs:
-            torb.set_action(action, description)
+        with transaction.atomic():
+            Colony.lock(self.pk)
+            for torb in Torb.objects.filter(id__in=torb_ids, colony=self, is_alive=True):
+                torb.set_action(action, description)
 
-    def rest_torbs(self):
-        for torb in self.torb_set.all():
-            if torb.action == "resting" and not torb.starving:
-                adjust_amount = round(self.rest_heal_flat + self.rest_heal_perc & torb.max_hp)
-                torb.adjust_hp(adjust_amount, context="resting")
-    
-    def reset_torbs_actions(self, action: str):
-        for torb in self.torb_set.all():
-            torb.set_action("gathering", "🌾 Gathering")
-    
-    def gather_phase(self):
-        num_gathering = 0
-        for torb in self.torb_set.all():
-            if torb.action == "gathering":
-                num_gathering += 1
-        food_gathered = round(num_gathering * self.gather_rate)
-        self.adjust_food(food_gathered)
-        StoryText.objects.create(
-            colony=self,
-            story_text_type="food",
-            story_text=f"Your Torbs gathered {food_gathered} food.",
-            timestamp=Now())
-    
     def adjust_food(self, adjust_amount):
         adjust_amount = int(adjust_amount)
         self.food = max(self.food + adjust_amount, 0)
-        self.save()
-    
-    def colony_meal(self):
-        living_torbs = [torb for torb in self.torb_set.all() if torb.is_alive]
-        starved_torbs = []
-        
-        if self.food < len(living_torbs):
-            starved_torbs = random.sample(living_torbs, len(living_torbs) - self.food)
-            for torb in starved_torbs:
-                torb.starving = True
-                torb.adjust_hp(-1, context="starvation")
-        less_food = 0
-        for torb in living_torbs:
-            if torb not in starved_torbs:
-                food_meal_amount = 1
-                torb.starving = False
-                torb.adjust_hp(1)
-                torb.save()
-                less_food += food_meal_amount
-        self.adjust_food(-1 * less_food)
-        StoryText.objects.create(
-            colony=self,
-            story_text_type="food",
-            story_text=f"Your Torbs ate {less_food} food and {len(starved_torbs)} went hungry.",
-            timestamp=Now())
+        self.save(update_fields=['food'])
     
     def ready_up(self):
         self.ready = True
-        self.save()
+        self.save(update_fields=['ready'])
         logger.info(f"Colony '{self.name}' readied up")
         self.game.check_ready_status()
     
     def new_torb(self, genes, generation):
-        from .torb import Torb
-        next_ID = Torb.objects.filter(colony=self).aggregate(max_id=models.Max('private_ID'))['max_id']
-        next_ID = next_ID + 1 if next_ID is not None else 1
-        
-        used_names = set(Torb.objects.filter(colony=self).values_list('name', flat=True))
-        available_names = [name for name in torb_names if name not in used_names]
-        
-        if available_names:
-            name = random.choice(available_names)
-        else:
-            base_name = random.choice(torb_names)
-            counter = 2
-            name = base_name
-            while name in used_names:
-                name = f"{base_name} {counter}"
-                counter += 1
+        from .torb import Torb, encode_genome
+        [(private_ID, name)] = self.reserve_torb_identities(1)
         
         max_hp = genes['vitality'][0]
         torb = Torb.objects.create(
             colony=self,
-            private_ID=next_ID,
+            private_ID=private_ID,
             name=name,
-            genes=genes,
+            genome=encode_genome(genes, cache.evolution_engine(self.game_id).gene_list),
             generation=generation,
             max_hp=max_hp,
             hp=max_hp)
         return torb
         
+    def new_torbs(self, genomes, generations, **torb_fields):
+        from .torb import Torb, encode_genome
+        identities = self.reserve_torb_identities(len(genomes))
+        gene_list = cache.evolution_engine(self.game_id).gene_list
+        
+        torbs = []
+        for genes, generation, (private_ID, name) in zip(genomes, generations, identities):
+            max_hp = int(genes['vitality'][0])
+            torbs.append(Torb(
+                colony=self,
+                private_ID=private_ID,
+                name=name,
+                genome=encode_genome(genes, gene_list),
+                generation=generation,
+                max_hp=max_hp,
+                hp=max_hp,
+                **torb_fields))
+        return Torb.objects.bulk_create(torbs)
+    
+    def reserve_torb_identities(self, count):
+        """Reserves private_IDs and names for count new Torbs as (private_ID, name) pairs.
+
+        Both sequences are advanced with one UPDATE, which holds the Colony row until the
+        transaction ends, so concurrent births always get separate ranges.
+        """
+        if count == 0:
+            return []
+        with transaction.atomic():
+            Colony.objects.filter(pk=self.pk).update(
+                next_private_ID=F('next_private_ID') + count,
+                names_allocated=F('names_allocated') + count)
+            self.next_private_ID, self.names_allocated = Colony.objects.values_list('next_private_ID', 'names_allocated').get(pk=self.pk)
+        first_ID = self.next_private_ID - count
+        first_name = self.names_allocated - count
+        return [(first_ID + i, self.torb_name(first_name + i)) for i in range(count)]
+    
+    def take_torb_identity(self):
+        # For callers that hold the Colony row and save its sequences themselves, see RoundEngine.load
+        private_ID, name = self.next_private_ID, self.torb_name(self.names_allocated)
+        self.next_private_ID += 1
+        self.names_allocated += 1
+        return private_ID, name
+    
+    def torb_name(self, position):
+        return torb_name(self.pk, position)
+    
     def init_torbs(self):
+        rnd = self.game.founding_random(self.pk)
         for _ in range(self.game.starting_torbs):
-            self.game.evolution_engine_instance.protogenesis_torb(colony=self)
+            cache.evolution_engine(self.game_id).protogenesis_torb(colony=self, rnd=rnd)
 
     def save(self, *args, **kwargs):
         is_new = self.pk is None
@@ -193,6 +168,11 @@ class Colony(models.Model):
         
         if is_new:
             logger.info(f"A new colony '{self.name}' was made")
+            if self.game_id:
+                from .game_action import GameAction
+                GameAction.journal_entry(self, GameAction.FOUND).save()
+            # Ids can be reused after a rollback on some databases
+            cache.invalidate(cache.COLONY_GAME, self.pk)
             self.init_torbs()
             self.discovered_colonies.add(self)
             StoryText.objects.create(
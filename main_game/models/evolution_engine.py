@@ -2,6 +2,7 @@ from django.db import models
 import logging
 import random
 from .game import Game
+from .. import cache, rules
 import numpy as np
 
 logger = logging.getLogger('hereditus')
@@ -25,74 +26,51 @@ class EvolutionEngine(models.Model):
     def save(self, *args, **kwargs):
         is_new = self.pk is None
         super().save(*args, **kwargs)
+        cache.invalidate(cache.ENGINE, self.game_id)
         if is_new:
             logger.info(f"A new EvolutionEngine '{self.pk}' was made for Game {self.game}")
     
+    def delete(self, *args, **kwargs):
+        cache.invalidate(cache.ENGINE, self.game_id)
+        return super().delete(*args, **kwargs)
+    
     def check_torb_breedable(self, torb):
         if not torb.fertile:
             return False
         return True
     
-    def protogenesis_torb(self, colony):
-        genes = {}
-        for gene in self.gene_list:
-            alleles = []
-            for i in range(self.alleles_per_gene):
-                alleles.append(random.randrange(self.random_gene_min, self.random_gene_max))
-            genes[gene] = alleles
-        torb = self.new_torb(generation=0, colony=colony, genes=genes)
+    def protogenesis_torb(self, colony, rnd=random):
+        torb = self.new_torb(generation=0, colony=colony, genes=rules.protogenesis_genes(self, rnd))
         
     def __str__(self):
         return f"EvolutionEngine{self.pk} for Game '{self.game.description}'"
     
     def breed_torbs(self, colony, torb0, torb1):
-        if not self.check_torb_breedable(torb0) or not self.check_torb_breedable(torb1):
-            logger.debug(f"An EvolutionEngine for Colony {colony} in {self.game} tried to breed Torb {torb0.private_ID} '{torb0.name}' and Torb {torb1.private_ID} '{torb1.name}' but one/both weren't breedable")
-            return False
-        genes = {}
-        generation = max(torb0.generation, torb1.generation) + 1
-        for gene in self.gene_list:
-            alleles = []
-            p0_gene = torb0.genes[gene]
-            p1_gene = torb1.genes[gene]
-            random.shuffle(p0_gene)
-            random.shuffle(p1_gene)
-            num_alleles = min(len(p0_gene), len(p1_gene))
-            
-            for i in range(num_alleles):
-                # The first allele is a randomly chosen one from the parents
-                # subsequent alleles are avg of random alleles from each parent, non-replacing
-                if i == 0:
-                    alleles.append(max(random.choice([p0_gene[i], p1_gene[i]]),1))
-                else:
-                    alleles.append(max(round(np.mean([p0_gene[i], p1_gene[i]]),4),1))
-            alleles = self.mutate_and_shuffle(alleles)
-            genes[gene] = alleles
-        logger.debug(f"An EvolutionEngine for Colony {colony} in {self.game} is breeding Torb {torb0.private_ID} '{torb0.name}' and Torb {torb1.private_ID} '{torb1.name}'")
-        baby_torb = self.new_torb(generation=generation, colony=colony, genes=genes)
-        baby_torb.growing = True
-        
-        torb0.fertile = torb1.fertile = baby_torb.fertile = False
-        torb0.save()
-        torb1.save()
-        baby_torb.set_action("growing", "Growing")
-        #baby_torb.save()
-        return baby_torb
+        baby_torbs = self.breed_pairs(colony, [(torb0, torb1)])
+        return baby_torbs[0] if baby_torbs else False
+    
+    def breed_pairs(self, colony, pairs, rng=None):
+        from .torb import Torb
+        breedable_pairs = self.claim_breedable_pairs(colony, pairs)
+        if not breedable_pairs:
+            return []
+        genomes = self.breed_genomes(breedable_pairs, rng=rng)
+        generations = [max(torb0.generation, torb1.generation) + 1 for torb0, torb1 in breedable_pairs]
+        baby_torbs = colony.new_torbs(genomes, generations, growing=True, fertile=False, action="growing", action_desc="🍼 Growing")
+        Torb.objects.bulk_update([torb for pair in breedable_pairs for torb in pair], ['fertile'])
+        if logger.isEnabledFor(logging.DEBUG):
+            for baby_torb in baby_torbs:
+                logger.debug("An EvolutionEngine for Colony %s in %s created new Torb %s '%s' with Genes %s", colony, self.game, baby_torb.private_ID, baby_torb.name, baby_torb.genes)
+        return baby_torbs
+    
+    def claim_breedable_pairs(self, colony, pairs):
+        return rules.claim_breedable_pairs(pairs, colony.name)
+    
+    def breed_genomes(self, pairs, rng=None):
+        return rules.breed_genomes(self, pairs, rng if rng is not None else np.random.default_rng())
     
-    def mutate_and_shuffle(self, alleles):
-        out_alleles = []
-        for allele in alleles:
-            die_roll = random.uniform(0, 1)
-            if die_roll >= 1 - self.mutation_chance:
-                allele_hist = allele # To be used in logging: allele mutated from hist to X
-                mutation_amount = np.random.normal(0, self.mutation_dev)
-                allele = round(allele * (1 + mutation_amount), 4)
-            out_alleles.append(allele)
-        random.shuffle(out_alleles)
-        return out_alleles
-                
-                    
     def new_torb(self, generation, colony, genes):
         torb = colony.new_torb(generation=generation, genes=genes)
-        logger.debug(f"An EvolutionEngine for Colony {colony} in {self.game} created new Torb {torb.private_ID} '{torb.name}' with Genes {genes}")
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug("An EvolutionEngine for Colony %s in %s created new Torb %s '%s' with Genes %s", colony, self.game, torb.private_ID, torb.name, genes)
         return torb
\ No newline at end of file
@@ -1,10 +1,24 @@
 import logging
 
+from django.conf import settings
 from django.contrib.auth.models import User
-from django.db import models
+from django.db import models, transaction
+from django.utils.timezone import now
+
+from .. import cache, rng
 
 logger = logging.getLogger('hereditus')
 
+class GameQuerySet(models.QuerySet):
+    def ready_for_round(self):
+        # Games with at least one colony and none left to ready up. AI colonies are always ready,
+        # Games of only AI colonies wait for their deadline instead of resolving round after round
+        return (self.filter(colony__isnull=False).exclude(colony__ready=False)
+                .filter(colony__player__aiplayer__isnull=True).distinct())
+    
+    def past_deadline(self, moment):
+        return self.filter(round_deadline__lte=moment)
+
 class Game(models.Model):
     starting_torbs = models.IntegerField(default=4)
     description = models.CharField(max_length=256, null=True)
@@ -13,41 +27,94 @@ class Game(models.Model):
     allowed_players = models.ManyToManyField(User, blank=True)
     closed = models.BooleanField(default=False)
     max_colonies_per_player = models.IntegerField(default=1)
+    # Optional time limit per round, idle colonies are readied once round_deadline passes, see run_round_ticker
+    round_length = models.DurationField(null=True, blank=True)
+    round_deadline = models.DateTimeField(null=True, blank=True)
+    # Every round draws from streams keyed by this seed and its number, see rng.round_streams
+    rng_seed = models.BigIntegerField(default=rng.new_seed)
+
+    objects = GameQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            # run_round_ticker looks for overdue Games every few seconds, most Games have no deadline
+            models.Index(fields=['round_deadline'], condition=models.Q(round_deadline__isnull=False), name='game_round_deadline'),
+        ]
     
     def __str__(self):
         return self.description
     
     def save(self, *args, **kwargs):
         is_new = self.pk is None
+        if self.round_length is None:
+            self.round_deadline = None
+        elif self.round_deadline is None:
+            self.round_deadline = self.next_round_deadline()
         super().save(*args, **kwargs)
+        self.invalidate_round_cache()
         if is_new:
             logger.info(f"A new Game '{self.description}' was made")
             from .evolution_engine import EvolutionEngine
             EvolutionEngine.objects.create(game=self)
             
+    def invalidate_round_cache(self):
+        # Again on commit, a reader may have cached the old round number in the meantime
+        cache.invalidate(cache.ROUND, self.pk)
+        transaction.on_commit(lambda: cache.invalidate(cache.ROUND, self.pk))
+    
+    @classmethod
+    def colony_round(cls, colony_id):
+        # From the database for rows about to be written, cache.colony_round may not have heard of
+        # a round resolved by another process yet. None for a Colony without a Game.
+        return cls.objects.filter(colony=colony_id).values_list('round_number', flat=True).first()
+    
+    def round_streams(self, round_number=None):
+        return rng.round_streams(self.rng_seed, self.round_number if round_number is None else round_number)
+    
+    def founding_random(self, colony_id):
+        return rng.founding_random(self.rng_seed, colony_id)
+    
+    def next_round_deadline(self):
+        return now() + self.round_length if self.round_length is not None else None
+    
     @property
     def unready_colonies(self):
         return self.colony_set.filter(ready=False).count()
     
     def next_round(self):
-        
-        # have whatever calls this by default check if all colonies are ready
-        # do combat here
-        
-        for colony in self.colony_set.all().order_by('?'):
-            colony.new_round(round_number = self.round_number)
-            
-        # Done in a separate loop because web GUIs are updated when ready value is updated
-        for colony in self.colony_set.all():
-            colony.ready = False
-            colony.save()
-        self.round_number += 1
-        self.save()
-        logger.debug(f"Next round processed successfully")
+        # All colonies are resolved in memory and written back in bulk, see RoundEngine.
+        # AI colonies give their orders last, once the round is claimed, see ai.take_turns
+        from ..round_engine import RoundEngine
+        round_engine = RoundEngine(self)
+        if not round_engine.run():
+            return None
+        archive_after = settings.TORB_ARCHIVE_AFTER_ROUNDS
+        if archive_after and self.round_number % archive_after == 0:
+            from .torb_archive import TorbArchive
+            TorbArchive.archive_dead_torbs(self)
+        self.publish_event('round', {'round_number': self.round_number})
+        self.publish_event('unready', {'unready': len(round_engine.colonies) - len(round_engine.ai_colonies)})
+        logger.debug("Next round processed successfully")
+        return round_engine
+    
+    def publish_event(self, event, data):
+        # Pushed to the game's open pages once the change is committed, see events.GameEventBroker
+        from ..events import game_events
+        transaction.on_commit(lambda: game_events.publish(self.id, event, data))
     
     def check_ready_status(self):
-        logger.debug(f"Checking colonies ready statuses")
-        if self.colony_set.filter(ready=False).count() >= 1:
+        logger.debug("Checking colonies ready statuses")
+        # The round the colonies readied for, this instance may predate the last round
+        self.refresh_from_db(fields=['round_number'])
+        unready_colonies = self.colony_set.filter(ready=False).count()
+        self.publish_event('unready', {'unready': unready_colonies})
+        if unready_colonies >= 1:
             return False
-        logger.debug(f"All colonies are ready for the next round")
-        self.next_round()
\ No newline at end of file
+        logger.debug("All colonies are ready for the next round")
+        if settings.ASYNC_ROUNDS:
+            # Resolved by 'manage.py run_round_worker', the colonies are un-readied once the round is done
+            from .round_job import RoundJob
+            RoundJob.enqueue(self)
+        else:
+            self.next_round()
+        return True
\ No newline at end of file
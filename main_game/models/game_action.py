@@ -0,0 +1,69 @@
+import logging
+
+from django.db import models
+from django.utils.timezone import now
+
+logger = logging.getLogger('hereditus')
+
+class GameAction(models.Model):
+    """One entry of a Game's append-only journal of accepted orders.
+
+    Player.perform_action appends every order that went through and Colony.save appends a
+    'found' entry for every new Colony. Torbs are journaled by their private_ID, which a
+    replay reproduces, target is a Colony id. Together with the Game's rng_seed the journal
+    rebuilds the Game, see SimGame.from_journal and the replay_game command.
+    """
+
+    FOUND = 'found'
+    BREED = 'breed'
+    GATHER = 'gather'
+    ENLIST = 'enlist'
+    SCOUT = 'scout'
+    ATTACK = 'attack'
+    END_TURN = 'end_turn'
+
+    ACTION_OPTIONS = [
+        (FOUND, 'found'),
+        (BREED, 'breed'),
+        (GATHER, 'gather'),
+        (ENLIST, 'enlist'),
+        (SCOUT, 'scout'),
+        (ATTACK, 'attack'),
+        (END_TURN, 'end_turn'),
+    ]
+
+    game = models.ForeignKey('main_game.Game', on_delete=models.CASCADE, related_name='actions')
+    round_number = models.IntegerField()
+    colony = models.ForeignKey('main_game.Colony', on_delete=models.CASCADE, related_name='actions')
+    action = models.CharField(max_length=16, choices=ACTION_OPTIONS)
+    torbs = models.JSONField(default=list, blank=True)
+    target = models.IntegerField(null=True, blank=True)
+    created = models.DateTimeField(default=now)
+
+    def __str__(self):
+        return f"GameAction {self.action} by Colony {self.colony_id} in Game {self.game_id} round {self.round_number}"
+
+    def save(self, *args, **kwargs):
+        if self.pk is not None:
+            raise ValueError("The Game journal is append-only")
+        super().save(*args, **kwargs)
+
+    @classmethod
+    def journal_entry(cls, colony, action, torb_ids=(), target_colony_id=None, round_number=None):
+        # Unsaved, built before the order runs: ending a turn may resolve the round it belongs to.
+        # The round is read from the database unless given, a cached one could file the order under a finished round
+        from .game import Game
+        from .torb import Torb
+        if round_number is None:
+            round_number = Game.objects.filter(pk=colony.game_id).values_list('round_number', flat=True).get()
+        torbs = []
+        if torb_ids:
+            private_IDs = {str(pk): private_ID for pk, private_ID in Torb.objects.filter(pk__in=torb_ids, colony=colony).values_list('pk', 'private_ID')}
+            torbs = [private_IDs[str(torb_id)] for torb_id in torb_ids if str(torb_id) in private_IDs]
+        return cls(
+            game_id=colony.game_id,
+            round_number=round_number,
+            colony=colony,
+            action=action,
+            torbs=torbs,
+            target=int(target_colony_id) if target_colony_id else None)
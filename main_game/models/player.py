@@ -2,6 +2,8 @@ import logging
 from django.db import models
 from django.contrib.auth.models import User
 
+from .game_action import GameAction
+from .story_text import StoryText
 from .torb import Torb
 
 logger = logging.getLogger('hereditus')
@@ -22,10 +24,18 @@ class Player(models.Model):
     def get_colonies(self):
         return self.colony_set.all()
     
-    def perform_action(self, colony, action, **kwargs):
+    def perform_action(self, colony, action, round_number=None, **kwargs):
+        # round_number files the order under a round other than the Game's current one, see ai.take_turns
         if colony.player != self:
             logger.warning(f"Player {self} attempted to perform action on colony {colony} which they do not own.")
         
+        journal_entry = GameAction.journal_entry(colony, action, kwargs.get('torb_ids'), kwargs.get('target_colony_id'), round_number)
+        # An order's log lines are written together, the round itself buffers its own
+        with StoryText.buffered():
+            self._perform_action(colony, action, **kwargs)
+        journal_entry.save()
+    
+    def _perform_action(self, colony, action, **kwargs):
         if action == 'breed':
             colony.set_breed_torbs(kwargs.get('torb_ids'))
         elif action == 'gather':
@@ -57,7 +67,21 @@ class Player(models.Model):
         return f"Player {self.name}"
     
 class AIPlayer(Player):
+    # 1 to 10, lower difficulties choose Torbs and targets less carefully, see ai.plan_turns
     difficulty = models.IntegerField(default=10)
     
+    @classmethod
+    def found_colony(cls, game, name, difficulty=10):
+        from .. import ai
+        from .colony import Colony
+        player = cls.objects.create(name=name, difficulty=difficulty)
+        colony = Colony.objects.create(name=name, game=game, player=player)
+        game.refresh_from_db(fields=['round_number'])
+        ai.ready_colonies(game, [colony])
+        return colony
+    
     def ai_logic(self):
-        pass
\ No newline at end of file
+        # This AI's orders on their own, Game.next_round plays all AI colonies of a Game at once
+        from .. import ai
+        [colony] = ai.ai_colonies(self.colony.game, pk=self.colony.pk)
+        ai.issue_orders(colony, ai.plan_turns(colony.game, [colony])[colony.pk])
\ No newline at end of file
@@ -0,0 +1,117 @@
+import logging
+from datetime import timedelta
+
+from django.db import models, transaction
+from django.utils.timezone import now
+
+logger = logging.getLogger('hereditus')
+
+# A job left running this long belongs to a worker that died, see requeue_stale
+STALE_AFTER = timedelta(minutes=10)
+# A failed round is tried again when it is queued again, but no more often than this
+RETRY_FAILED_AFTER = timedelta(seconds=30)
+
+class RoundJob(models.Model):
+    
+    QUEUED = 'queued'
+    RUNNING = 'running'
+    DONE = 'done'
+    SKIPPED = 'skipped'
+    FAILED = 'failed'
+    
+    STATUS_OPTIONS = [
+        (QUEUED, 'queued'),
+        (RUNNING, 'running'),
+        (DONE, 'done'),
+        (SKIPPED, 'skipped'),
+        (FAILED, 'failed'),
+    ]
+    
+    game = models.ForeignKey('main_game.Game', on_delete=models.CASCADE, related_name='round_jobs')
+    round_number = models.IntegerField()
+    status = models.CharField(max_length=16, choices=STATUS_OPTIONS, default=QUEUED)
+    created = models.DateTimeField(default=now)
+    started = models.DateTimeField(null=True, blank=True)
+    finished = models.DateTimeField(null=True, blank=True)
+    error = models.TextField(blank=True, default="")
+    
+    class Meta:
+        constraints = [
+            # A round can only ever be queued once, this is what stops it from running twice
+            models.UniqueConstraint(fields=['game', 'round_number'], name='unique_round_job'),
+        ]
+    
+    def __str__(self):
+        return f"RoundJob for Game '{self.game}' round {self.round_number} ({self.status})"
+    
+    @classmethod
+    def enqueue(cls, game):
+        job, created = cls.objects.get_or_create(game=game, round_number=game.round_number)
+        if created:
+            logger.info(f"Queued round {job.round_number} of Game '{game}'")
+        elif job.status in (cls.FAILED, cls.RUNNING) and cls.objects.filter(cls.retryable(now()), pk=job.pk).update(**cls.requeued()):
+            logger.warning(f"Queued round {job.round_number} of Game '{game}' again after it was {job.status}")
+            job.refresh_from_db()
+        return job
+    
+    @classmethod
+    def enqueue_many(cls, games):
+        # One insert for all Games, rounds already queued are left alone by the unique constraint
+        if not games:
+            return
+        cls.objects.bulk_create([cls(game=game, round_number=game.round_number) for game in games], ignore_conflicts=True)
+        rounds = models.Q(*[models.Q(game=game, round_number=game.round_number) for game in games], _connector=models.Q.OR)
+        retried = cls.objects.filter(rounds).filter(cls.retryable(now())).update(**cls.requeued())
+        if retried:
+            logger.warning(f"Queued {retried} failed or stale rounds again")
+    
+    @classmethod
+    def retryable(cls, moment):
+        # The unique constraint keeps a round to one job, so a failed one, or one whose worker died,
+        # is queued again rather than blocking its Game for good
+        return (models.Q(status=cls.FAILED, finished__lt=moment - RETRY_FAILED_AFTER)
+                | models.Q(status=cls.RUNNING, started__lt=moment - STALE_AFTER))
+    
+    @classmethod
+    def requeued(cls):
+        return {'status': cls.QUEUED, 'started': None, 'finished': None, 'error': ""}
+    
+    @classmethod
+    def claim(cls, job_id):
+        # Like claim_next for a job picked by the scheduler, None if another worker got it first
+        claimed = cls.objects.filter(pk=job_id, status=cls.QUEUED).update(status=cls.RUNNING, started=now())
+        if not claimed:
+            return None
+        return cls.objects.select_related('game').get(pk=job_id)
+    
+    @classmethod
+    def claim_next(cls):
+        with transaction.atomic():
+            job = cls.objects.select_for_update(skip_locked=True).filter(status=cls.QUEUED).order_by('created', 'id').first()
+            if job is None:
+                return None
+            job.status = cls.RUNNING
+            job.started = now()
+            job.save(update_fields=['status', 'started'])
+        return job
+    
+    @classmethod
+    def requeue_stale(cls, started_before):
+        # Rounds are resolved in one transaction, so a job left running by a dead worker never committed
+        return cls.objects.filter(status=cls.RUNNING, started__lt=started_before).update(**cls.requeued())
+    
+    def run(self):
+        game = self.game
+        try:
+            if game.round_number == self.round_number and game.next_round():
+                self.status = self.DONE
+            else:
+                logger.warning(f"Skipping {self}, the Game is already past round {self.round_number}")
+                self.status = self.SKIPPED
+        except Exception as e:
+            logger.exception(f"{self} failed")
+            self.status = self.FAILED
+            self.error = str(e)
+        self.finished = now()
+        self.save(update_fields=['status', 'finished', 'error'])
+        return self.status
@@ -0,0 +1,63 @@
+import logging
+
+from django.db import models
+from django.utils.timezone import now
+
+logger = logging.getLogger('hereditus')
+
+class RoundMetrics(models.Model):
+    """Where the time of one resolved round went, recorded by RoundEngine.
+
+    phases maps each phase of the round to its summed wall time in milliseconds, SQL query count
+    and rows written, across all colonies. Army sub-steps and battles are also counted in army_round.
+    """
+
+    game = models.ForeignKey('main_game.Game', on_delete=models.CASCADE, related_name='round_metrics')
+    round_number = models.IntegerField()
+    created = models.DateTimeField(default=now)
+    colonies = models.IntegerField(default=0)
+    torbs = models.IntegerField(default=0)
+    total_ms = models.FloatField(default=0)
+    queries = models.IntegerField(default=0)
+    rows_written = models.IntegerField(default=0)
+    phases = models.JSONField(default=dict)
+
+    class Meta:
+        verbose_name_plural = "round metrics"
+        constraints = [
+            models.UniqueConstraint(fields=['game', 'round_number'], name='unique_round_metrics'),
+        ]
+
+    def __str__(self):
+        return f"RoundMetrics for Game '{self.game}' round {self.round_number}"
+
+    @classmethod
+    def record(cls, round_engine):
+        phases = {phase: dict(metrics) for phase, metrics in round_engine.phase_metrics.items()}
+        total = phases.pop('round')
+        round_metrics = cls.objects.create(
+            game=round_engine.game,
+            round_number=round_engine.round_number,
+            colonies=len(round_engine.colonies),
+            torbs=len(round_engine.torbs) + len(round_engine.new_torbs),
+            total_ms=round(total['ms'], 3),
+            queries=total['queries'],
+            rows_written=total['rows'],
+            phases={phase: {**metrics, 'ms': round(metrics['ms'], 3)} for phase, metrics in phases.items()})
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug("%s: %sms, %s queries, slowest phase %s", round_metrics, round_metrics.total_ms, round_metrics.queries, round_metrics.slowest_phase)
+        return round_metrics
+
+    @property
+    def slowest_phase(self):
+        # Only top-level phases, army_round already contains its sub-steps
+        top_level = {phase: metrics for phase, metrics in self.phases.items() if phase not in ARMY_STEPS}
+        if not top_level:
+            return None
+        return max(top_level, key=lambda phase: top_level[phase]['ms'])
+
+    def phase_ms(self, phase):
+        return self.phases.get(phase, {}).get('ms', 0)
+
+# Steps of RoundEngine.army_round, recorded on their own and as part of army_round
+ARMY_STEPS = ('purge_soldiers', 'scout_colony', 'attack_colony', 'battle_army', 'train_soldiers')
@@ -1,10 +1,83 @@
 import logging
+from contextlib import contextmanager
+from contextvars import ContextVar
 
 from django.db import models
+from django.db.models import BooleanField, ExpressionWrapper, Q
+from django.utils.functional import cached_property
 from django.utils.timezone import now
 
 logger = logging.getLogger('hereditus')
 
+# Pages render this many past rounds of log entries, older ones are fetched on demand
+RECENT_ROUNDS = 3
+PAGE_SIZE = 50
+
+active_buffer = ContextVar('story_text_buffer', default=None)
+
+class StoryTextBuffer:
+    """Collects new StoryTexts and writes them with one bulk_create, see StoryText.buffered().
+
+    Entries get the round number the buffer was opened with, or their Game's current round
+    read from the database once per Colony when it was opened without one.
+    """
+
+    def __init__(self, round_number=None):
+        self.round_number = round_number
+        self.story_texts = []
+        self.colony_rounds = {}
+
+    def __len__(self):
+        return len(self.story_texts)
+
+    def add(self, story_text):
+        story_text.game_round = self.round_number if self.round_number is not None else self.colony_round(story_text)
+        self.story_texts.append(story_text)
+        return story_text
+
+    def colony_round(self, story_text):
+        if story_text.colony_id not in self.colony_rounds:
+            self.colony_rounds[story_text.colony_id] = story_text.current_round(fresh=True)
+        return self.colony_rounds[story_text.colony_id]
+
+    def flush(self):
+        if not self.story_texts:
+            return []
+        story_texts = StoryText.objects.bulk_create(self.story_texts, batch_size=500)
+        if logger.isEnabledFor(logging.DEBUG):
+            for story_text in story_texts:
+                logger.debug("StoryText for Colony %s of type %s: %s", story_text.colony_id, story_text.story_text_type, story_text.story_text)
+        self.story_texts = []
+        return story_texts
+
+class StoryTextQuerySet(models.QuerySet):
+    def with_is_new(self, round_number):
+        # Lets pages mark new entries without looking up each StoryText's game
+        return self.annotate(is_new=ExpressionWrapper(Q(game_round__gte=round_number - 1), output_field=BooleanField()))
+    
+    def recent(self, round_number, rounds=RECENT_ROUNDS):
+        return self.filter(game_round__gte=round_number - rounds).order_by('id')
+    
+    def has_older(self, round_number, rounds=RECENT_ROUNDS):
+        # Whether there is more than recent() returns, pages only offer to load older entries then
+        return self.filter(game_round__lt=round_number - rounds).exists()
+    
+    def page(self, before=None, after=None, limit=PAGE_SIZE):
+        """Returns up to limit entries, oldest first, and whether more exist past them.
+
+        Ids are the cursor: after=<id> gives the entries newer than the client's last one,
+        before=<id> the ones leading up to its oldest. Without either, the latest entries.
+        """
+        if after is not None:
+            story_texts = list(self.filter(id__gt=after).order_by('id')[:limit + 1])
+            return story_texts[:limit], len(story_texts) > limit
+        
+        story_texts = self.order_by('-id')
+        if before is not None:
+            story_texts = story_texts.filter(id__lt=before)
+        story_texts = list(story_texts[:limit + 1])
+        return story_texts[:limit][::-1], len(story_texts) > limit
+
 class StoryText(models.Model):
     colony = models.ForeignKey('main_game.Colony', on_delete=models.CASCADE)
     story_text_type = models.CharField(max_length=32, default="default")
@@ -12,18 +85,73 @@ class StoryText(models.Model):
     timestamp = models.DateTimeField(default=now)
     game_round = models.IntegerField(default=-1)
     
+    objects = StoryTextQuerySet.as_manager()
+    
+    class Meta:
+        indexes = [
+            # Pages load the latest rounds of a colony's log, the JSON feed pages through it by id
+            models.Index(fields=['colony', 'game_round'], name='story_text_colony_round'),
+            models.Index(fields=['colony', 'id'], name='story_text_colony_id'),
+        ]
+    
     # TODO: Add StoryText to logger whenever created
     
-    @property
+    # Replaced by the annotation when loaded through StoryText.objects.with_is_new()
+    @cached_property
     def is_new(self):
-        return self.game_round + 1 >= self.colony.game.round_number
+        return self.game_round + 1 >= self.current_round()
+    
+    @classmethod
+    @contextmanager
+    def buffered(cls, round_number=None):
+        """New StoryTexts saved inside the block are written in one bulk_create when it exits.
+
+        StoryText.objects.create() and save() keep working as usual, but hand new entries to the
+        buffer instead of inserting them one by one. Nested blocks share the outermost buffer, and
+        entries are dropped if the block raises, like the rest of its transaction.
+        """
+        buffer = active_buffer.get()
+        if buffer is not None:
+            yield buffer
+            return
+        buffer = StoryTextBuffer(round_number)
+        token = active_buffer.set(buffer)
+        try:
+            yield buffer
+        finally:
+            active_buffer.reset(token)
+        buffer.flush()
+    
+    def current_round(self, fresh=False):
+        # Uses the loaded Colony and Game when there are, the round number cache when not.
+        # New entries pass fresh and read it from the database, see Game.colony_round
+        if fresh:
+            from .game import Game
+            return Game.colony_round(self.colony_id)
+        if StoryText.colony.is_cached(self) and type(self.colony).game.is_cached(self.colony):
+            return self.colony.game.round_number
+        from .. import cache
+        return cache.colony_round(self.colony_id)
     
     def save(self, *args, **kwargs):
         is_new = self.pk is None
         if is_new:
-            self.game_round = self.colony.game.round_number
+            buffer = active_buffer.get()
+            if buffer is not None:
+                buffer.add(self)
+                return
+            self.game_round = self.current_round(fresh=True)
         
         super().save(*args, **kwargs)
         
         if is_new:
-            logger.debug(f"StoryText for Colony {self.colony.name} of type {self.story_text_type}: {self.story_text}")
\ No newline at end of file
+            logger.debug("StoryText for Colony %s of type %s: %s", self.colony_id, self.story_text_type, self.story_text)
+    
+    def as_json(self):
+        return {
+            'id': self.id,
+            'game_round': self.game_round,
+            'story_text_type': self.story_text_type,
+            'story_text': self.story_text,
+            'is_new': self.is_new,
+        }
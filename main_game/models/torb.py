@@ -1,11 +1,20 @@
-from django.db import models
-from django.apps import apps
+from django.db import models, transaction
 import random
 import logging
+from django.db.models import F
 from django.db.models.functions import Now
+from django.utils.functional import cached_property
+
+from ..rules import decode_genome, encode_genome, genome_genes
 
 logger = logging.getLogger('hereditus')
 
+# Colony fields that count the living Torbs with a given action, see Colony.num_soldiers
+COLONY_COUNTERS = {
+    'soldiering': 'soldier_count',
+    'training': 'training_count',
+}
+
 class Torb(models.Model):
     
     TORB_ACTION_OPTIONS = [
@@ -31,9 +40,39 @@ class Torb(models.Model):
     context_torb = models.ForeignKey("Torb", null=True, blank=True, on_delete=models.SET_NULL)
     growing = models.BooleanField(default=False)
     trained = models.BooleanField(default=False)
-    genes = models.JSONField(default=dict)
+    genome = models.BinaryField(default=b'')
     army = models.ForeignKey('main_game.Army', on_delete=models.SET_NULL, null=True, blank=True)
+    # The round a Torb died in, it moves to TorbArchive settings.TORB_ARCHIVE_AFTER_ROUNDS later
+    died_round = models.IntegerField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            # Colony phases walk living, grown Torbs; pages count the living ones
+            models.Index(fields=['colony', 'is_alive', 'growing'], name='torb_colony_alive_growing'),
+            models.Index(fields=['colony'], condition=models.Q(is_alive=True), name='torb_colony_living'),
+            models.Index(fields=['colony', 'action'], name='torb_colony_action'),
+            # TorbArchive.archive_dead_torbs looks for the long dead
+            models.Index(fields=['colony', 'died_round'], condition=models.Q(is_alive=False), name='torb_colony_dead'),
+        ]
 
+    @cached_property
+    def gene_list(self):
+        from .. import cache
+        return cache.evolution_engine(cache.colony_game_id(self.colony_id)).gene_list
+    
+    @property
+    def genome_array(self):
+        return decode_genome(self.genome, len(self.gene_list))
+    
+    # The genome as {gene: [alleles]}, for templates and code that reads genes by name
+    @property
+    def genes(self):
+        return genome_genes(self.gene_list, self.genome_array)
+    
+    @genes.setter
+    def genes(self, genes):
+        self.genome = encode_genome(genes, self.gene_list)
+    
     @property
     def power(self):
         strength_allele = random.choice(self.genes['strength'])
@@ -52,54 +91,83 @@ class Torb(models.Model):
         return f"Colony {self.colony} Torb: {self.private_ID} '{self.name}'"
     
     def adjust_hp(self, adjust_amount, context="an unknown source"):
-        logger.debug(f"Colony {self.colony.id} '{self.colony.name}' Torb {self.private_ID} '{self.name}' adjusted hp amt {adjust_amount} context: {context}")
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug("Colony %s '%s' Torb %s '%s' adjusted hp amt %s context: %s", self.colony_id, self.colony.name, self.private_ID, self.name, adjust_amount, context)
         adjust_amount = int(adjust_amount)
         from .story_text import StoryText
         self.hp = min(max(0, self.hp + adjust_amount), self.max_hp)
         if self.hp > 0:
             self.save()
             return
+        from .game import Game
         self.is_alive = False
         self.fertile = False
+        self.died_round = Game.colony_round(self.colony_id)
         StoryText.objects.create(
             colony=self.colony,
             story_text_type="death",
             story_text=f"'{self.name}' (Torb {self.private_ID}) died from {context}.",
             timestamp=Now())
-        logger.debug(f"Colony {self.colony.id} '{self.colony.name}' Torb {self.private_ID} '{self.name}' died, context: {context}")
-        self.save()
-        self.set_action("dead", "💀 Dead")
-        if self.army_torb.first():
-            self.army_torb.first().remove_from_army()
+        logger.debug("Colony %s '%s' Torb %s '%s' died, context: %s", self.colony_id, self.colony.name, self.private_ID, self.name, context)
+        from .colony import Colony
+        with transaction.atomic():
+            Colony.lock(self.colony_id)
+            self.save()
+            self.set_action("dead", "💀 Dead")
+            if self.army_torb.first():
+                self.army_torb.first().remove_from_army()
         
     # TODO: Make dictionary of actions and action_desc strings defined in one place
     def set_action(self, action: str, action_desc: str, context_torb=None):
-        if not self.is_alive:
-            self.action = "dead"
-            self.action_desc = "💀 Dead"
-            self.save()
-            return
-        
-        if self.growing:
-            self.action = "growing"
-            self.action_desc = "🍼 Growing"
+        from .colony import Colony
+        # The rows and the Colony counters change together or not at all, the Colony row is locked
+        # first as rounds do, see Colony.lock
+        with transaction.atomic():
+            Colony.lock(self.colony_id)
+            counter_before = COLONY_COUNTERS.get(self.action)
+            if not self.is_alive:
+                self.action = "dead"
+                self.action_desc = "💀 Dead"
+            elif self.growing:
+                self.action = "growing"
+                self.action_desc = "🍼 Growing"
+            else:
+                if logger.isEnabledFor(logging.DEBUG):
+                    logger.debug("Colony %s '%s' Torb %s setting action %s context torb: %s", self.colony_id, self.colony.name, self.private_ID, action, context_torb)
+                # If prior action was breeding, ensure paired torb is also no longer breeding. Only while it
+                # still pairs with this Torb, this instance may predate its partner's release
+                if self.action == "breeding" and self.context_torb and self.context_torb.context_torb_id == self.pk:
+                    if logger.isEnabledFor(logging.DEBUG):
+                        logger.debug("Colony %s '%s' Torb %s Already breeding with %s", self.colony_id, self.colony.name, self.private_ID, self.context_torb)
+                    self.context_torb.context_torb = None
+                    self.context_torb.action = "gathering"
+                    self.context_torb.action_desc = "🌾 Gathering"
+                    self.context_torb.save()
+            
+                self.action = action
+                self.action_desc = action_desc
+                self.context_torb = context_torb
             self.save()
+            self.update_colony_counters(counter_before)
+    
+    def update_colony_counters(self, counter_before):
+        counter_after = COLONY_COUNTERS.get(self.action)
+        if counter_before == counter_after:
             return
+        from .colony import Colony
+        changes = {}
+        if counter_before:
+            changes[counter_before] = F(counter_before) - 1
+        if counter_after:
+            changes[counter_after] = F(counter_after) + 1
+        Colony.objects.filter(pk=self.colony_id).update(**changes)
         
-        logger.debug(f"Colony {self.colony.id} '{self.colony.name}' Torb {self.private_ID} setting action {action} context torb: {context_torb}")
-        # If prior action was breeding, ensure paired torb is also no longer breeding
-        if self.action == "breeding" and self.context_torb:
-            logger.debug(f"Colony {self.colony.id} '{self.colony.name}' Torb {self.private_ID} Already breeding with {self.context_torb}")
-            self.context_torb.context_torb = None
-            self.context_torb.action = "gathering"
-            self.context_torb.action_desc = "🌾 Gathering"
-            self.context_torb.save()
-            
-        
-        self.action = action
-        self.action_desc = action_desc
-        self.context_torb = context_torb
-        self.save()
+        # Keep an already loaded Colony in step with the row
+        if Torb.colony.is_cached(self):
+            if counter_before:
+                setattr(self.colony, counter_before, getattr(self.colony, counter_before) - 1)
+            if counter_after:
+                setattr(self.colony, counter_after, getattr(self.colony, counter_after) + 1)
     
     @property
     def status(self):
@@ -0,0 +1,80 @@
+import logging
+
+from django.conf import settings
+from django.db import models, transaction
+from django.utils.timezone import now
+
+from ..rules import decode_genome, genome_genes
+
+logger = logging.getLogger('hereditus')
+
+class TorbArchive(models.Model):
+    """A dead Torb moved out of the Torb table, see archive_dead_torbs.
+
+    Keeps what family trees and colony histories need: who the Torb was, its generation and
+    genome and when it died. Rounds, pages and orders only read the Torb table, which then
+    holds the living and the recently dead.
+    """
+
+    colony = models.ForeignKey('main_game.Colony', on_delete=models.CASCADE, related_name='archived_torbs')
+    # The Torb's id before it was archived
+    torb_id = models.BigIntegerField()
+    private_ID = models.IntegerField()
+    name = models.CharField(max_length=16)
+    generation = models.IntegerField()
+    genome = models.BinaryField()
+    max_hp = models.IntegerField()
+    trained = models.BooleanField()
+    died_round = models.IntegerField(null=True, blank=True)
+    archived = models.DateTimeField(default=now)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['colony', 'private_ID'], name='torb_archive_colony_torb'),
+        ]
+
+    def __str__(self):
+        return f"Colony {self.colony_id} archived Torb: {self.private_ID} '{self.name}'"
+
+    @property
+    def genes(self):
+        from .. import cache
+        gene_list = cache.evolution_engine(cache.colony_game_id(self.colony_id)).gene_list
+        return genome_genes(gene_list, decode_genome(bytes(self.genome), len(gene_list)))
+
+    @classmethod
+    def from_torb(cls, torb):
+        return cls(
+            colony_id=torb.colony_id,
+            torb_id=torb.pk,
+            private_ID=torb.private_ID,
+            name=torb.name,
+            generation=torb.generation,
+            genome=bytes(torb.genome),
+            max_hp=torb.max_hp,
+            trained=torb.trained,
+            died_round=torb.died_round)
+
+    @classmethod
+    def archive_dead_torbs(cls, game, after_rounds=None, batch_size=1000):
+        """Moves the Game's Torbs that died after_rounds or more rounds ago into the archive.
+
+        after_rounds defaults to settings.TORB_ARCHIVE_AFTER_ROUNDS. Each batch is copied and
+        deleted in one transaction, so a Torb is always in exactly one of the tables. Returns
+        the number of Torbs archived.
+        """
+        from .torb import Torb
+        after_rounds = settings.TORB_ARCHIVE_AFTER_ROUNDS if after_rounds is None else after_rounds
+        dead = Torb.objects.filter(colony__game=game, is_alive=False, died_round__lte=game.round_number - after_rounds).order_by('id')
+        archived = 0
+        while True:
+            with transaction.atomic():
+                torbs = list(dead[:batch_size])
+                if not torbs:
+                    break
+                cls.objects.bulk_create([cls.from_torb(torb) for torb in torbs])
+                Torb.objects.filter(pk__in=[torb.pk for torb in torbs]).delete()
+            archived += len(torbs)
+        if archived:
+            logger.info(f"Archived {archived} dead Torbs of Game '{game}'")
+        return archived
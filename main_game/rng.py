@@ -0,0 +1,79 @@
+"""Random streams of Games, reproducible from a Game's seed and a round number.
+
+Every round draws from its own Philox streams, a counter-based generator keyed by the Game's
+rng_seed and the round, so any round can be replayed exactly, on its own and in any order,
+without replaying the rounds before it.
+"""
+import random
+import secrets
+
+import numpy as np
+
+# The streams of one round, see round_streams, of a Colony's starting Torbs and of the AI colonies
+RULES_STREAM = 0
+BREEDING_STREAM = 1
+FOUNDING_STREAM = 2
+AI_STREAM = 3
+
+def new_seed():
+    # Fits a signed 64-bit column
+    return secrets.randbits(63)
+
+def philox(seed, round_number, stream, index=0):
+    # Keyed by the seed, the top words of the 256-bit counter pick the round, the stream and an index
+    # within it and the bottom word counts the draws, so streams never overlap
+    return np.random.Philox(key=seed, counter=[0, index, stream, round_number])
+
+class StreamRandom(random.Random):
+    """random.Random drawing its bits from a numpy bit generator.
+
+    shuffle, choice, sample, uniform and the rest keep the API of the random module. Raw
+    64-bit words are drawn in blocks, so a draw costs a list pop rather than a numpy call.
+    """
+
+    BLOCK = 256
+
+    def __init__(self, bit_generator):
+        self.bit_generator = bit_generator
+        self.words = []
+        super().__init__()
+
+    def seed(self, a=None, version=2):
+        # Seeded by the bit generator, random.Random.__init__ still calls this
+        self.words = []
+
+    def refill(self):
+        self.words = self.bit_generator.random_raw(self.BLOCK).tolist()
+        return self.words
+
+    def random(self):
+        # 53 random bits, like random.random()
+        return ((self.words or self.refill()).pop() >> 11) * (1.0 / 9007199254740992.0)
+
+    def getrandbits(self, k):
+        if k <= 64:
+            return (self.words or self.refill()).pop() >> (64 - k)
+        bits = 0
+        for shift in range(0, k, 64):
+            bits |= (self.words or self.refill()).pop() << shift
+        return bits >> (-k % 64)
+
+    def getstate(self):
+        return self.bit_generator.state, tuple(self.words)
+
+    def setstate(self, state):
+        self.bit_generator.state, words = state
+        self.words = list(words)
+
+def founding_random(seed, colony_id):
+    # Genes of a new Colony's starting Torbs, so a replay founds it the same way
+    return StreamRandom(philox(seed, 0, FOUNDING_STREAM, colony_id))
+
+def ai_generator(seed, round_number):
+    # Noise of the AI colonies' choices in a round, apart from the streams the round resolves with
+    return np.random.Generator(philox(seed, round_number, AI_STREAM))
+
+def round_streams(seed, round_number):
+    # (random.Random for the round rules and battles, numpy Generator for breeding)
+    return (StreamRandom(philox(seed, round_number, RULES_STREAM)),
+            np.random.Generator(philox(seed, round_number, BREEDING_STREAM)))
@@ -0,0 +1,170 @@
+import logging
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+
+from django.db import connection, transaction
+from django.db.models import F
+from django.utils.functional import cached_property
+
+from . import ai, cache
+from .models import Army, ArmyTorb, Colony, Game, GameAction, RoundMetrics, StoryText, Torb
+from .models.story_text import StoryTextBuffer
+from .rules import RoundRules, encode_genome
+
+logger = logging.getLogger('hereditus')
+
+TORB_UPDATE_FIELDS = ['hp', 'is_alive', 'fertile', 'starving', 'action', 'action_desc', 'context_torb', 'growing', 'trained', 'died_round']
+
+class RoundEngine(RoundRules):
+    """Resolves a whole Game round in memory with the RoundRules.
+
+    Every Torb, Army and ArmyTorb of the Game is loaded once up front and all results are
+    written back with bulk queries inside a single transaction.
+    """
+
+    def __init__(self, game, rng=None, rnd=None):
+        # Rolls come from the Game's streams for this round unless given, so a round replays exactly
+        if rng is None and rnd is None:
+            rnd, rng = game.round_streams()
+        super().__init__(game.round_number, rng, rnd)
+        self.game = game
+
+        self.ai_colonies = []
+        self.dirty_torbs = {}
+        self.removed_army_torbs = []
+        self.new_discoveries = []
+        self.story_texts = StoryTextBuffer(self.round_number)
+        self.next_round_deadline = game.next_round_deadline()
+
+        # Wall time, queries and rows written per phase, summed over every colony, see RoundMetrics
+        self.phase_metrics = defaultdict(lambda: {'ms': 0.0, 'queries': 0, 'rows': 0})
+        self.active_phases = []
+
+    def run(self):
+        # False when another process already resolved this round, nothing is written then
+        with transaction.atomic():
+            with connection.execute_wrapper(self.count_query), self.timed('round'):
+                if not self.claim_round():
+                    logger.info("Game '%s' round %s was already resolved", self.game, self.round_number)
+                    return False
+                # Only for a round that resolves, and before the load so the round sees the orders
+                with self.timed('ai_turns'):
+                    self.ai_colonies = ai.take_turns(self.game, self.round_number)
+                with self.timed('load'):
+                    self.load()
+                self.resolve()
+                with self.timed('flush'):
+                    self.flush()
+            RoundMetrics.record(self)
+            self.game.invalidate_round_cache()
+        self.game.round_number = self.round_number + 1
+        self.game.round_deadline = self.next_round_deadline
+        logger.debug("Game '%s' round %s resolved for %s colonies", self.game, self.round_number, len(self.colonies))
+        return True
+
+    @cached_property
+    def evolution_engine(self):
+        return cache.evolution_engine(self.game.pk)
+
+    def claim_round(self):
+        # Compare-and-swap on the round number. As the transaction's first write it takes the Game row
+        # lock before any colony lock, so a concurrent claim waits for this round to commit or roll back
+        # and then matches no row, without having loaded anything.
+        claimed = Game.objects.filter(pk=self.game.pk, round_number=self.round_number).update(
+            round_number=F('round_number') + 1, round_deadline=self.next_round_deadline)
+        return claimed == 1
+
+    def load(self):
+        # Locked until the round commits, nothing else may change food or the Torb sequences meanwhile.
+        # Orders lock these rows before their Torbs too, so they wait for the round, see Colony.lock
+        for colony in Colony.objects.select_for_update().filter(game=self.game).order_by('id'):
+            self.colonies[colony.pk] = colony
+        for army in Army.objects.filter(colony__game=self.game):
+            self.armies[army.pk] = army
+        # The dead take no part in a round, they wait for TorbArchive.archive_dead_torbs
+        gene_list = self.evolution_engine.gene_list
+        for torb in Torb.objects.filter(colony__game=self.game, is_alive=True).order_by('id'):
+            # All of this Game, no need to look each colony's Game up to read the genomes
+            torb.gene_list = gene_list
+            self.torbs[torb.pk] = torb
+            self.colony_torbs[torb.colony_id].append(torb)
+        for army_torb in ArmyTorb.objects.filter(army__in=list(self.armies)).order_by('id'):
+            army_torb.torb = self.torbs[army_torb.torb_id]
+            self.army_members[army_torb.army_id].append(army_torb)
+            self.army_torb_by_torb[army_torb.torb_id] = army_torb
+        discovered = Colony.discovered_colonies.through.objects.filter(from_colony__game=self.game)
+        for from_colony_id, to_colony_id in discovered.values_list('from_colony_id', 'to_colony_id'):
+            self.discovered[from_colony_id].add(to_colony_id)
+
+    def flush(self):
+        # AI colonies are ready for the next round as soon as it starts, see ai.end_turns
+        for colony in self.ai_colonies:
+            self.colonies[colony.pk].ready = True
+        GameAction.objects.bulk_create(ai.end_turns(self.game, self.ai_colonies, self.round_number + 1))
+        Torb.objects.bulk_update(list(self.dirty_torbs.values()), TORB_UPDATE_FIELDS, batch_size=500)
+        Torb.objects.bulk_create(self.new_torbs, batch_size=500)
+        removed_ids = [army_torb.pk for army_torb in self.removed_army_torbs if army_torb.pk]
+        if removed_ids:
+            ArmyTorb.objects.filter(pk__in=removed_ids).delete()
+        new_army_torbs = [army_torb for members in self.army_members.values() for army_torb in members if army_torb.pk is None]
+        ArmyTorb.objects.bulk_create(new_army_torbs, batch_size=500)
+        Army.objects.bulk_update(list(self.armies.values()), ['morale', 'scout_target', 'attack_target'])
+        Colony.objects.bulk_update(list(self.colonies.values()), ['food', 'ready', 'soldier_count', 'training_count', 'next_private_ID', 'names_allocated'])
+        Colony.discovered_colonies.through.objects.bulk_create(self.new_discoveries, ignore_conflicts=True)
+        num_story_texts = len(self.story_texts)
+        self.story_texts.flush()
+        logger.debug("Game '%s' round %s wrote %s Torbs, %s births and %s StoryTexts", self.game, self.round_number, len(self.dirty_torbs), len(self.new_torbs), num_story_texts)
+
+    # Persistence hooks, see RoundRules
+
+    @contextmanager
+    def timed(self, phase):
+        self.active_phases.append(phase)
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.phase_metrics[phase]['ms'] += (time.perf_counter() - started) * 1000
+            self.active_phases.pop()
+
+    def count_query(self, execute, sql, params, many, context):
+        result = execute(sql, params, many, context)
+        rows = 0 if sql.lstrip()[:6].upper() == "SELECT" else max(0, context['cursor'].rowcount)
+        for phase in self.active_phases:
+            self.phase_metrics[phase]['queries'] += 1
+            self.phase_metrics[phase]['rows'] += rows
+        return result
+
+    def touch(self, torb):
+        if torb.pk:
+            self.dirty_torbs[torb.pk] = torb
+
+    def make_torb(self, colony, private_ID, name, genes, generation, max_hp):
+        return Torb(
+            colony=colony,
+            private_ID=private_ID,
+            name=name,
+            genome=encode_genome(genes, self.evolution_engine.gene_list),
+            generation=generation,
+            max_hp=max_hp,
+            hp=max_hp)
+
+    def enlist(self, army, torb):
+        return ArmyTorb.enlist(army, torb, self.random)
+
+    def remove_from_army(self, army_torb):
+        super().remove_from_army(army_torb)
+        self.removed_army_torbs.append(army_torb)
+
+    def discover(self, colony, other_colony):
+        if other_colony.pk in self.discovered[colony.pk]:
+            return
+        super().discover(colony, other_colony)
+        self.new_discoveries.append(Colony.discovered_colonies.through(from_colony_id=colony.pk, to_colony_id=other_colony.pk))
+
+    def story(self, colony, story_text_type, story_text):
+        self.story_texts.add(StoryText(
+            colony=colony,
+            story_text_type=story_text_type,
+            story_text=story_text))
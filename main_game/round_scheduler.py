@@ -0,0 +1,93 @@
+import logging
+import multiprocessing
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import django
+from django.db import close_old_connections, connections, transaction
+
+logger = logging.getLogger('hereditus')
+
+def init_worker(database_names):
+    # Spawned workers start without Django and open their own connections, to the same databases
+    # as the scheduler even when those were renamed at runtime, e.g. by the test runner
+    django.setup()
+    for alias, name in database_names.items():
+        connections[alias].settings_dict['NAME'] = name
+
+def resolve_round(job_id):
+    from .models import RoundJob
+    close_old_connections()
+    job = RoundJob.claim(job_id)
+    if job is None:
+        return {'job': job_id, 'status': None}
+    started = time.perf_counter()
+    status = job.run()
+    return {
+        'job': job_id,
+        'game': job.game_id,
+        'round_number': job.round_number,
+        'status': status,
+        'seconds': round(time.perf_counter() - started, 3),
+        'error': job.error,
+    }
+
+def ready_overdue_games(moment):
+    """Readies the idle colonies of every Game past its round deadline and queues the Games' rounds.
+
+    Overdue Games are found through the game_round_deadline index, so Games without a deadline or
+    with time left are never read. The queued rounds are resolved by run_round_worker or
+    run_round_scheduler, which also set the next deadline.
+    """
+    from .models import Colony, Game, RoundJob, StoryText
+    games = list(Game.objects.past_deadline(moment).only('id', 'round_number'))
+    if not games:
+        return games
+    with transaction.atomic():
+        idle = list(Colony.objects.filter(game__in=games, ready=False).values_list('id', 'game__round_number'))
+        Colony.objects.filter(pk__in=[colony_id for colony_id, _ in idle]).update(ready=True)
+        StoryText.objects.bulk_create([
+            StoryText(colony_id=colony_id, game_round=round_number, story_text_type="system",
+                      story_text="Time ran out for this round, your Torbs carry on with their last orders.")
+            for colony_id, round_number in idle], batch_size=500)
+        RoundJob.enqueue_many(games)
+    logger.info(f"Readied {len(idle)} idle colonies in {len(games)} overdue Games")
+    return games
+
+class RoundScheduler:
+    """Resolves the queued rounds of many Games at once on a pool of worker processes.
+
+    Games are independent, so each queued RoundJob is claimed and run by whichever worker is free.
+    A round that fails is marked on its own RoundJob and reported, the other Games carry on.
+    """
+
+    def __init__(self, processes):
+        self.processes = processes
+        database_names = {alias: connections[alias].settings_dict['NAME'] for alias in connections}
+        self.pool = ProcessPoolExecutor(
+            max_workers=processes,
+            mp_context=multiprocessing.get_context('spawn'),
+            initializer=init_worker,
+            initargs=(database_names,))
+
+    def enqueue_due_games(self):
+        from .models import Game, RoundJob
+        due = list(Game.objects.ready_for_round())
+        RoundJob.enqueue_many(due)
+        return len(due)
+
+    def run_queued(self):
+        # Yields one result per queued job as the workers finish them
+        from .models import RoundJob
+        job_ids = list(RoundJob.objects.filter(status=RoundJob.QUEUED).order_by('created', 'id').values_list('id', flat=True))
+        futures = {self.pool.submit(resolve_round, job_id): job_id for job_id in job_ids}
+        for future in as_completed(futures):
+            try:
+                yield future.result()
+            except Exception as e:
+                # The worker died before the job could record its own failure
+                logger.exception(f"RoundJob {futures[future]} crashed its worker")
+                yield {'job': futures[future], 'status': RoundJob.FAILED, 'error': str(e)}
+
+    def close(self):
+        self.pool.shutdown()
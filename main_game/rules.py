@@ -0,0 +1,452 @@
+"""The rules of Hereditus, free of the ORM.
+
+Everything a round decides lives here: genomes and breeding, Torb names, combat stats and the
+phases of a round in RoundRules. The rules work on any objects with the attributes of the models
+(Torb, Colony, Army, ArmyTorb and EvolutionEngine), so the same code resolves rounds of saved
+Games in RoundEngine and of in-memory Games in simulation.SimGame.
+"""
+import logging
+import random
+from collections import defaultdict
+from contextlib import nullcontext
+from functools import lru_cache
+
+import numpy as np
+
+from .battle import Battle, BattleSide
+from .models.torb_names import torb_names
+
+logger = logging.getLogger('hereditus')
+
+NOT_TIMED = nullcontext()
+
+# Genomes
+
+# Genomes are stored as little-endian float32 alleles, gene by gene in the EvolutionEngine's gene_list order
+GENOME_DTYPE = np.dtype('<f4')
+
+def encode_genome(genes, gene_list):
+    return np.asarray([genes[gene] for gene in gene_list], dtype=GENOME_DTYPE).tobytes()
+
+def decode_genome(genome, num_genes):
+    # A read-only (genes, alleles) view of the stored bytes, nothing is copied
+    return np.frombuffer(genome, dtype=GENOME_DTYPE).reshape(num_genes, -1)
+
+def genome_genes(gene_list, genome_array):
+    # {gene: [alleles]}. Bred alleles have 4 decimals, rounding drops the float32 noise past them
+    return dict(zip(gene_list, genome_array.astype(float).round(4).tolist()))
+
+def claim_breedable_pairs(pairs, colony_name=None):
+    # Parents are marked infertile as they are claimed so a Torb listed in two pairs only breeds once
+    breedable_pairs = []
+    for torb0, torb1 in pairs:
+        if not torb0.fertile or not torb1.fertile:
+            if logger.isEnabledFor(logging.DEBUG):
+                logger.debug("Colony %s tried to breed Torb %s '%s' and Torb %s '%s' but one/both weren't breedable", colony_name, torb0.private_ID, torb0.name, torb1.private_ID, torb1.name)
+            continue
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug("Colony %s is breeding Torb %s '%s' and Torb %s '%s'", colony_name, torb0.private_ID, torb0.name, torb1.private_ID, torb1.name)
+        torb0.fertile = torb1.fertile = False
+        breedable_pairs.append((torb0, torb1))
+    return breedable_pairs
+
+def breed_genomes(engine, pairs, rng):
+    # Offspring genomes for every pair. A child gets as many alleles as its parent with the fewer,
+    # pairs with as many are bred at once, usually all of them
+    groups = defaultdict(list)
+    for i, (torb0, torb1) in enumerate(pairs):
+        groups[min(torb0.genome_array.shape[1], torb1.genome_array.shape[1])].append(i)
+    genomes = [None] * len(pairs)
+    for num_alleles, indexes in groups.items():
+        alleles = breed_alleles(engine, [pairs[i] for i in indexes], num_alleles, rng)
+        for k, i in enumerate(indexes):
+            genomes[i] = {gene: alleles[k, j].tolist() for j, gene in enumerate(engine.gene_list)}
+    return genomes
+
+def breed_alleles(engine, pairs, num_alleles, rng):
+    # Arrays are shaped (pairs, genes, alleles)
+    parents0 = np.array([torb0.genome_array[:, :num_alleles] for torb0, _ in pairs], dtype=float)
+    parents1 = np.array([torb1.genome_array[:, :num_alleles] for _, torb1 in pairs], dtype=float)
+    parents0 = rng.permuted(parents0, axis=2)
+    parents1 = rng.permuted(parents1, axis=2)
+
+    # The first allele is a randomly chosen one from the parents
+    # subsequent alleles are avg of random alleles from each parent, non-replacing
+    alleles = np.empty_like(parents0)
+    from_parent0 = rng.random(alleles.shape[:2]) < 0.5
+    alleles[:, :, 0] = np.where(from_parent0, parents0[:, :, 0], parents1[:, :, 0])
+    alleles[:, :, 1:] = np.round((parents0[:, :, 1:] + parents1[:, :, 1:]) / 2, 4)
+    alleles = np.maximum(alleles, 1)
+
+    mutated = rng.random(alleles.shape) >= 1 - engine.mutation_chance
+    mutation_amount = rng.normal(0, engine.mutation_dev, alleles.shape)
+    alleles = np.where(mutated, np.round(alleles * (1 + mutation_amount), 4), alleles)
+    return rng.permuted(alleles, axis=2)
+
+def protogenesis_genes(engine, rnd=random):
+    # Genes of a Torb that starts a Colony
+    return {gene: [rnd.randrange(engine.random_gene_min, engine.random_gene_max) for _ in range(engine.alleles_per_gene)]
+            for gene in engine.gene_list}
+
+# Names
+
+@lru_cache(maxsize=1024)
+def shuffled_torb_names(colony_id):
+    # Every Colony walks torb_names in its own fixed order
+    return tuple(random.Random(colony_id).sample(torb_names, len(torb_names)))
+
+def torb_name(colony_id, position):
+    # One shuffled pass over torb_names, then numbered passes, so names never repeat in a Colony
+    names = shuffled_torb_names(colony_id)
+    cycle, index = divmod(position, len(names))
+    return names[index] if cycle == 0 else f"{names[index]} {cycle + 1}"
+
+# Soldiers
+
+def enlistment_alleles(genes, rnd=random):
+    # Randomly select alleles for power and resilience when a Torb joins an Army
+    return {
+        'strength': rnd.choice(genes['strength']),
+        'agility': rnd.choice(genes['agility']),
+        'vitality': rnd.choice(genes['vitality']),
+        'sturdiness': rnd.choice(genes['sturdiness']),
+    }
+
+def combat_stats(active_alleles):
+    power = round((active_alleles['strength'] * active_alleles['agility'])**0.5, 2)
+    resilience = round((active_alleles['vitality'] * active_alleles['sturdiness'])**0.5, 2)
+    return power, resilience
+
+class RoundRules:
+    """Resolves a round of one Game over plain objects.
+
+    Subclasses fill colonies, armies, torbs, colony_torbs, army_members, army_torb_by_torb and
+    discovered, provide evolution_engine, and implement make_torb and enlist. The other hooks,
+    touch, story, timed, discover and remove_from_army, let them persist what changed.
+    Every roll comes from self.random, a random.Random for shuffles, combat and starvation,
+    or self.rng, a numpy Generator for breeding, see rng.round_streams.
+    """
+
+    def __init__(self, round_number, rng=None, rnd=None):
+        self.rng = rng if rng is not None else np.random.default_rng()
+        self.random = rnd if rnd is not None else random.Random()
+        self.round_number = round_number
+
+        self.colonies = {}
+        self.armies = {}
+        self.torbs = {}
+        self.colony_torbs = defaultdict(list)
+        self.army_members = defaultdict(list)
+        self.army_torb_by_torb = {}
+        self.discovered = defaultdict(set)
+        self.new_torbs = []
+
+    def resolve(self):
+        colonies = list(self.colonies.values())
+        self.random.shuffle(colonies)
+        for colony in colonies:
+            self.colony_round(colony)
+        for colony in colonies:
+            colony.ready = False
+            self.count_torbs(colony)
+
+    # Hooks
+
+    def timed(self, phase):
+        return NOT_TIMED
+
+    def touch(self, torb):
+        pass
+
+    def story(self, colony, story_text_type, story_text):
+        pass
+
+    def make_torb(self, colony, private_ID, name, genes, generation, max_hp):
+        raise NotImplementedError
+
+    def enlist(self, army, torb):
+        raise NotImplementedError
+
+    def discover(self, colony, other_colony):
+        self.discovered[colony.pk].add(other_colony.pk)
+
+    def remove_from_army(self, army_torb):
+        self.army_members[army_torb.army_id].remove(army_torb)
+        del self.army_torb_by_torb[army_torb.torb_id]
+
+    # Colony phases
+
+    def colony_round(self, colony):
+        for phase in (self.reset_fertility, self.gather_phase, self.grow_torbs, self.call_breed_torbs,
+                      self.rest_torbs, self.army_round, self.colony_meal):
+            with self.timed(phase.__name__):
+                phase(colony)
+        self.story(colony, "system", f"It is now year {self.round_number+1}.")
+
+    def reset_fertility(self, colony):
+        for torb in self.colony_torbs[colony.pk]:
+            if torb.is_alive and not torb.growing and not torb.fertile:
+                torb.fertile = True
+                self.touch(torb)
+
+    def gather_phase(self, colony):
+        num_gathering = sum(1 for torb in self.colony_torbs[colony.pk] if torb.action == "gathering")
+        food_gathered = round(num_gathering * colony.gather_rate)
+        self.adjust_food(colony, food_gathered)
+        self.story(colony, "food", f"Your Torbs gathered {food_gathered} food.")
+
+    def grow_torbs(self, colony):
+        for torb in self.colony_torbs[colony.pk]:
+            if torb.growing:
+                torb.growing = False
+                self.set_action(torb, "gathering", "🌾 Gathering")
+
+    def call_breed_torbs(self, colony):
+        checked_torbs = set()
+        pairs = []
+        for torb in list(self.colony_torbs[colony.pk]):
+            if torb.action != "breeding" or torb.pk in checked_torbs:
+                continue
+            checked_torbs.add(torb.pk)
+            partner = self.torbs.get(torb.context_torb_id)
+            if partner is None:
+                self.set_action(torb, "gathering", "🌾 Gathering")
+                continue
+            checked_torbs.add(partner.pk)
+            pairs.append((torb, partner))
+
+        breedable_pairs = claim_breedable_pairs(pairs, colony.name)
+        genomes = breed_genomes(self.evolution_engine, breedable_pairs, self.rng)
+        for (torb0, torb1), genes in zip(breedable_pairs, genomes):
+            self.touch(torb0)
+            self.touch(torb1)
+            generation = max(torb0.generation, torb1.generation) + 1
+            new_torb = self.new_torb(colony, genes, generation)
+            new_torb.growing = True
+            new_torb.fertile = False
+            new_torb.action = "growing"
+            new_torb.action_desc = "🍼 Growing"
+            self.story(colony, "breeding", f"A new Torb, '{new_torb.name}', was born")
+        for torb0, torb1 in pairs:
+            self.set_action(torb0, "gathering", "🌾 Gathering")
+            self.set_action(torb1, "gathering", "🌾 Gathering")
+
+    def new_torb(self, colony, genes, generation):
+        private_ID, name = colony.take_torb_identity()
+        # IntegerField truncates on save, keep the in-memory value consistent with the stored one
+        max_hp = int(genes['vitality'][0])
+        torb = self.make_torb(colony, private_ID, name, genes, generation, max_hp)
+        self.new_torbs.append(torb)
+        self.colony_torbs[colony.pk].append(torb)
+        return torb
+
+    def rest_torbs(self, colony):
+        for torb in self.colony_torbs[colony.pk]:
+            if torb.action == "resting" and not torb.starving:
+                adjust_amount = round(colony.rest_heal_flat + colony.rest_heal_perc * torb.max_hp)
+                self.adjust_hp(torb, adjust_amount, context="resting")
+
+    def colony_meal(self, colony):
+        living_torbs = [torb for torb in self.colony_torbs[colony.pk] if torb.is_alive]
+        starved_torbs = []
+
+        if colony.food < len(living_torbs):
+            starved_torbs = self.random.sample(living_torbs, len(living_torbs) - colony.food)
+            for torb in starved_torbs:
+                torb.starving = True
+                self.adjust_hp(torb, -1, context="starvation")
+        starved = {id(torb) for torb in starved_torbs}
+        less_food = 0
+        for torb in living_torbs:
+            if id(torb) not in starved:
+                torb.starving = False
+                self.adjust_hp(torb, 1)
+                less_food += 1
+        self.adjust_food(colony, -1 * less_food)
+        self.story(colony, "food", f"Your Torbs ate {less_food} food and {len(starved_torbs)} went hungry.")
+
+    # Army phases
+
+    def army_round(self, colony):
+        army = self.armies.get(colony.army_id)
+        if not army:
+            return
+        for step in (self.purge_soldiers, self.scout_colony, self.attack_colony, self.train_soldiers):
+            with self.timed(step.__name__):
+                step(colony, army)
+        army.scout_target_id = None
+        army.attack_target_id = None
+
+    def purge_soldiers(self, colony, army):
+        for torb in self.colony_torbs[colony.pk]:
+            if torb.action != "soldiering":
+                army_torb = self.army_torb_by_torb.get(torb.pk)
+                if army_torb and army_torb.army_id == army.pk:
+                    self.remove_from_army(army_torb)
+
+    def train_soldiers(self, colony, army):
+        for torb in self.colony_torbs[colony.pk]:
+            if torb.action == "training":
+                torb.trained = True
+                self.set_action(torb, "soldiering", "🏹 Soldiering")
+                army_torb = self.enlist(army, torb)
+                self.army_members[army.pk].append(army_torb)
+                self.army_torb_by_torb[torb.pk] = army_torb
+
+    def scout_colony(self, colony, army):
+        colony_to_scout = self.colonies.get(army.scout_target_id)
+        if not colony_to_scout:
+            return False
+
+        if self.num_soldiers(colony) == 0:
+            self.story(colony, "scout", f"You ordered your Torbs to scout, but without training all they found was {colony.name}.")
+            return False
+
+        if self.num_soldiers(colony_to_scout) == 0:
+            self.discover(colony, colony_to_scout)
+            self.story(colony, "scout", f"Your scout found {colony_to_scout.name} and they reported that it appears undefended.")
+            return True
+
+        enemy_members = self.army_members[colony_to_scout.army_id]
+        ally_members = self.army_members[army.pk]
+        if not enemy_members or not ally_members:
+            return False
+        random_enemy_torb_power = self.random.choice([soldier.power for soldier in enemy_members])
+        random_ally_soldier = self.random.choice(ally_members)
+        random_ally_torb_resilience = random_ally_soldier.resilience
+
+        if random_ally_torb_resilience > random_enemy_torb_power:
+            self.discover(colony, colony_to_scout)
+            self.story(colony, "scout", f"An enemy soldier at {colony_to_scout.name} tried to repell your scout, but {random_ally_soldier.torb.name} was too nimble.")
+            self.story(colony_to_scout, "enemy", f"Your soldiers tried to neutralize a scout from {colony.name}, but they were too quick and got away.")
+            return True
+
+        if self.random.uniform(0, 1) > (random_enemy_torb_power / random_ally_torb_resilience):
+            self.discover(colony, colony_to_scout)
+            self.story(colony, "scout", f"Your scout was lucky and wasn't caught by a soldier at {colony_to_scout.name}.")
+            self.story(colony_to_scout, "enemy", f"An enemy soldier was seen scouting your colony and was too quick to be identified.")
+            return True
+
+        damage_to_take = self.random.randint(0, int(round(random_enemy_torb_power - random_ally_torb_resilience, 0)))
+        if colony_to_scout.pk in self.discovered[colony.pk]:
+            self.story(colony, "scout", f"Your scout was attacked when trying to scout {colony_to_scout.name} and didn't get any new information.")
+        else:
+            self.story(colony, "scout", "Your scout was attacked when trying to scout an unknown colony and didn't get any information.")
+        self.adjust_hp(random_ally_soldier.torb, -1 * damage_to_take, context="an enemy soldier while scouting")
+        if not random_ally_soldier.torb.is_alive:
+            self.story(colony_to_scout, "enemy", f"Your soldiers fended off and killed a scout from {colony.name}.")
+        else:
+            self.story(colony_to_scout, "enemy", f"Your soldiers damaged an enemy scout from {colony.name}, but weren't able to finish the job.")
+        return False
+
+    def attack_colony(self, colony, army):
+        colony_to_attack = self.colonies.get(army.attack_target_id)
+        if not colony_to_attack:
+            return False
+        logger.debug("%s is waging war against %s", colony.name, colony_to_attack.name)
+        if self.num_soldiers(colony) == 0:
+            self.story(colony, "combat", f"You ordered your Torbs to attack, but without training they just bumbled about.")
+            return False
+
+        if self.num_soldiers(colony_to_attack) == 0:
+            won_fight = True
+            self.story(colony, "combat", f"There was no army to defend your attack on {colony_to_attack.name}")
+        else:
+            # Also counted in attack_colony and army_round
+            with self.timed('battle_army'):
+                won_fight = self.battle_army(colony, army, colony_to_attack)
+
+        if won_fight:
+            self.attack_successful(colony, army, colony_to_attack)
+        else:
+            self.story(colony, "combat", f"Your army was defeated in a battle against {colony_to_attack.name}.")
+            self.story(colony_to_attack, "combat", f"We successfully repelled an attack from {colony.name}.")
+        return won_fight
+
+    def battle_army(self, colony, army, enemy_colony):
+        enemy_army = self.armies[enemy_colony.army_id]
+        battle = Battle(
+            BattleSide(army, self.army_members[army.pk], colony.name),
+            BattleSide(enemy_army, self.army_members[enemy_army.pk], enemy_colony.name),
+            self.random)
+        won_fight = battle.fight()
+        for side in (battle.ally, battle.enemy):
+            for army_torb, hp in zip(side.army_torbs, side.hp):
+                if hp > 0 and army_torb.torb.hp != hp:
+                    army_torb.torb.hp = hp
+                    self.touch(army_torb.torb)
+            side.army.morale = side.morale
+        for side, index, context in battle.deaths:
+            torb = side.army_torbs[index].torb
+            self.adjust_hp(torb, -1 * torb.hp, context=context)
+        return won_fight
+
+    def attack_successful(self, colony, army, enemy_colony):
+        stolen_food_amount = 0
+        army_power = round(sum(army_torb.power for army_torb in self.army_members[army.pk]), 2)
+        min_steal_amount = min(enemy_colony.food, round(army_power))
+
+        if enemy_colony.food > min_steal_amount:
+            stolen_food_amount = self.random.randrange(min_steal_amount, enemy_colony.food)
+        else:
+            stolen_food_amount = enemy_colony.food
+        if stolen_food_amount > 0:
+            self.adjust_food(colony, stolen_food_amount)
+            self.adjust_food(enemy_colony, -1 * stolen_food_amount)
+        self.story(colony, "combat", f"Your army had a glorious victory over {enemy_colony.name} and plundered {stolen_food_amount} food.")
+        self.story(enemy_colony, "combat", f"We were ransacked by {colony.name} and they stole {stolen_food_amount} food.")
+
+    # Helpers, what the phases change goes through these and the hooks above
+
+    def num_soldiers(self, colony):
+        return sum(1 for torb in self.colony_torbs[colony.pk] if torb.action == "soldiering" and torb.is_alive)
+
+    def count_torbs(self, colony):
+        # The Colony counters, see COLONY_COUNTERS
+        colony.soldier_count = self.num_soldiers(colony)
+        colony.training_count = sum(1 for torb in self.colony_torbs[colony.pk] if torb.action == "training" and torb.is_alive)
+
+    def set_action(self, torb, action, action_desc, context_torb=None):
+        self.touch(torb)
+        if not torb.is_alive:
+            torb.action = "dead"
+            torb.action_desc = "💀 Dead"
+            return
+
+        if torb.growing:
+            torb.action = "growing"
+            torb.action_desc = "🍼 Growing"
+            return
+
+        # If prior action was breeding, ensure paired torb is also no longer breeding
+        partner = self.torbs.get(torb.context_torb_id)
+        if torb.action == "breeding" and partner and partner.context_torb_id == torb.pk:
+            partner.context_torb_id = None
+            partner.action = "gathering"
+            partner.action_desc = "🌾 Gathering"
+            self.touch(partner)
+
+        torb.action = action
+        torb.action_desc = action_desc
+        torb.context_torb_id = context_torb.pk if context_torb is not None else None
+
+    def adjust_hp(self, torb, adjust_amount, context="an unknown source"):
+        adjust_amount = int(adjust_amount)
+        torb.hp = min(max(0, torb.hp + adjust_amount), torb.max_hp)
+        self.touch(torb)
+        if torb.hp > 0:
+            return
+        torb.is_alive = False
+        torb.fertile = False
+        torb.died_round = self.round_number
+        self.story(self.colonies[torb.colony_id], "death", f"'{torb.name}' (Torb {torb.private_ID}) died from {context}.")
+        self.set_action(torb, "dead", "💀 Dead")
+        army_torb = self.army_torb_by_torb.get(torb.pk)
+        if army_torb:
+            self.remove_from_army(army_torb)
+
+    def adjust_morale(self, army, adjust_amount):
+        army.morale = max(0, min(100, army.morale + adjust_amount))
+
+    def adjust_food(self, colony, adjust_amount):
+        colony.food = max(colony.food + int(adjust_amount), 0)
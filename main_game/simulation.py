@@ -0,0 +1,382 @@
+"""Whole Games played in memory with the RoundRules, without the ORM.
+
+SimGame keeps a Game in plain slotted objects with the attributes of the models and resolves
+its rounds with the same RoundRules as RoundEngine, so thousands of rounds can be played for
+balance tuning and stress tests. check_equivalence() plays saved Games both ways under the same
+seed and reports any difference, see the simulate_games command. Rounds draw from the same
+per-round streams as saved Games, see rng.round_streams, so a saved Game can also be rebuilt
+from its journal of orders, see SimGame.from_journal.
+"""
+import random
+from collections import Counter
+from dataclasses import dataclass, field
+
+import numpy as np
+
+from .rng import founding_random, new_seed, round_streams
+from .rules import (GENOME_DTYPE, RoundRules, combat_stats, decode_genome, enlistment_alleles, genome_genes,
+                    protogenesis_genes, torb_name)
+
+@dataclass(slots=True, eq=False)
+class SimEngine:
+    gene_list: list = field(default_factory=lambda: ["vitality", "sturdiness", "agility", "strength"])
+    random_gene_min: int = 1
+    random_gene_max: int = 10
+    mutation_chance: float = 0.1
+    mutation_dev: float = 0.15
+    alleles_per_gene: int = 2
+
+    @classmethod
+    def from_engine(cls, engine):
+        return cls(
+            gene_list=list(engine.gene_list),
+            random_gene_min=engine.random_gene_min,
+            random_gene_max=engine.random_gene_max,
+            mutation_chance=engine.mutation_chance,
+            mutation_dev=engine.mutation_dev,
+            alleles_per_gene=engine.alleles_per_gene)
+
+@dataclass(slots=True, eq=False)
+class SimTorb:
+    colony_id: int
+    private_ID: int
+    name: str
+    genome_array: np.ndarray
+    gene_list: list
+    generation: int = 0
+    max_hp: int = 5
+    hp: int = 5
+    pk: int = None
+    is_alive: bool = True
+    fertile: bool = True
+    starving: bool = False
+    action: str = 'gathering'
+    action_desc: str = '🌾 Gathering'
+    context_torb_id: int = None
+    growing: bool = False
+    trained: bool = False
+    died_round: int = None
+
+    @property
+    def genes(self):
+        return genome_genes(self.gene_list, self.genome_array)
+
+@dataclass(slots=True, eq=False)
+class SimColony:
+    pk: int
+    name: str
+    army_id: int = None
+    food: int = 5
+    ready: bool = False
+    rest_heal_flat: int = 2
+    rest_heal_perc: float = 0.2
+    gather_rate: float = 1.7
+    soldier_count: int = 0
+    training_count: int = 0
+    next_private_ID: int = 1
+    names_allocated: int = 0
+
+    def take_torb_identity(self):
+        private_ID, name = self.next_private_ID, torb_name(self.pk, self.names_allocated)
+        self.next_private_ID += 1
+        self.names_allocated += 1
+        return private_ID, name
+
+@dataclass(slots=True, eq=False)
+class SimArmy:
+    pk: int
+    colony_id: int
+    morale: int = 100
+    scout_target_id: int = None
+    attack_target_id: int = None
+
+@dataclass(slots=True, eq=False)
+class SimArmyTorb:
+    army_id: int
+    torb_id: int
+    torb: SimTorb
+    active_alleles: dict
+    power: float
+    resilience: float
+
+class SimGame(RoundRules):
+    """A Game kept in memory, see SimGame.new and SimGame.from_game.
+
+    Story texts are counted per type; with record_stories they are also kept as
+    (colony id, type, text) for the round just played. A SimGame with the seed of a saved
+    Game plays its rounds exactly like RoundEngine would.
+    """
+
+    def __init__(self, evolution_engine, round_number=1, seed=None, record_stories=False):
+        super().__init__(round_number)
+        self.evolution_engine = evolution_engine
+        self.seed = seed if seed is not None else new_seed()
+        self.next_torb_id = 1
+        self.story_counts = Counter()
+        self.record_stories = record_stories
+        self.stories = []
+        self.dead_torbs = 0
+
+    @classmethod
+    def new(cls, num_colonies, torbs_per_colony, evolution_engine=None, first_colony_id=1, **kwargs):
+        # A fresh Game like the ones players create
+        game = cls(evolution_engine or SimEngine(), **kwargs)
+        for colony_id in range(first_colony_id, first_colony_id + num_colonies):
+            game.found_colony(SimColony(pk=colony_id, name=f"Colony {colony_id}", army_id=colony_id), torbs_per_colony)
+        return game
+
+    @classmethod
+    def from_journal(cls, game, until_round=None, **kwargs):
+        """Rebuilds a saved Game by replaying its journal, see GameAction.
+
+        The whole journal up to until_round, by default the Game's current round, is read in
+        one query and played in memory: the orders of each round are applied in the order they
+        were accepted, then the round is resolved from the Game's streams. Colonies keep their
+        ids and settings, so the result compares with SimGame.from_game.
+        """
+        from . import cache
+        from .models import Colony, GameAction
+        until_round = game.round_number if until_round is None else until_round
+        sim = cls(SimEngine.from_engine(cache.evolution_engine(game.pk)), 1, game.rng_seed, **kwargs)
+        colonies = {colony.pk: colony for colony in Colony.objects.filter(game=game)}
+        # By round first, the order that ends a round is saved after the round and anything the
+        # next one journals while it resolves, such as the AI colonies readying up
+        journal = (GameAction.objects.filter(game=game, round_number__lte=until_round).order_by('round_number', 'id')
+                   .values_list('round_number', 'colony_id', 'action', 'torbs', 'target'))
+        for round_number, colony_id, action, torbs, target in journal.iterator(chunk_size=2000):
+            while sim.round_number < round_number:
+                sim.play_round()
+            if action == GameAction.FOUND:
+                colony = colonies[colony_id]
+                sim.found_colony(SimColony(
+                    pk=colony.pk, name=colony.name, army_id=colony.army_id, rest_heal_flat=colony.rest_heal_flat,
+                    rest_heal_perc=colony.rest_heal_perc, gather_rate=colony.gather_rate), game.starting_torbs)
+            else:
+                sim.apply_action(colony_id, action, torbs, target)
+        while sim.round_number < until_round:
+            sim.play_round()
+        return sim
+
+    @classmethod
+    def from_game(cls, game, **kwargs):
+        # A copy of a saved Game at its current round, read the same way RoundEngine.load reads it
+        from . import cache
+        from .models import Army, ArmyTorb, Colony, Torb
+        sim = cls(SimEngine.from_engine(cache.evolution_engine(game.pk)), game.round_number, game.rng_seed, **kwargs)
+        gene_list = sim.evolution_engine.gene_list
+        for colony in Colony.objects.filter(game=game).order_by('id'):
+            sim.colonies[colony.pk] = SimColony(
+                pk=colony.pk, name=colony.name, army_id=colony.army_id, food=colony.food, ready=colony.ready,
+                rest_heal_flat=colony.rest_heal_flat, rest_heal_perc=colony.rest_heal_perc, gather_rate=colony.gather_rate,
+                soldier_count=colony.soldier_count, training_count=colony.training_count,
+                next_private_ID=colony.next_private_ID, names_allocated=colony.names_allocated)
+        for army in Army.objects.filter(colony__game=game):
+            sim.armies[army.pk] = SimArmy(
+                pk=army.pk, colony_id=army.colony_id, morale=army.morale,
+                scout_target_id=army.scout_target_id, attack_target_id=army.attack_target_id)
+        for torb in Torb.objects.filter(colony__game=game, is_alive=True).order_by('id'):
+            sim_torb = SimTorb(
+                colony_id=torb.colony_id, private_ID=torb.private_ID, name=torb.name,
+                genome_array=decode_genome(bytes(torb.genome), len(gene_list)), gene_list=gene_list,
+                generation=torb.generation, max_hp=torb.max_hp, hp=torb.hp, pk=torb.pk, is_alive=torb.is_alive,
+                fertile=torb.fertile, starving=torb.starving, action=torb.action, action_desc=torb.action_desc,
+                context_torb_id=torb.context_torb_id, growing=torb.growing, trained=torb.trained)
+            sim.torbs[torb.pk] = sim_torb
+            sim.colony_torbs[torb.colony_id].append(sim_torb)
+            sim.next_torb_id = torb.pk + 1
+        for army_torb in ArmyTorb.objects.filter(army__in=list(sim.armies)).order_by('id'):
+            sim_army_torb = SimArmyTorb(
+                army_id=army_torb.army_id, torb_id=army_torb.torb_id, torb=sim.torbs[army_torb.torb_id],
+                active_alleles=army_torb.active_alleles, power=army_torb.power, resilience=army_torb.resilience)
+            sim.army_members[army_torb.army_id].append(sim_army_torb)
+            sim.army_torb_by_torb[army_torb.torb_id] = sim_army_torb
+        discovered = Colony.discovered_colonies.through.objects.filter(from_colony__game=game)
+        for from_colony_id, to_colony_id in discovered.values_list('from_colony_id', 'to_colony_id'):
+            sim.discovered[from_colony_id].add(to_colony_id)
+        return sim
+
+    def play_round(self):
+        self.stories = []
+        self.random, self.rng = round_streams(self.seed, self.round_number)
+        self.resolve()
+        self.number_new_torbs()
+        self.bury_dead()
+        self.round_number += 1
+
+    def number_new_torbs(self):
+        # Ids in birth order, as bulk_create assigns them, so the next round walks Torbs in the same order
+        for torb in self.new_torbs:
+            torb.pk = self.next_torb_id
+            self.next_torb_id += 1
+            self.torbs[torb.pk] = torb
+        self.new_torbs = []
+
+    def bury_dead(self):
+        # RoundEngine loads the living only, the dead leave the Game once their round is over
+        for colony_id, torbs in self.colony_torbs.items():
+            living = [torb for torb in torbs if torb.is_alive]
+            self.dead_torbs += len(torbs) - len(living)
+            self.colony_torbs[colony_id] = living
+        self.torbs = {pk: torb for pk, torb in self.torbs.items() if torb.is_alive}
+
+    def found_colony(self, colony, starting_torbs):
+        # Like Colony.save for a new Colony, its starting Torbs come from the Game's founding stream
+        self.colonies[colony.pk] = colony
+        self.armies[colony.army_id] = SimArmy(pk=colony.army_id, colony_id=colony.pk)
+        self.discovered[colony.pk].add(colony.pk)
+        rnd = founding_random(self.seed, colony.pk)
+        for _ in range(starting_torbs):
+            self.new_torb(colony, protogenesis_genes(self.evolution_engine, rnd), 0)
+        self.number_new_torbs()
+
+    # Orders
+
+    def apply_action(self, colony_id, action, torbs=(), target=None):
+        # What Player.perform_action does to the Game, without its story texts. Torbs are private_IDs
+        colony = self.colonies[colony_id]
+        army = self.armies[colony.army_id]
+        by_private_ID = {torb.private_ID: torb for torb in self.colony_torbs[colony_id]} if torbs else {}
+        selected = [by_private_ID[private_ID] for private_ID in torbs if private_ID in by_private_ID]
+        if action == 'breed':
+            # Orders naming a dead Torb fail and are never journaled, see Colony.set_breed_torbs
+            torb0, torb1 = selected
+            self.set_action(torb0, "breeding", f"💦 Breeding with {torb1.name}", torb1)
+            self.set_action(torb1, "breeding", f"💦 Breeding with {torb0.name}", torb0)
+        elif action == 'gather':
+            for torb in selected:
+                self.set_action(torb, "gathering", "🌾 Gathering")
+        elif action == 'enlist':
+            for torb in selected:
+                self.set_action(torb, "training", "🎯 Training")
+        elif action == 'scout':
+            if not target:
+                army.scout_target_id = None
+            elif target != colony_id:
+                army.scout_target_id = target
+        elif action == 'attack':
+            # Armies only march on colonies they know, see Army.set_attack_target
+            if not target:
+                army.attack_target_id = None
+            elif target != colony_id and target in self.discovered[colony_id]:
+                army.attack_target_id = target
+        elif action == 'end_turn':
+            colony.ready = True
+        else:
+            raise ValueError(f"Unknown action: {action}")
+        if selected:
+            self.count_torbs(colony)
+
+    def random_orders(self, rnd):
+        # The orders of benchmarks.random_actions, given without a Player
+        colonies = list(self.colonies.values())
+        for colony in colonies:
+            torbs = [torb for torb in self.colony_torbs[colony.pk] if torb.is_alive and not torb.growing and torb.action != "soldiering"]
+            rnd.shuffle(torbs)
+            fertile = [torb for torb in torbs if torb.fertile]
+            if len(fertile) >= 2 and rnd.random() < 0.5:
+                self.apply_action(colony.pk, 'breed', [fertile[0].private_ID, fertile[1].private_ID])
+                torbs = [torb for torb in torbs if torb not in fertile[:2]]
+            num_enlisted = rnd.randrange(0, len(torbs) // 4 + 1)
+            self.apply_action(colony.pk, 'enlist', [torb.private_ID for torb in torbs[:num_enlisted]])
+            self.apply_action(colony.pk, 'gather', [torb.private_ID for torb in torbs[num_enlisted:]])
+
+            others = [other for other in colonies if other.pk != colony.pk]
+            if others and rnd.random() < 0.7:
+                self.apply_action(colony.pk, 'scout', target=rnd.choice(others).pk)
+            if others and rnd.random() < 0.3:
+                self.apply_action(colony.pk, 'attack', target=rnd.choice(others).pk)
+
+    # Hooks, see RoundRules
+
+    def make_torb(self, colony, private_ID, name, genes, generation, max_hp):
+        gene_list = self.evolution_engine.gene_list
+        return SimTorb(
+            colony_id=colony.pk,
+            private_ID=private_ID,
+            name=name,
+            genome_array=np.asarray([genes[gene] for gene in gene_list], dtype=GENOME_DTYPE),
+            gene_list=gene_list,
+            generation=generation,
+            max_hp=max_hp,
+            hp=max_hp)
+
+    def enlist(self, army, torb):
+        active_alleles = enlistment_alleles(torb.genes, self.random)
+        power, resilience = combat_stats(active_alleles)
+        return SimArmyTorb(army_id=army.pk, torb_id=torb.pk, torb=torb, active_alleles=active_alleles, power=power, resilience=resilience)
+
+    def story(self, colony, story_text_type, story_text):
+        self.story_counts[story_text_type] += 1
+        if self.record_stories:
+            self.stories.append((colony.pk, story_text_type, story_text))
+
+    # Results
+
+    def state(self):
+        # Everything a round decides, keyed so that it doesn't depend on database ids of new rows.
+        # Living Torbs only, like RoundEngine the next round never sees the dead
+        private_IDs = {torb.pk: (torb.colony_id, torb.private_ID) for torb in self.torbs.values()}
+        return {
+            'colonies': {colony.pk: (colony.food, colony.ready, colony.soldier_count, colony.training_count,
+                                     colony.next_private_ID, colony.names_allocated)
+                         for colony in self.colonies.values()},
+            'armies': {army.pk: (army.morale, army.scout_target_id, army.attack_target_id,
+                                 [(army_torb.torb.private_ID, army_torb.active_alleles, army_torb.power, army_torb.resilience)
+                                  for army_torb in self.army_members[army.pk]])
+                       for army in self.armies.values()},
+            'torbs': {(torb.colony_id, torb.private_ID): (
+                          torb.name, torb.generation, torb.hp, torb.max_hp, torb.is_alive, torb.fertile, torb.starving,
+                          torb.action, torb.action_desc, private_IDs.get(torb.context_torb_id), torb.growing, torb.trained,
+                          torb.genome_array.tobytes())
+                      for torbs in self.colony_torbs.values() for torb in torbs},
+            'discovered': {colony_id: sorted(discovered) for colony_id, discovered in self.discovered.items() if discovered},
+        }
+
+    def summary(self):
+        living = [torb for torb in self.torbs.values() if torb.is_alive]
+        return {
+            'living_torbs': len(living),
+            'dead_torbs': self.dead_torbs + len(self.torbs) - len(living),
+            'soldiers': sum(len(members) for members in self.army_members.values()),
+            'food': sum(colony.food for colony in self.colonies.values()),
+            'max_generation': max((torb.generation for torb in self.torbs.values()), default=0),
+        }
+
+def state_differences(expected, actual):
+    # Keys of the first state whose values differ in the second, as 'part:key'
+    return [f"{part}:{key}" for part in expected
+            for key in expected[part].keys() | actual[part].keys()
+            if expected[part].get(key) != actual[part].get(key)]
+
+def check_equivalence(game, rounds, seed=0):
+    """Plays rounds of a saved Game with random orders through RoundEngine and SimGame alike.
+
+    Both draw from the Game's streams for the round, afterwards the saved Game is read back and
+    compared with the simulated one, story texts included. seed only picks the orders. Returns
+    one entry per round with the differences found, empty lists mean the engines agree. The Game
+    is changed, so run this on scratch data or in a transaction that is rolled back.
+    """
+    from django.db.models import Max
+    from .benchmarks import random_actions
+    from .models import StoryText
+    from .round_engine import RoundEngine
+
+    rnd = random.Random(seed)
+    results = []
+    for _ in range(rounds):
+        random_actions(game, rnd)
+        game.refresh_from_db()
+
+        sim = SimGame.from_game(game, record_stories=True)
+        sim.play_round()
+
+        last_story_id = StoryText.objects.aggregate(last=Max('id'))['last'] or 0
+        RoundEngine(game).run()
+        stories = list(StoryText.objects.filter(id__gt=last_story_id, colony__game=game).order_by('id')
+                       .values_list('colony_id', 'story_text_type', 'story_text'))
+
+        differences = state_differences(SimGame.from_game(game).state(), sim.state())
+        if stories != sim.stories:
+            differences.append("stories")
+        results.append({'round': sim.round_number - 1, 'differences': differences})
+    return results
@@ -22,6 +22,52 @@ document.addEventListener('DOMContentLoaded', function() {
 });
 
 let isPolling = false;
+let isListening = false;
+
+// Round and ready-up changes are pushed by the server, polling is only a fallback
+function listenForGameEvents() {
+    if (typeof gameEventsUrl === 'undefined' || !window.EventSource) {
+        return false;
+    }
+    const source = new EventSource(gameEventsUrl);
+
+    source.addEventListener('round', event => {
+        const data = JSON.parse(event.data);
+        console.log("Round event received:", data);
+        if (data.round_number !== currentRound) {
+            location.reload();
+        }
+    });
+
+    source.addEventListener('unready', event => {
+        const data = JSON.parse(event.data);
+        const endTurnButton = document.getElementById('endTurnButton');
+        if (endTurnButton && endTurnButton.disabled) {
+            endTurnButton.innerText = `Waiting for ${data.unready} other players...`;
+        }
+    });
+
+    // Streams end every few minutes and the browser reconnects by itself, only give up on
+    // the stream when it can't reconnect
+    let failedConnections = 0;
+    source.onopen = function() {
+        failedConnections = 0;
+    };
+
+    source.onerror = function() {
+        failedConnections += 1;
+        if (source.readyState !== EventSource.CLOSED && failedConnections < 3) {
+            return;
+        }
+        console.error("Lost connection to game events, falling back to polling.");
+        source.close();
+        isListening = false;
+        checkInitialStatus();
+    };
+
+    isListening = true;
+    return true;
+}
 
 function checkReadyStatus() {
     console.log("Checking ready status...");
@@ -51,8 +97,7 @@ function startPolling() {
     }
 }
 
-// Check the initial status when the page loads
-document.addEventListener('DOMContentLoaded', function() {
+function checkInitialStatus() {
     console.log("Checking initial colony status");
     fetch(checkReadyStatusUrl)
         .then(response => response.json())
@@ -67,6 +112,13 @@ document.addEventListener('DOMContentLoaded', function() {
             }
         })
         .catch(error => console.error('Error checking initial ready status:', error));
+}
+
+// Check the initial status when the page loads
+document.addEventListener('DOMContentLoaded', function() {
+    if (!listenForGameEvents()) {
+        checkInitialStatus();
+    }
 });
 
 document.addEventListener('DOMContentLoaded', function() {
@@ -91,9 +143,11 @@ document.addEventListener('DOMContentLoaded', function() {
             endTurnButton.disabled = true;
             endTurnButton.innerText = "Waiting for other players...";
 
-            // Start polling
-            isPolling = false;
-            startPolling();
+            // Start polling unless the server is already pushing events
+            if (!isListening) {
+                isPolling = false;
+                startPolling();
+            }
 
             // Submit the form after setting up everything
             form.submit();
@@ -106,6 +160,77 @@ document.addEventListener('DOMContentLoaded', function() {
     consoleDisplay.scrollTop = consoleDisplay.scrollHeight; // Scroll to the bottom on load
 });
 
+// Pages only render the latest rounds of the log, older entries are fetched a page at a time
+function storyTextEntry(storyText, textSize) {
+    const entry = document.createElement('div');
+    entry.className = 'console-entry';
+    entry.dataset.storyTextId = storyText.id;
+    entry.style.cssText = 'display: flex; width: 100%;';
+
+    const round = document.createElement('div');
+    round.className = 'console-entry-round';
+    round.style.cssText = 'padding-right: 10px; font-size: 1.2em; white-space: nowrap;';
+    const roundSpan = document.createElement('span');
+    roundSpan.textContent = `Y${storyText.game_round}`;
+    round.appendChild(roundSpan);
+
+    const text = document.createElement('div');
+    text.className = 'console-entry-text';
+    text.style.flexGrow = '1';
+    const textP = document.createElement('p');
+    textP.style.cssText = `color: ${storyText.is_new ? '#fff' : '#888'}; margin: 0;`;
+    if (textSize) {
+        textP.style.fontSize = textSize;
+    }
+    textP.textContent = storyText.story_text;
+    text.appendChild(textP);
+
+    entry.appendChild(round);
+    entry.appendChild(text);
+    return entry;
+}
+
+function fetchStoryTexts(before) {
+    const url = new URL(storyTextFeedUrl, window.location.origin);
+    if (before) {
+        url.searchParams.set('before', before);
+    }
+    return fetch(url).then(response => response.json());
+}
+
+function loadOlderStoryTexts() {
+    const consoleDisplay = document.querySelector('.console-display');
+    const loadOlderButton = document.getElementById('loadOlderStoryTexts');
+    const oldest = consoleDisplay.querySelector('.console-entry');
+
+    loadOlderButton.disabled = true;
+    fetchStoryTexts(oldest && oldest.dataset.storyTextId)
+        .then(data => {
+            const previousHeight = consoleDisplay.scrollHeight;
+            const entries = document.createDocumentFragment();
+            data.story_texts.forEach(storyText => entries.appendChild(storyTextEntry(storyText, consoleDisplay.dataset.textSize)));
+            loadOlderButton.after(entries);
+            // Keep the entries the player was reading in place
+            consoleDisplay.scrollTop += consoleDisplay.scrollHeight - previousHeight;
+            if (data.has_more) {
+                loadOlderButton.disabled = false;
+            } else {
+                loadOlderButton.remove();
+            }
+        })
+        .catch(error => {
+            console.error('Error loading older story texts:', error);
+            loadOlderButton.disabled = false;
+        });
+}
+
+document.addEventListener('DOMContentLoaded', function() {
+    const loadOlderButton = document.getElementById('loadOlderStoryTexts');
+    if (loadOlderButton && typeof storyTextFeedUrl !== 'undefined') {
+        loadOlderButton.addEventListener('click', loadOlderStoryTexts);
+    }
+});
+
 // Optionally, you can also scroll to the bottom whenever new content is added
 function scrollToBottom() {
     const consoleDisplay = document.querySelector('.console-display');
@@ -1,3 +1,1268 @@
-from django.test import TestCase
+import io
+import json
+import logging
+import os
+import random
+import tempfile
+import threading
+import time
+from datetime import timedelta
+from types import SimpleNamespace
+from unittest import mock
 
-# Create your tests here.
+import numpy as np
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.db import DatabaseError, connection, transaction
+from django.db.models.functions import Now
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils.timezone import now
+
+from webapp.log_handlers import QueuedFileHandler
+
+from . import ai, cache, events, rng, rules
+from .battle import MAX_EXCHANGES, Battle, BattleSide
+from .benchmarks import random_actions, seed_games, seed_played_games
+from .models import AIPlayer, Army, ArmyTorb, Colony, Game, GameAction, Player, RoundJob, RoundMetrics, StoryText, Torb, TorbArchive
+from .models.evolution_engine import default_gene_list
+from .round_engine import RoundEngine
+from .simulation import SimGame, check_equivalence
+
+
+class PageQueryBudgetTests(TestCase):
+    # Pages must cost the same number of queries however many Torbs, soldiers and log lines exist
+
+    def setUp(self):
+        cache.get_cache().clear()
+        self.user = User.objects.create_user(username="budget", password="budget-pass")
+        self.player = Player.objects.create(user=self.user)
+        self.game = Game.objects.create(description="Budget Game")
+        self.colony = self.new_colony("Budget Colony", self.player)
+        self.enemy = self.new_colony("Enemy Colony", Player.objects.create(name="enemy"))
+        self.colony.discovered_colonies.add(self.enemy)
+        self.client.force_login(self.user)
+
+    def new_colony(self, name, player):
+        colony = Colony.objects.create(name=name, game=self.game)
+        colony.player = player
+        colony.save()
+        return colony
+
+    def grow_colonies(self, num_torbs, num_story_texts):
+        engine = self.game.evolution_engine_instance
+        for colony in (self.colony, self.enemy):
+            for _ in range(num_torbs):
+                engine.protogenesis_torb(colony=colony)
+            for torb in colony.torb_set.all()[:num_torbs // 2]:
+                torb.set_action("soldiering", "🏹 Soldiering")
+                ArmyTorb.add_to_army(colony.army, torb)
+            StoryText.objects.bulk_create([
+                StoryText(colony=colony, story_text=f"Entry {i}", game_round=i % 3)
+                for i in range(num_story_texts)])
+
+    def assertConstantQueries(self, num, url):
+        Colony.objects.filter(pk=self.colony.pk).update(ready=True)
+        for num_torbs, num_story_texts in ((2, 5), (20, 50)):
+            self.grow_colonies(num_torbs, num_story_texts)
+            with self.assertNumQueries(num):
+                self.assertEqual(self.client.get(url).status_code, 200)
+
+    def test_colony_view(self):
+        # session, user, colony, torbs, genomes missing from the cache, story texts, older story texts, unready colonies
+        self.assertConstantQueries(8, reverse('colony_view', args=[self.colony.id]))
+
+    def test_army_view(self):
+        # session, user, colony, known colonies, colonies, army torbs, story texts, older story texts, unready colonies
+        self.assertConstantQueries(9, reverse('army_view', args=[self.colony.id]))
+
+    def test_load_colony(self):
+        # session, user, colonies, games
+        self.assertConstantQueries(4, reverse('load_colony'))
+
+class StoryTextFeedTests(TestCase):
+
+    def setUp(self):
+        self.user = User.objects.create_user(username="reader", password="reader-pass")
+        self.game = Game.objects.create(description="Feed Game", round_number=10)
+        self.colony = Colony.objects.create(name="Feed Colony", game=self.game)
+        self.colony.player = Player.objects.create(user=self.user)
+        self.colony.save()
+        self.colony.storytext_set.all().delete()
+        self.story_texts = StoryText.objects.bulk_create([
+            StoryText(colony=self.colony, story_text=f"Entry {i}", game_round=i // 10)
+            for i in range(110)])
+        self.url = reverse('story_text_feed', args=[self.colony.id])
+        self.client.force_login(self.user)
+
+    def feed(self, **cursors):
+        response = self.client.get(self.url, cursors)
+        self.assertEqual(response.status_code, 200)
+        data = response.json()
+        return [story_text['story_text'] for story_text in data['story_texts']], data['has_more']
+
+    def test_pages_render_recent_rounds(self):
+        response = self.client.get(reverse('colony_view', args=[self.colony.id]))
+        self.assertEqual([story_text.game_round for story_text in response.context['story_texts']], [7] * 10 + [8] * 10 + [9] * 10 + [10] * 10)
+        self.assertContains(response, "Load older entries")
+        self.assertContains(response, "margin: 0; font-size: 1.2em;", count=40)
+
+    def test_no_older_entries(self):
+        StoryText.objects.filter(colony=self.colony, game_round__lt=7).delete()
+        for view in ('colony_view', 'army_view'):
+            response = self.client.get(reverse(view, args=[self.colony.id]))
+            self.assertEqual(len(response.context['story_texts']), 40)
+            self.assertNotContains(response, "Load older entries")
+
+    def test_latest_page(self):
+        self.assertEqual(self.feed(), ([f"Entry {i}" for i in range(60, 110)], True))
+
+    def test_before_cursor(self):
+        self.assertEqual(self.feed(before=self.story_texts[60].id), ([f"Entry {i}" for i in range(10, 60)], True))
+        self.assertEqual(self.feed(before=self.story_texts[10].id), ([f"Entry {i}" for i in range(10)], False))
+
+    def test_after_cursor(self):
+        self.assertEqual(self.feed(after=self.story_texts[100].id), ([f"Entry {i}" for i in range(101, 110)], False))
+        self.assertEqual(self.feed(after=self.story_texts[-1].id), ([], False))
+        # Oldest first, has_more tells the client to ask again from its new last entry
+        self.assertEqual(self.feed(after=self.story_texts[9].id), ([f"Entry {i}" for i in range(10, 60)], True))
+
+    def test_invalid_cursor(self):
+        self.assertEqual(self.client.get(self.url, {'before': 'x'}).status_code, 400)
+        self.assertEqual(self.client.get(self.url, {'after': 'x'}).status_code, 400)
+
+    def test_other_players_colony(self):
+        User.objects.create_user(username="snoop", password="snoop-pass")
+        self.client.login(username="snoop", password="snoop-pass")
+        self.assertEqual(self.client.get(self.url).status_code, 404)
+
+class Formatted:
+    # A log argument that records the threads it was formatted in
+    def __init__(self):
+        self.threads = []
+
+    def __str__(self):
+        self.threads.append(threading.current_thread())
+        return "formatted"
+
+class QueuedFileHandlerTests(TestCase):
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.filename = os.path.join(directory.name, "test.log")
+        self.handler = QueuedFileHandler(self.filename)
+        self.logger = logging.getLogger('hereditus.tests.queued')
+        self.logger.propagate = False
+        self.logger.setLevel(logging.INFO)
+        self.logger.addHandler(self.handler)
+        self.addCleanup(self.logger.removeHandler, self.handler)
+
+    def test_disabled_levels_are_not_formatted(self):
+        argument = Formatted()
+        self.logger.debug("Skipped %s", argument)
+        self.handler.close()
+        self.assertEqual(argument.threads, [])
+        with open(self.filename) as log:
+            self.assertEqual(log.read(), "")
+
+    def test_records_are_formatted_by_the_logging_thread(self):
+        argument = Formatted()
+        self.logger.info("Written %s", argument)
+        self.handler.close()
+        self.assertEqual(argument.threads, [threading.current_thread()])
+        with open(self.filename) as log:
+            self.assertEqual(log.read(), "Written formatted\n")
+
+class BenchRoundsTests(TestCase):
+
+    def test_report(self):
+        stdout = io.StringIO()
+        call_command('bench_rounds', games=1, colonies=2, torbs=4, rounds=2, stdout=stdout)
+        report = json.loads(stdout.getvalue())
+        self.assertEqual(set(report['next_round']), {'ms', 'queries'})
+        self.assertLessEqual(report['next_round']['ms']['p50'], report['next_round']['ms']['p95'])
+        self.assertIn('flush', report['phases'])
+        self.assertIn('colony_view', report)
+        self.assertFalse(Game.objects.exists())
+
+    def test_seeded_games(self):
+        # Founding genes and round rolls come from the Game's rng_seed, runs with one seed roll the same
+        self.assertEqual([game.rng_seed for game in seed_played_games(2, colonies_per_game=1, torbs_per_colony=1, seed=7)], [7, 8])
+        self.assertEqual([game.rng_seed for game in seed_games(2, colonies_per_game=1, torbs_per_colony=1, seed=7)], [7, 8])
+
+class RoundMetricsTests(TestCase):
+
+    def setUp(self):
+        self.game = Game.objects.create(description="Metrics Game")
+        for name in ("North", "South"):
+            Colony.objects.create(name=name, game=self.game)
+
+    def test_next_round_records_phases(self):
+        self.game.next_round()
+        round_metrics = RoundMetrics.objects.get(game=self.game, round_number=1)
+        self.assertEqual(round_metrics.colonies, 2)
+        self.assertIn('army_round', round_metrics.phases)
+        self.assertEqual(round_metrics.phases['load']['queries'], 5)
+        self.assertGreater(round_metrics.phases['flush']['rows'], 0)
+        self.assertGreaterEqual(round_metrics.queries, sum(round_metrics.phases[phase]['queries'] for phase in ('load', 'flush')))
+
+    def test_admin_trends(self):
+        self.game.next_round()
+        self.game.next_round()
+        self.client.force_login(User.objects.create_superuser(username="admin", password="admin-pass"))
+        self.assertEqual(self.client.get(reverse('admin:main_game_game_changelist')).status_code, 200)
+        self.assertEqual(self.client.get(reverse('admin:main_game_game_change', args=[self.game.id])).status_code, 200)
+        self.assertEqual(self.client.get(reverse('admin:main_game_roundmetrics_changelist')).status_code, 200)
+
+class StoryTextBufferTests(TestCase):
+
+    def setUp(self):
+        self.game = Game.objects.create(description="Buffer Game", round_number=7)
+        self.colony = Colony.objects.create(name="Buffer Colony", game=self.game)
+        self.colony.storytext_set.all().delete()
+
+    def test_buffered_writes_once(self):
+        with self.assertNumQueries(2): # round lookup, bulk insert
+            with StoryText.buffered() as buffer:
+                for i in range(20):
+                    StoryText.objects.create(colony_id=self.colony.id, story_text=f"Entry {i}", timestamp=Now())
+                self.assertEqual(len(buffer), 20)
+        self.assertEqual(list(StoryText.objects.order_by('id').values_list('game_round', flat=True)), [7] * 20)
+
+    def test_buffered_round_number(self):
+        with StoryText.buffered(3) as outer, StoryText.buffered() as inner:
+            self.assertIs(inner, outer)
+            StoryText.objects.create(colony=self.colony, story_text="Nested")
+        self.assertEqual(StoryText.objects.get().game_round, 3)
+
+    def test_buffer_dropped_on_error(self):
+        with self.assertRaises(ValueError), StoryText.buffered():
+            StoryText.objects.create(colony=self.colony, story_text="Lost")
+            raise ValueError
+        self.assertFalse(StoryText.objects.exists())
+
+    def test_unbuffered_create(self):
+        with self.assertNumQueries(2): # round lookup, insert
+            StoryText.objects.create(colony_id=self.colony.id, story_text="Single")
+        self.assertEqual(StoryText.objects.get().game_round, 7)
+
+class TorbIdentityTests(TestCase):
+
+    def setUp(self):
+        self.game = Game.objects.create(description="Identity Game", starting_torbs=3)
+        self.colony = Colony.objects.create(name="Identity Colony", game=self.game)
+
+    def test_births_stay_unique(self):
+        genomes = [{gene: [5, 5] for gene in self.game.evolution_engine_instance.gene_list}] * 40
+        for _ in range(3):
+            # savepoint, sequence update, sequence read, release, insert
+            with self.assertNumQueries(5):
+                self.colony.new_torbs(genomes, [1] * len(genomes))
+        torbs = list(self.colony.torb_set.values_list('private_ID', 'name'))
+        self.assertEqual(sorted(private_ID for private_ID, _ in torbs), list(range(1, 124)))
+        self.assertEqual(len({name for _, name in torbs}), 123)
+
+    def test_stale_instances_reserve_separate_ranges(self):
+        other = Colony.objects.get(pk=self.colony.pk)
+        first = self.colony.reserve_torb_identities(5)
+        second = other.reserve_torb_identities(5)
+        self.assertFalse({private_ID for private_ID, _ in first} & {private_ID for private_ID, _ in second})
+        self.assertFalse({name for _, name in first} & {name for _, name in second})
+
+    def test_round_births_continue_sequences(self):
+        torbs = list(self.colony.torb_set.order_by('id'))
+        for torb in torbs[:2]:
+            torb.set_action("breeding", "💦 Breeding", context_torb=torbs[1] if torb == torbs[0] else torbs[0])
+        self.game.next_round()
+        self.colony.refresh_from_db()
+        self.assertEqual(self.colony.next_private_ID, 5)
+        self.assertEqual(self.colony.torb_set.get(private_ID=4).name, self.colony.torb_name(3))
+
+class TorbCounterTests(TestCase):
+
+    def setUp(self):
+        self.game = Game.objects.create(description="Counter Game", starting_torbs=4)
+        self.colony = Colony.objects.create(name="Counter Colony", game=self.game)
+        self.torbs = list(self.colony.torb_set.order_by('id'))
+
+    def assertCountersMatch(self):
+        for colony in Colony.with_counted_torbs(Colony.objects.filter(game=self.game)):
+            self.assertEqual((colony.soldier_count, colony.training_count), (colony.counted_soldiers, colony.counted_training), colony)
+
+    def test_set_action(self):
+        for action in ("training", "soldiering", "training", "gathering"):
+            self.torbs[0].set_action(action, action)
+            self.torbs[1].set_action("soldiering", "🏹 Soldiering")
+            self.assertCountersMatch()
+        self.assertEqual(self.colony.soldier_count, 1)
+
+    def test_set_action_is_atomic(self):
+        with mock.patch.object(Torb, 'update_colony_counters', side_effect=DatabaseError):
+            with self.assertRaises(DatabaseError):
+                self.torbs[0].set_action("training", "🎯 Training")
+        self.assertEqual(Torb.objects.get(pk=self.torbs[0].pk).action, "gathering")
+        self.assertCountersMatch()
+
+    def test_deaths(self):
+        self.torbs[0].set_action("soldiering", "🏹 Soldiering")
+        self.torbs[1].set_action("training", "🎯 Training")
+        for torb in self.torbs[:2]:
+            torb.adjust_hp(-torb.hp, context="a test")
+        self.assertCountersMatch()
+        self.assertEqual((self.colony.soldier_count, self.colony.training_count), (0, 0))
+
+    @override_settings(ASYNC_ROUNDS=False)
+    def test_rounds(self):
+        self.game, = seed_played_games(1, colonies_per_game=3, torbs_per_colony=8)
+        for round_number in range(6):
+            random_actions(self.game, random.Random(round_number))
+            self.assertCountersMatch()
+            self.game.next_round()
+            self.assertCountersMatch()
+
+    def test_check_torb_counters(self):
+        self.torbs[0].set_action("soldiering", "🏹 Soldiering")
+        Colony.objects.filter(pk=self.colony.pk).update(soldier_count=3, training_count=2)
+        stdout = io.StringIO()
+        call_command('check_torb_counters', stdout=stdout)
+        self.assertIn(f"Colony {self.colony.pk} 'Counter Colony': soldiers 3 -> 1, training 2 -> 0", stdout.getvalue())
+        self.assertIn("Found 1 colonies", stdout.getvalue())
+        self.assertEqual(Colony.objects.values_list('soldier_count', 'training_count').get(pk=self.colony.pk), (3, 2))
+
+        stdout = io.StringIO()
+        call_command('check_torb_counters', '--fix', game=self.game.pk, stdout=stdout)
+        self.assertIn("Repaired 1 colonies", stdout.getvalue())
+        self.assertCountersMatch()
+        call_command('check_torb_counters', stdout=stdout)
+        self.assertIn("Found 0 colonies", stdout.getvalue())
+
+class ArmyTotalsTests(TestCase):
+
+    def setUp(self):
+        self.game = Game.objects.create(description="Army Game", starting_torbs=4)
+        self.colony = Colony.objects.create(name="Army Colony", game=self.game)
+        self.army_torbs = [ArmyTorb.add_to_army(self.colony.army, torb) for torb in self.colony.torb_set.all()[:3]]
+
+    def test_stored_stats_match_alleles(self):
+        for army_torb in self.army_torbs:
+            army_torb.refresh_from_db()
+            self.assertEqual((army_torb.power, army_torb.resilience), ArmyTorb.combat_stats(army_torb.active_alleles))
+
+    def test_totals_are_aggregated(self):
+        army = Army.objects.get(pk=self.colony.army.pk)
+        with self.assertNumQueries(3): # one aggregate per total
+            self.assertEqual(army.army_power, round(sum(army_torb.power for army_torb in self.army_torbs), 2))
+            self.assertEqual(army.army_resilience, round(sum(army_torb.resilience for army_torb in self.army_torbs), 2))
+            self.assertEqual(army.army_health, sum(army_torb.torb.hp for army_torb in self.army_torbs))
+
+    def test_with_totals(self):
+        empty = Colony.objects.create(name="Empty Colony", game=self.game)
+        with self.assertNumQueries(1):
+            armies = {army.colony_id: army for army in Army.objects.with_totals()}
+            self.assertEqual(armies[self.colony.pk].army_power, round(sum(army_torb.power for army_torb in self.army_torbs), 2))
+            self.assertEqual((armies[empty.pk].army_power, armies[empty.pk].army_health), (0, 0))
+
+class TopRolls:
+    # Every uniform() roll at its maximum, every pick the first one
+    def uniform(self, a, b):
+        return b
+
+    def randrange(self, start, stop):
+        return start
+
+    def choice(self, items):
+        return items[0]
+
+def battle_side(name, morale, *soldiers):
+    # soldiers are (power, resilience, agility, hp, max_hp), as plain objects like SimGame's
+    army_torbs = [SimpleNamespace(power=power, resilience=resilience, active_alleles={'agility': agility},
+                                  torb=SimpleNamespace(hp=hp, max_hp=max_hp))
+                  for power, resilience, agility, hp, max_hp in soldiers]
+    return BattleSide(SimpleNamespace(morale=morale), army_torbs, name)
+
+class BattleTests(TestCase):
+
+    def test_faster_torb_strikes_first(self):
+        ally = battle_side("Ally", 50, (6, 2, 3, 10, 10))
+        enemy = battle_side("Enemy", 50, (5, 3, 2, 10, 10))
+        battle = Battle(ally, enemy, TopRolls())
+        battle.torb_fight(0, 0)
+        self.assertEqual((ally.hp, enemy.hp), ([7], [7]))
+        # Both lost as much, a draw counts against the attacker
+        self.assertEqual((ally.morale, enemy.morale), (49, 51))
+        self.assertEqual(battle.deaths, [])
+
+    def test_dead_torbs_do_not_strike_back(self):
+        ally = battle_side("Ally", 50, (6, 2, 3, 10, 10))
+        enemy = battle_side("Enemy", 50, (5, 3, 2, 3, 10), (5, 3, 2, 3, 10))
+        battle = Battle(ally, enemy, TopRolls())
+        self.assertTrue(battle.fight())
+        self.assertEqual((ally.hp, enemy.hp), ([10], [0, 0]))
+        self.assertEqual([(side, index) for side, index, context in battle.deaths], [(enemy, 0), (enemy, 1)])
+        self.assertEqual(battle.exchanges, 2)
+        self.assertEqual((ally.morale, enemy.morale), (52, 48))
+
+    def test_low_morale_armies_stay_home(self):
+        ally = battle_side("Ally", 0, (6, 2, 3, 10, 10))
+        enemy = battle_side("Enemy", 50, (5, 3, 2, 3, 10))
+        battle = Battle(ally, enemy, random.Random(0))
+        self.assertFalse(battle.fight())
+        self.assertEqual((battle.exchanges, enemy.hp), (0, [3]))
+
+    def test_harmless_armies_stop_at_the_cap(self):
+        ally = battle_side("Ally", 100, (1, 1, 1, 5, 5))
+        enemy = battle_side("Enemy", 50, (1, 1, 1, 5, 5))
+        battle = Battle(ally, enemy, random.Random(0))
+        self.assertFalse(battle.fight())
+        self.assertEqual(battle.exchanges, MAX_EXCHANGES)
+        self.assertEqual((ally.hp, enemy.hp), ([5], [5]))
+        # Morale stays within 0 and 100
+        self.assertEqual((ally.morale, enemy.morale), (0, 100))
+
+    def test_commit(self):
+        game = Game.objects.create(description="Battle Game", starting_torbs=4, round_number=3)
+        ally_colony, enemy_colony = (Colony.objects.create(name=name, game=game) for name in ("Ally", "Enemy"))
+        for colony in (ally_colony, enemy_colony):
+            for torb in colony.torb_set.all():
+                torb.set_action("soldiering", "🏹 Soldiering")
+                ArmyTorb.add_to_army(colony.army, torb)
+        # The allies can't be hurt and are always faster, every enemy dies at the first real blow
+        for army_torb in ArmyTorb.objects.filter(army__colony__game=game).select_related('army'):
+            strong = army_torb.army.colony_id == ally_colony.pk
+            army_torb.power = army_torb.resilience = 20 if strong else 1
+            army_torb.active_alleles['agility'] = 20 if strong else 1
+            army_torb.save()
+        Torb.objects.filter(colony=enemy_colony).update(hp=1)
+
+        army = Army.objects.select_related('colony__game').get(pk=ally_colony.army.pk)
+        enemy_army = Army.objects.select_related('colony').get(pk=enemy_colony.army.pk)
+        self.assertTrue(army.battle_army(enemy_army))
+
+        self.assertFalse(ArmyTorb.objects.filter(army=enemy_army).exists())
+        self.assertEqual(ArmyTorb.objects.filter(army=army).count(), 4)
+        dead = enemy_colony.torb_set.all()
+        self.assertEqual(set(dead.values_list('is_alive', 'fertile', 'hp', 'action', 'died_round')), {(False, False, 0, "dead", 3)})
+        self.assertEqual(set(ally_colony.torb_set.values_list('is_alive', 'action')), {(True, "soldiering")})
+        self.assertEqual(StoryText.objects.filter(colony=enemy_colony, story_text_type="death").count(), 4)
+        for colony in Colony.with_counted_torbs(Colony.objects.filter(game=game)):
+            self.assertEqual((colony.soldier_count, colony.training_count), (colony.counted_soldiers, colony.counted_training))
+        self.assertEqual(Colony.objects.get(pk=enemy_colony.pk).soldier_count, 0)
+        # The last blow of the battle was a kill
+        self.assertLess(Army.objects.get(pk=enemy_army.pk).morale, 100)
+
+@override_settings(ASYNC_ROUNDS=False)
+class ConcurrentReadyUpTests(TransactionTestCase):
+    # Every colony readies up at once from its own thread, each wave must resolve exactly one round
+
+    def setUp(self):
+        self.game = Game.objects.create(description="Race Game", starting_torbs=2)
+        self.colony_ids = [Colony.objects.create(name=f"Racer {i}", game=self.game).pk for i in range(6)]
+
+    def ready_up(self, colony_id, barrier, errors):
+        try:
+            colony = Colony.objects.select_related('game').get(pk=colony_id)
+            barrier.wait()
+            colony.ready_up()
+        except Exception as e:
+            errors.append(e)
+        finally:
+            connection.close()
+
+    def test_one_round_per_wave(self):
+        if connection.vendor == 'sqlite' and connection.is_in_memory_db():
+            self.skipTest("Threads need a database with real locks, not in-memory SQLite")
+        for wave in range(5):
+            barrier, errors = threading.Barrier(len(self.colony_ids)), []
+            threads = [threading.Thread(target=self.ready_up, args=(colony_id, barrier, errors)) for colony_id in self.colony_ids]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join(timeout=60)
+            self.assertFalse(any(thread.is_alive() for thread in threads), "ready-ups deadlocked")
+            self.assertEqual(errors, [])
+            self.game.refresh_from_db()
+            self.assertEqual(self.game.round_number, wave + 2)
+            self.assertEqual(RoundMetrics.objects.filter(game=self.game).count(), wave + 1)
+            self.assertFalse(Colony.objects.filter(game=self.game, ready=True).exists())
+
+    def test_stale_round_is_skipped(self):
+        stale = Game.objects.get(pk=self.game.pk)
+        self.assertIsNotNone(self.game.next_round())
+        with self.assertNumQueries(3): # begin, claim, commit
+            self.assertIsNone(stale.next_round())
+        self.assertEqual(Game.objects.get(pk=self.game.pk).round_number, 2)
+
+@override_settings(ASYNC_ROUNDS=False)
+class OrderDuringRoundTests(TransactionTestCase):
+    # An order placed while a round runs waits for the round, then applies on top of what it wrote
+
+    def setUp(self):
+        self.game = Game.objects.create(description="Busy Game", starting_torbs=6)
+        self.colony = Colony.objects.create(name="Busy Colony", game=self.game)
+        self.torb_ids = list(self.colony.torb_set.order_by('id').values_list('id', flat=True)[:3])
+
+    def in_thread(self, target, errors):
+        def run():
+            try:
+                target()
+            except Exception as e:
+                errors.append(e)
+            finally:
+                connection.close()
+        thread = threading.Thread(target=run)
+        thread.start()
+        return thread
+
+    def test_order_waits_for_the_round(self):
+        if connection.vendor == 'sqlite':
+            self.skipTest("Needs row locks, SQLite locks the whole database and fails the order instead")
+        loaded, errors = threading.Event(), []
+        resolve = RoundEngine.resolve
+
+        def slow_resolve(engine):
+            # The round holds its locks while the order comes in
+            loaded.set()
+            time.sleep(0.5)
+            resolve(engine)
+
+        with mock.patch.object(RoundEngine, 'resolve', slow_resolve):
+            round_thread = self.in_thread(lambda: Game.objects.get(pk=self.game.pk).next_round(), errors)
+            self.assertTrue(loaded.wait(timeout=30))
+            colony = Colony.objects.get(pk=self.colony.pk)
+            order_thread = self.in_thread(lambda: colony.assign_torbs_action(self.torb_ids, "training", "🎯 Training"), errors)
+            for thread in (round_thread, order_thread):
+                thread.join(timeout=60)
+        self.assertFalse(round_thread.is_alive() or order_thread.is_alive(), "the order deadlocked with the round")
+        self.assertEqual(errors, [])
+
+        self.assertEqual(Game.objects.get(pk=self.game.pk).round_number, 2)
+        self.assertEqual(set(Torb.objects.filter(pk__in=self.torb_ids).values_list('action', flat=True)), {"training"})
+        colony = Colony.with_counted_torbs(Colony.objects.filter(pk=self.colony.pk)).get()
+        self.assertEqual((colony.training_count, colony.soldier_count), (colony.counted_training, colony.counted_soldiers))
+        self.assertEqual(colony.training_count, 3)
+
+class RoundSchedulerTests(TransactionTestCase):
+
+    def setUp(self):
+        self.games = []
+        for i in range(3):
+            game = Game.objects.create(description=f"Scheduled Game {i}", starting_torbs=2)
+            for j in range(2):
+                Colony.objects.create(name=f"Scheduled Colony {i}-{j}", game=game)
+            self.games.append(game)
+        self.idle = Game.objects.create(description="Idle Game", starting_torbs=2)
+        Colony.objects.create(name="Idle Colony", game=self.idle)
+        Colony.objects.filter(game__in=self.games).update(ready=True)
+
+    def test_ready_for_round(self):
+        Game.objects.create(description="Empty Game")
+        self.assertEqual(set(Game.objects.ready_for_round()), set(self.games))
+
+    def test_due_games_resolved_in_parallel(self):
+        if connection.vendor == 'sqlite' and connection.is_in_memory_db():
+            self.skipTest("Worker processes can't reach an in-memory SQLite database")
+        # A Game whose round raises must not hold up the others
+        broken = self.games[0]
+        broken.evolution_engine_instance.delete()
+        stdout, stderr = io.StringIO(), io.StringIO()
+        call_command('run_round_scheduler', processes=2, once=True, stdout=stdout, stderr=stderr)
+        self.assertIn("Resolved 3 rounds", stdout.getvalue())
+        self.assertIn("failed", stderr.getvalue())
+        self.assertEqual(dict(Game.objects.values_list('description', 'round_number')), {
+            "Scheduled Game 0": 1, "Scheduled Game 1": 2, "Scheduled Game 2": 2, "Idle Game": 1})
+        self.assertEqual(dict(RoundJob.objects.values_list('game_id', 'status')), {
+            broken.pk: RoundJob.FAILED, self.games[1].pk: RoundJob.DONE, self.games[2].pk: RoundJob.DONE})
+
+    def test_run_round_worker(self):
+        RoundJob.enqueue_many(self.games)
+        # Left running by a worker that died, the worker picks it up again when it starts
+        RoundJob.objects.filter(game=self.games[1]).update(status=RoundJob.RUNNING, started=now() - timedelta(hours=1))
+        stdout = io.StringIO()
+        call_command('run_round_worker', once=True, stdout=stdout)
+        self.assertEqual(stdout.getvalue().count("finished as done"), 3)
+        self.assertEqual(set(RoundJob.objects.values_list('status', flat=True)), {RoundJob.DONE})
+        self.assertEqual(dict(Game.objects.values_list('description', 'round_number')), {
+            "Scheduled Game 0": 2, "Scheduled Game 1": 2, "Scheduled Game 2": 2, "Idle Game": 1})
+        self.assertFalse(Colony.objects.filter(game__in=self.games, ready=True).exists())
+
+@override_settings(ASYNC_ROUNDS=True)
+class RoundJobTests(TestCase):
+
+    def setUp(self):
+        self.games = []
+        for i in range(2):
+            game = Game.objects.create(description=f"Queued Game {i}", starting_torbs=2)
+            Colony.objects.create(name=f"Queued Colony {i}", game=game)
+            self.games.append(game)
+
+    def ready_up(self, game):
+        for colony in game.colony_set.all():
+            colony.ready_up()
+        return RoundJob.objects.get(game=game, round_number=game.round_number)
+
+    def test_ready_up_queues_once(self):
+        job = self.ready_up(self.games[0])
+        self.assertEqual((job.status, job.round_number), (RoundJob.QUEUED, 1))
+        self.assertEqual(RoundJob.enqueue(self.games[0]), job)
+        self.assertEqual(Game.objects.get(pk=self.games[0].pk).round_number, 1)
+
+    def test_claim_next(self):
+        jobs = [self.ready_up(game) for game in self.games]
+        claimed = [RoundJob.claim_next(), RoundJob.claim_next()]
+        self.assertEqual(claimed, jobs)
+        self.assertEqual({job.status for job in claimed}, {RoundJob.RUNNING})
+        self.assertTrue(all(job.started for job in claimed))
+        self.assertIsNone(RoundJob.claim_next())
+        self.assertIsNone(RoundJob.claim(jobs[0].pk))
+
+    def test_resolved_round_is_skipped(self):
+        job = self.ready_up(self.games[0])
+        self.games[0].next_round()
+        job = RoundJob.claim_next()
+        self.assertEqual(job.run(), RoundJob.SKIPPED)
+        self.assertEqual(Game.objects.get(pk=self.games[0].pk).round_number, 2)
+        self.assertEqual(RoundJob.objects.get(pk=job.pk).status, RoundJob.SKIPPED)
+
+    def test_failed_round_is_queued_again(self):
+        job = self.ready_up(self.games[0])
+        with mock.patch.object(Game, 'next_round', side_effect=RuntimeError("No engine")):
+            self.assertEqual(RoundJob.claim_next().run(), RoundJob.FAILED)
+        self.assertEqual(RoundJob.objects.get(pk=job.pk).error, "No engine")
+        # Not straight away, a round that keeps failing isn't retried on every ready-up
+        self.assertEqual(RoundJob.enqueue(self.games[0]).status, RoundJob.FAILED)
+        RoundJob.objects.filter(pk=job.pk).update(finished=now() - timedelta(minutes=1))
+        job = RoundJob.enqueue(self.games[0])
+        self.assertEqual((job.status, job.error, job.finished), (RoundJob.QUEUED, "", None))
+        self.assertEqual(RoundJob.claim_next().run(), RoundJob.DONE)
+        self.assertEqual(Game.objects.get(pk=self.games[0].pk).round_number, 2)
+
+    def test_stale_jobs_are_queued_again(self):
+        stale, running = [self.ready_up(game) for game in self.games]
+        RoundJob.objects.filter(pk=stale.pk).update(status=RoundJob.RUNNING, started=now() - timedelta(hours=1))
+        RoundJob.objects.filter(pk=running.pk).update(status=RoundJob.RUNNING, started=now())
+        self.assertEqual(RoundJob.requeue_stale(now() - timedelta(minutes=10)), 1)
+        self.assertEqual(dict(RoundJob.objects.values_list('pk', 'status')), {stale.pk: RoundJob.QUEUED, running.pk: RoundJob.RUNNING})
+
+        RoundJob.objects.filter(pk=stale.pk).update(status=RoundJob.RUNNING, started=now() - timedelta(hours=1))
+        RoundJob.enqueue_many(self.games)
+        self.assertEqual(dict(RoundJob.objects.values_list('pk', 'status')), {stale.pk: RoundJob.QUEUED, running.pk: RoundJob.RUNNING})
+
+class RoundDeadlineTests(TestCase):
+
+    def setUp(self):
+        self.game = Game.objects.create(description="Timed Game", starting_torbs=2, round_length=timedelta(hours=1))
+        self.colonies = [Colony.objects.create(name=f"Timed Colony {i}", game=self.game) for i in range(2)]
+        Colony.objects.filter(pk=self.colonies[0].pk).update(ready=True)
+
+    def test_deadline_follows_round_length(self):
+        self.assertAlmostEqual(self.game.round_deadline, now() + timedelta(hours=1), delta=timedelta(minutes=1))
+        self.assertIsNone(Game.objects.create(description="Untimed Game").round_deadline)
+        Game.objects.filter(pk=self.game.pk).update(round_deadline=now() - timedelta(hours=1))
+        self.game.refresh_from_db()
+        self.game.next_round()
+        self.assertGreater(Game.objects.get(pk=self.game.pk).round_deadline, now() + timedelta(minutes=59))
+
+    def test_ticker_queues_overdue_games(self):
+        Game.objects.filter(pk=self.game.pk).update(round_deadline=now() - timedelta(seconds=1))
+        waiting = Game.objects.create(description="Waiting Game", round_length=timedelta(hours=1))
+        Colony.objects.create(name="Waiting Colony", game=waiting)
+        stdout = io.StringIO()
+        call_command('run_round_ticker', once=True, stdout=stdout)
+        self.assertIn("Queued 1 overdue rounds", stdout.getvalue())
+        self.assertFalse(self.game.colony_set.filter(ready=False).exists())
+        self.assertTrue(waiting.colony_set.filter(ready=False).exists())
+        self.assertEqual(list(RoundJob.objects.values_list('game_id', 'round_number')), [(self.game.pk, 1)])
+        self.assertEqual(StoryText.objects.filter(colony=self.colonies[1], story_text__startswith="Time ran out").count(), 1)
+        self.assertFalse(StoryText.objects.filter(colony=self.colonies[0], story_text__startswith="Time ran out").exists())
+
+class GameEventTests(TestCase):
+
+    def setUp(self):
+        self.broker = events.GameEventBroker(poll_interval=0.01)
+
+    def test_publish_fans_out(self):
+        with mock.patch.object(self.broker, 'watch'):
+            first, second, other = self.broker.subscribe(1), self.broker.subscribe(1), self.broker.subscribe(2)
+        self.broker.publish(1, 'round', {'round_number': 2})
+        message = 'event: round\ndata: {"round_number": 2}\n\n'
+        self.assertEqual((first.get_nowait(), second.get_nowait()), (message, message))
+        self.assertTrue(other.empty())
+        # Unchanged events are not sent again
+        self.broker.publish_if_changed(1, 'round', {'round_number': 2})
+        self.assertTrue(first.empty())
+
+    def test_stream(self):
+        with mock.patch.object(self.broker, 'watch'):
+            stream = self.broker.stream(1, events.game_events_for(3, 1), lifetime=60)
+            self.assertEqual(next(stream), f"retry: {events.RETRY_MS}\n\n")
+        self.assertEqual([next(stream), next(stream)], [
+            'event: round\ndata: {"round_number": 3}\n\n',
+            'event: unready\ndata: {"unready": 1}\n\n'])
+        self.broker.publish(1, 'unready', {'unready': 0})
+        self.assertEqual(next(stream), 'event: unready\ndata: {"unready": 0}\n\n')
+        stream.close()
+        self.assertEqual(self.broker.subscribers, {})
+
+    def test_stream_ends(self):
+        with mock.patch.object(self.broker, 'watch'), mock.patch.object(events, 'KEEPALIVE_SECONDS', 0.01):
+            messages = list(self.broker.stream(1, lifetime=0.05))
+        self.assertEqual(messages[0], f"retry: {events.RETRY_MS}\n\n")
+        self.assertGreater(len(messages), 1)
+        self.assertEqual(set(messages[1:]), {": keepalive\n\n"})
+        self.assertEqual(self.broker.subscribers, {})
+
+    def test_check_games(self):
+        game = Game.objects.create(description="Event Game", starting_torbs=1)
+        colony = Colony.objects.create(name="Event Colony", game=game)
+        with mock.patch.object(self.broker, 'watch'):
+            subscriber = self.broker.subscribe(game.pk)
+        with self.assertNumQueries(1):
+            self.broker.check_games()
+        self.assertEqual([subscriber.get_nowait(), subscriber.get_nowait()], [
+            'event: round\ndata: {"round_number": 1}\n\n',
+            'event: unready\ndata: {"unready": 1}\n\n'])
+        self.broker.check_games()
+        self.assertTrue(subscriber.empty())
+        Colony.objects.filter(pk=colony.pk).update(ready=True)
+        self.broker.check_games()
+        self.assertEqual(subscriber.get_nowait(), 'event: unready\ndata: {"unready": 0}\n\n')
+        self.assertTrue(subscriber.empty())
+
+    def test_watcher_stops_without_subscribers(self):
+        with mock.patch.object(events, 'game_states', return_value={1: events.game_events_for(2, 0)}):
+            subscriber = self.broker.subscribe(1)
+            watcher = self.broker.watcher
+            self.assertEqual(subscriber.get(timeout=5), 'event: round\ndata: {"round_number": 2}\n\n')
+            self.broker.unsubscribe(1, subscriber)
+            watcher.join(timeout=5)
+        self.assertFalse(watcher.is_alive())
+        self.assertIsNone(self.broker.watcher)
+
+    def test_watcher_stops_under_the_lock(self):
+        # A subscribe() that takes the lock right after the watcher found nobody listening must
+        # not see that watcher as running, or it never starts a new one
+        broker, leaving = self.broker, []
+
+        class RecordingLock:
+            def __init__(self):
+                self.lock = threading.Lock()
+
+            def __enter__(self):
+                self.lock.acquire()
+
+            def __exit__(self, *exc_info):
+                if not broker.subscribers:
+                    leaving.append(broker.watcher is threading.current_thread())
+                self.lock.release()
+
+        broker.lock = RecordingLock()
+        with mock.patch.object(events, 'game_states', return_value={}):
+            subscriber = broker.subscribe(1)
+            watcher = broker.watcher
+            broker.unsubscribe(1, subscriber)
+            watcher.join(timeout=5)
+        self.assertFalse(watcher.is_alive())
+        self.assertTrue(leaving)
+        self.assertNotIn(True, leaving)
+
+    def test_view(self):
+        user = User.objects.create_user(username="listener", password="listener-pass")
+        game = Game.objects.create(description="Event Game", starting_torbs=1)
+        Colony.objects.create(name="Event Colony", game=game, player=Player.objects.create(user=user))
+        self.client.force_login(User.objects.create_user(username="outsider", password="outsider-pass"))
+        self.assertEqual(self.client.get(reverse('game_events', args=[game.pk])).status_code, 404)
+
+        self.client.force_login(user)
+        with mock.patch.object(events, 'game_events', self.broker), mock.patch.object(self.broker, 'watch'):
+            response = self.client.get(reverse('game_events', args=[game.pk]))
+            self.assertEqual(response['Content-Type'], 'text/event-stream')
+            content = iter(response.streaming_content)
+            self.assertEqual([next(content), next(content)], [
+                f"retry: {events.RETRY_MS}\n\n".encode(), b'event: round\ndata: {"round_number": 1}\n\n'])
+            response.close()
+        self.assertEqual(self.broker.subscribers, {})
+
+class ReadThroughCacheTests(TestCase):
+
+    def setUp(self):
+        cache.get_cache().clear()
+        cache.cache_stats.reset()
+        self.game = Game.objects.create(description="Cached Game", starting_torbs=3)
+        self.colony = Colony.objects.create(name="Cached Colony", game=self.game)
+
+    def test_genomes(self):
+        genes = {torb.pk: torb.genes for torb in self.colony.torb_set.all()}
+        with self.assertNumQueries(2): # torbs, genomes
+            torbs = cache.attach_genomes(list(self.colony.torb_set.defer('genome')))
+        with self.assertNumQueries(1): # torbs
+            cache.attach_genomes(list(self.colony.torb_set.defer('genome')))
+        self.assertEqual({torb.pk: torb.genes for torb in torbs}, genes)
+        self.assertEqual(cache.stats()[cache.GENOME], {'hits': 3, 'misses': 3, 'hit_rate': 0.5})
+
+    def test_engine_invalidated_on_save(self):
+        self.assertEqual(cache.evolution_engine(self.game.pk).mutation_chance, 0.1)
+        with self.assertNumQueries(0):
+            cache.evolution_engine(self.game.pk)
+        engine = self.game.evolution_engine_instance
+        engine.mutation_chance = 0.5
+        engine.save()
+        self.assertEqual(cache.evolution_engine(self.game.pk).mutation_chance, 0.5)
+
+    def test_round_invalidated_on_advance(self):
+        self.assertEqual(cache.colony_round(self.colony.pk), 1)
+        with self.assertNumQueries(0):
+            cache.colony_round(self.colony.pk)
+        self.game.next_round()
+        self.assertEqual(cache.colony_round(self.colony.pk), 2)
+
+    def test_writes_read_the_round_from_the_database(self):
+        # A round resolved by run_round_worker, this process still has the old round cached
+        self.assertEqual(cache.colony_round(self.colony.pk), 1)
+        Game.objects.filter(pk=self.game.pk).update(round_number=4)
+        self.assertEqual(cache.colony_round(self.colony.pk), 1)
+
+        self.assertEqual(StoryText.objects.create(colony=self.colony, story_text="Unbuffered").game_round, 4)
+        with StoryText.buffered():
+            buffered = StoryText.objects.create(colony=self.colony, story_text="Buffered")
+        self.assertEqual(buffered.game_round, 4)
+        torb = self.colony.torb_set.first()
+        torb.adjust_hp(-torb.hp, context="a test")
+        self.assertEqual(Torb.objects.get(pk=torb.pk).died_round, 4)
+
+    def test_stats_view(self):
+        cache.colony_round(self.colony.pk)
+        self.client.force_login(User.objects.create_user(username="player", password="player-pass"))
+        self.assertEqual(self.client.get(reverse('cache_stats')).status_code, 302)
+        self.client.force_login(User.objects.create_superuser(username="admin", password="admin-pass"))
+        self.assertEqual(self.client.get(reverse('cache_stats')).json()[cache.COLONY_GAME], {'hits': 0, 'misses': 1, 'hit_rate': 0.0})
+
+class GenomeStorageTests(TestCase):
+
+    def setUp(self):
+        self.game = Game.objects.create(description="Genome Game", starting_torbs=2)
+        self.colony = Colony.objects.create(name="Genome Colony", game=self.game)
+        self.genes = {'vitality': [5.0, 7.25], 'sturdiness': [1.0, 9.5], 'agility': [3.3074, 4.0], 'strength': [2.0, 8.125]}
+
+    def test_round_trip(self):
+        torb = self.colony.new_torb(self.genes, generation=1)
+        self.assertEqual(len(torb.genome), 4 * 2 * 4)
+        torb = self.colony.torb_set.get(pk=torb.pk)
+        self.assertEqual(torb.genes, self.genes)
+        self.assertEqual(list(torb.genes), self.game.evolution_engine_instance.gene_list)
+
+    def test_array_is_a_view(self):
+        torb = self.colony.new_torb(self.genes, generation=1)
+        array = torb.genome_array
+        self.assertEqual(array.shape, (4, 2))
+        self.assertFalse(array.flags.owndata)
+        self.assertAlmostEqual(float(array[3, 1]), 8.125)
+
+    def test_genes_setter(self):
+        torb = self.colony.torb_set.first()
+        torb.genes = self.genes
+        torb.save()
+        self.assertEqual(self.colony.torb_set.get(pk=torb.pk).genes['strength'], [2.0, 8.125])
+
+def parent(*alleles, num_genes=4):
+    # A plain Torb with the same alleles for every gene
+    return SimpleNamespace(genome_array=np.array([alleles] * num_genes, dtype=float))
+
+class BreedingTests(TestCase):
+
+    def setUp(self):
+        self.engine = SimpleNamespace(mutation_chance=0.0, mutation_dev=0.15, gene_list=default_gene_list())
+
+    def breed(self, pairs, seed=0):
+        return rules.breed_genomes(self.engine, pairs, np.random.default_rng(seed))
+
+    def test_same_seed_same_children(self):
+        self.engine.mutation_chance = 0.5
+        pairs = [(parent(2, 4, 6), parent(10, 20, 30)), (parent(1, 9), parent(3, 3))]
+        self.assertEqual(self.breed(pairs, seed=3), self.breed(pairs, seed=3))
+        self.assertNotEqual(self.breed(pairs, seed=3), self.breed(pairs, seed=4))
+
+    def test_inheritance(self):
+        # One allele is a parent's own, the others the average of one allele from each parent
+        children = self.breed([(parent(2, 2, 2), parent(8, 8, 8))] * 200)
+        for genes in children:
+            self.assertEqual(list(genes), default_gene_list())
+            for alleles in genes.values():
+                self.assertIn(sorted(alleles), ([2, 5, 5], [5, 5, 8]))
+        first_alleles = [min(alleles) == 2 for genes in children for alleles in genes.values()]
+        self.assertAlmostEqual(sum(first_alleles) / len(first_alleles), 0.5, delta=0.05)
+
+    def test_alleles_are_at_least_one(self):
+        self.assertEqual(self.breed([(parent(0.5, 0.5), parent(0.25, 0.5))]), [{gene: [1.0, 1.0] for gene in default_gene_list()}])
+
+    def test_children_have_the_fewer_alleles(self):
+        [genes] = self.breed([(parent(4, 4, 4), parent(6, 6))])
+        self.assertEqual({len(alleles) for alleles in genes.values()}, {2})
+
+    def test_alleles_are_counted_per_pair(self):
+        # A pair with fewer alleles, e.g. after alleles_per_gene changed, leaves the others' children alone
+        pairs = [(parent(3, 3, 3), parent(5, 5, 5)), (parent(3, 3), parent(5, 5)), (parent(2, 2, 2), parent(8, 8, 8, 8))]
+        children = self.breed(pairs)
+        self.assertEqual([{len(alleles) for alleles in genes.values()} for genes in children], [{3}, {2}, {3}])
+        for alleles in children[0].values():
+            self.assertIn(sorted(alleles), ([3, 4, 4], [4, 4, 5]))
+        for alleles in children[2].values():
+            self.assertIn(sorted(alleles), ([2, 5, 5], [5, 5, 8]))
+
+    def test_mutation(self):
+        # Mutated alleles are scaled by 1 + N(0, mutation_dev) and rounded to 4 decimals
+        self.engine.mutation_chance = 0.25
+        children = self.breed([(parent(5, 5, 5), parent(5, 5, 5))] * 200)
+        alleles = np.array([allele for genes in children for gene_alleles in genes.values() for allele in gene_alleles])
+        mutated = alleles[alleles != 5]
+        self.assertAlmostEqual(len(mutated) / len(alleles), 0.25, delta=0.03)
+        self.assertTrue(np.array_equal(mutated, np.round(mutated, 4)))
+        self.assertAlmostEqual(float(np.std(mutated / 5 - 1)), 0.15, delta=0.02)
+
+    def test_breed_pairs(self):
+        game = Game.objects.create(description="Breeding Game", starting_torbs=5)
+        colony = Colony.objects.create(name="Breeding Colony", game=game)
+        torbs = list(colony.torb_set.order_by('id'))
+        engine = game.evolution_engine_instance
+        # The last pair reuses a parent, it has already bred this round
+        pairs = [(torbs[0], torbs[1]), (torbs[2], torbs[3]), (torbs[4], torbs[0])]
+        with CaptureQueriesContext(connection) as queries:
+            babies = engine.breed_pairs(colony, pairs, rng=np.random.default_rng(1))
+        self.assertEqual(len([query for query in queries if query['sql'].startswith('INSERT INTO "main_game_torb"')]), 1)
+        self.assertEqual(len(babies), 2)
+
+        genomes = engine.breed_genomes(pairs[:2], rng=np.random.default_rng(1))
+        for baby, genes in zip(Torb.objects.filter(pk__in=[baby.pk for baby in babies]).order_by('private_ID'), genomes):
+            self.assertEqual(baby.genes, {gene: np.float32(alleles).astype(float).round(4).tolist() for gene, alleles in genes.items()})
+            self.assertEqual((baby.generation, baby.growing, baby.fertile, baby.action), (1, True, False, "growing"))
+        self.assertEqual(set(colony.torb_set.filter(pk__in=[torb.pk for torb in torbs[:4]]).values_list('fertile', flat=True)), {False})
+        self.assertTrue(colony.torb_set.get(pk=torbs[4].pk).fertile)
+
+class RowByRowEngine(RoundEngine):
+    # The same rules, but every row the round loaded or made is written with its own save(), the
+    # way rounds were written before RoundEngine. Catches a change the bulk writes leave out.
+
+    def flush(self):
+        for torb in [*self.torbs.values(), *self.new_torbs]:
+            torb.save()
+        for army_torb in self.removed_army_torbs:
+            if army_torb.pk:
+                army_torb.delete()
+        for members in self.army_members.values():
+            for army_torb in members:
+                if army_torb.pk is None:
+                    army_torb.save()
+        for army in self.armies.values():
+            army.save()
+        for colony in self.colonies.values():
+            colony.save()
+        for discovery in self.new_discoveries:
+            discovery.save()
+        # StoryText.save() would look the round up again, the buffer already set it
+        for story_text in self.story_texts.story_texts:
+            StoryText.objects.bulk_create([story_text])
+
+def round_outcome(game):
+    # Everything a round writes, without ids and timestamps
+    return {
+        'torbs': list(Torb.objects.filter(colony__game=game).order_by('colony_id', 'private_ID').values_list(
+            'colony_id', 'private_ID', 'name', 'genome', 'generation', 'max_hp', 'hp', 'is_alive', 'fertile', 'starving',
+            'action', 'action_desc', 'context_torb__private_ID', 'growing', 'trained', 'died_round')),
+        'colonies': list(Colony.objects.filter(game=game).order_by('id').values_list(
+            'id', 'food', 'ready', 'soldier_count', 'training_count', 'next_private_ID', 'names_allocated')),
+        'armies': list(Army.objects.filter(colony__game=game).order_by('id').values_list('id', 'morale', 'scout_target', 'attack_target')),
+        'army_torbs': list(ArmyTorb.objects.filter(army__colony__game=game).order_by('army_id', 'torb__private_ID').values_list(
+            'army_id', 'torb__private_ID', 'active_alleles', 'power', 'resilience')),
+        'discovered': list(Colony.discovered_colonies.through.objects.filter(from_colony__game=game).order_by(
+            'from_colony_id', 'to_colony_id').values_list('from_colony_id', 'to_colony_id')),
+        'story_texts': list(StoryText.objects.filter(colony__game=game).order_by('id').values_list(
+            'colony_id', 'story_text_type', 'story_text', 'game_round')),
+    }
+
+class RoundEngineTests(TestCase):
+
+    def setUp(self):
+        cache.get_cache().clear()
+
+    def play(self, game, engine_class, rounds):
+        for round_number in range(rounds):
+            random_actions(game, random.Random(round_number))
+            self.assertTrue(engine_class(game).run())
+        return round_outcome(game)
+
+    def test_matches_row_by_row_writes(self):
+        game, = seed_played_games(1, colonies_per_game=3, torbs_per_colony=8)
+        outcomes = []
+        for engine_class in (RoundEngine, RowByRowEngine):
+            with transaction.atomic():
+                game.refresh_from_db()
+                outcomes.append(self.play(game, engine_class, rounds=4))
+                transaction.set_rollback(True)
+        bulk, row_by_row = outcomes
+        self.assertTrue(bulk['army_torbs'])
+        self.assertIn('breeding', {story_text[1] for story_text in bulk['story_texts']})
+        for key in bulk:
+            self.assertEqual(bulk[key], row_by_row[key], key)
+
+    def test_queries_do_not_grow_with_torbs(self):
+        # savepoint, claim, colonies, armies, Torbs, ArmyTorbs, discoveries, at most one write each for
+        # Torbs updated and born, ArmyTorbs removed and enlisted, armies, colonies, discoveries and
+        # StoryTexts, the RoundMetrics and the release
+        for torbs_per_colony in (5, 30):
+            game, = seed_played_games(1, colonies_per_game=2, torbs_per_colony=torbs_per_colony)
+            random_actions(game, random.Random(0))
+            with CaptureQueriesContext(connection) as queries:
+                self.assertTrue(RoundEngine(game).run())
+            self.assertLessEqual(len(queries), 17, torbs_per_colony)
+
+class SimulationTests(TestCase):
+
+    def test_matches_round_engine(self):
+        game, = seed_played_games(1, colonies_per_game=3, torbs_per_colony=6)
+        results = check_equivalence(game, rounds=8, seed=1)
+        self.assertEqual([result['round'] for result in results], list(range(1, 9)))
+        self.assertEqual([result for result in results if result['differences']], [])
+        self.assertEqual(game.round_number, 9)
+
+    def test_differences_are_reported(self):
+        game, = seed_played_games(1, colonies_per_game=2, torbs_per_colony=4)
+        with mock.patch.object(SimGame, 'gather_phase', lambda self, colony: None):
+            results = check_equivalence(game, rounds=1)
+        self.assertIn("stories", results[0]['differences'])
+        self.assertTrue(any(difference.startswith("colonies:") for difference in results[0]['differences']))
+
+    def test_simulate_games(self):
+        stdout = io.StringIO()
+        call_command('simulate_games', games=2, colonies=3, torbs=5, rounds=10, stdout=stdout)
+        report = json.loads(stdout.getvalue())
+        self.assertEqual(report['story_texts']['system'], 2 * 3 * 10)
+        self.assertGreater(report['rounds_per_second'], 0)
+        self.assertNotIn('equivalence', report)
+        self.assertFalse(Game.objects.exists())
+
+class RoundStreamTests(TestCase):
+
+    def test_streams_are_keyed_by_seed_and_round(self):
+        def draws(seed, round_number):
+            rnd, generator = rng.round_streams(seed, round_number)
+            items = list(range(20))
+            rnd.shuffle(items)
+            return items, rnd.uniform(1, 5), rnd.getrandbits(100), generator.normal(0, 1, 3).tolist()
+        self.assertEqual(draws(7, 3), draws(7, 3))
+        self.assertNotEqual(draws(7, 3), draws(7, 4))
+        self.assertNotEqual(draws(7, 3), draws(8, 3))
+
+    def test_round_replays_exactly(self):
+        game, = seed_played_games(1, colonies_per_game=3, torbs_per_colony=6)
+        for _ in range(3):
+            random_actions(game, random.Random(0))
+            game.next_round()
+        random_actions(game, random.Random(1))
+        states = []
+        for _ in range(2):
+            with transaction.atomic():
+                game.refresh_from_db()
+                self.assertTrue(RoundEngine(game).run())
+                states.append(SimGame.from_game(game).state())
+                transaction.set_rollback(True)
+            # Other draws from the global random module don't touch the Game's streams
+            random.random()
+        self.assertEqual(states[0], states[1])
+
+    def test_games_get_their_own_seeds(self):
+        games = [Game.objects.create(description=f"Seeded Game {i}") for i in range(2)]
+        self.assertNotEqual(games[0].rng_seed, games[1].rng_seed)
+
+@override_settings(ASYNC_ROUNDS=False)
+class GameJournalTests(TestCase):
+
+    def setUp(self):
+        self.game, = seed_played_games(1, colonies_per_game=2, torbs_per_colony=4)
+        self.colony, self.enemy = self.game.colony_set.select_related('player').order_by('id')
+
+    def test_orders_are_journaled(self):
+        torbs = list(self.colony.torb_set.order_by('private_ID'))
+        player = self.colony.player
+        player.perform_action(colony=self.colony, action='breed', torb_ids=[torbs[1].id, torbs[0].id])
+        player.perform_action(colony=self.colony, action='enlist', torb_ids=[str(torbs[2].id), self.enemy.torb_set.first().id])
+        player.perform_action(colony=self.colony, action='scout', target_colony_id=str(self.enemy.id))
+        with self.assertRaises(ValueError):
+            player.perform_action(colony=self.colony, action='dance')
+        player.perform_action(colony=self.colony, action='end_turn')
+        self.enemy.player.perform_action(colony=self.enemy, action='end_turn')
+
+        self.game.refresh_from_db()
+        self.assertEqual(self.game.round_number, 2)
+        self.assertEqual(
+            list(self.game.actions.order_by('id').values_list('round_number', 'colony_id', 'action', 'torbs', 'target')), [
+                (1, self.colony.id, GameAction.FOUND, [], None),
+                (1, self.enemy.id, GameAction.FOUND, [], None),
+                (1, self.colony.id, GameAction.BREED, [2, 1], None),
+                (1, self.colony.id, GameAction.ENLIST, [3], None),
+                (1, self.colony.id, GameAction.SCOUT, [], self.enemy.id),
+                (1, self.colony.id, GameAction.END_TURN, [], None),
+                (1, self.enemy.id, GameAction.END_TURN, [], None),
+            ])
+        with self.assertRaises(ValueError):
+            self.game.actions.first().save()
+
+    def test_replay_matches_saved_game(self):
+        rnd = random.Random(2)
+        for _ in range(6):
+            random_actions(self.game, rnd)
+            for colony in (self.colony, self.enemy):
+                colony.player.perform_action(colony=colony, action='end_turn')
+        random_actions(self.game, rnd)
+        self.game.refresh_from_db()
+        self.assertEqual(self.game.round_number, 7)
+
+        replayed = SimGame.from_journal(self.game)
+        self.assertEqual(replayed.round_number, 7)
+        self.assertEqual(replayed.state(), SimGame.from_game(self.game).state())
+        self.assertEqual(SimGame.from_journal(self.game, until_round=3).round_number, 3)
+
+        stdout = io.StringIO()
+        call_command('replay_game', self.game.id, check=True, stdout=stdout)
+        report = json.loads(stdout.getvalue())
+        self.assertEqual((report['round'], report['differences']), (7, []))
+
+    def test_breeding_partners_ordered_together(self):
+        # Both Torbs come from one query, the second must not undo the first one's new order
+        torbs = list(self.colony.torb_set.order_by('private_ID')[:2])
+        self.colony.set_breed_torbs([torbs[0].id, torbs[1].id])
+        self.colony.assign_torbs_action([torb.id for torb in torbs], "training", "🎯 Training")
+        self.assertEqual(set(self.colony.torb_set.filter(pk__in=[torb.id for torb in torbs]).values_list('action', flat=True)), {"training"})
+        self.colony.refresh_from_db()
+        self.assertEqual(self.colony.training_count, 2)
+
+@override_settings(ASYNC_ROUNDS=False)
+class AIPlayerTests(TestCase):
+
+    def setUp(self):
+        # Torb ids come back after each test's rollback, cached genomes would not
+        cache.get_cache().clear()
+        self.game, = seed_played_games(1, colonies_per_game=1, torbs_per_colony=6)
+        self.human, = self.game.colony_set.select_related('player')
+        self.ai_colonies = [AIPlayer.found_colony(self.game, f"AI Colony {i}") for i in range(2)]
+
+    def test_ai_colonies_play_before_the_round(self):
+        self.assertEqual(self.game.unready_colonies, 1)
+        self.assertFalse(Game.objects.ready_for_round().exists())
+        self.human.player.perform_action(colony=self.human, action='end_turn')
+
+        self.game.refresh_from_db()
+        self.assertEqual(self.game.round_number, 2)
+        ai_actions = GameAction.objects.filter(colony__in=self.ai_colonies)
+        self.assertTrue(ai_actions.filter(round_number=1, action=GameAction.ENLIST).exists())
+        self.assertTrue(ai_actions.filter(round_number=1, action=GameAction.SCOUT).exists())
+        # Ready again for the new round, the human is the one left to ready up
+        self.assertEqual(ai_actions.filter(round_number=2, action=GameAction.END_TURN).count(), 2)
+        self.assertEqual(list(self.game.colony_set.filter(ready=False)), [self.human])
+        self.assertEqual(SimGame.from_journal(self.game).state(), SimGame.from_game(self.game).state())
+
+    def test_stale_round_issues_no_orders(self):
+        stale = Game.objects.get(pk=self.game.pk)
+        self.assertIsNotNone(self.game.next_round())
+        actions = GameAction.objects.count()
+        self.assertIsNone(stale.next_round())
+        self.assertEqual(GameAction.objects.count(), actions)
+        self.assertFalse(RoundMetrics.objects.filter(game=self.game, round_number=2).exists())
+
+    def test_orders_roll_back_with_the_round(self):
+        actions = GameAction.objects.count()
+        with mock.patch.object(RoundEngine, 'resolve', side_effect=DatabaseError), self.assertRaises(DatabaseError):
+            self.game.next_round()
+        self.assertEqual(GameAction.objects.count(), actions)
+        self.assertEqual(Game.objects.get(pk=self.game.pk).round_number, 1)
+
+    def test_plan_picks_fittest_torbs(self):
+        Colony.objects.filter(pk=self.ai_colonies[0].pk).update(food=100)
+        [colony] = ai.ai_colonies(self.game, pk=self.ai_colonies[0].pk)
+        torbs = list(colony.torb_set.all())
+        by_fitness = sorted(torbs, key=lambda torb: -torb.genome_array.mean())
+        orders = dict(ai.plan_turns(self.game, [colony])[colony.pk])
+
+        self.assertEqual(set(orders['breed']['torb_ids']), {torb.id for torb in by_fitness[:2]})
+        rest = [torb for torb in torbs if torb not in by_fitness[:2]]
+        # A third of the colony's six Torbs, by their mean alleles
+        combat = {torb: np.prod(torb.genome_array.mean(axis=1)) for torb in rest}
+        strongest = sorted(rest, key=lambda torb: -combat[torb])[:2]
+        self.assertEqual(orders['enlist']['torb_ids'], [torb.id for torb in strongest])
+        self.assertIn(orders['scout']['target_colony_id'], {self.human.id, self.ai_colonies[1].id})
+        self.assertNotIn('attack', orders)
+
+    def test_games_of_only_ai_colonies_wait_for_their_deadline(self):
+        self.human.delete()
+        self.assertEqual(self.game.unready_colonies, 0)
+        self.assertFalse(Game.objects.ready_for_round().exists())
+
+    def test_fifty_colonies_are_planned_in_one_pass(self):
+        game = Game.objects.create(description="AI Game", starting_torbs=4)
+        colonies = [AIPlayer.found_colony(game, f"AI Colony {i}") for i in range(50)]
+        with CaptureQueriesContext(connection) as few:
+            ai.plan_turns(game, ai.ai_colonies(game, pk__in=[colony.pk for colony in colonies[:5]]))
+        with CaptureQueriesContext(connection) as all_fifty:
+            plans = ai.plan_turns(game, ai.ai_colonies(game))
+        self.assertEqual(len(all_fifty), len(few))
+        self.assertTrue(all(plans[colony.pk] for colony in colonies))
+
+    @override_settings(AI_TURN_BUDGET_MS=0)
+    def test_turns_stop_at_the_budget(self):
+        with self.assertLogs('hereditus', 'WARNING') as logs:
+            played = ai.take_turns(self.game)
+        self.assertEqual(len(played), 2)
+        self.assertIn("2 colonies keep their last orders", logs.output[0])
+        self.assertFalse(GameAction.objects.filter(colony__in=self.ai_colonies, action=GameAction.ENLIST).exists())
+
+class TorbArchiveTests(TestCase):
+
+    def setUp(self):
+        cache.get_cache().clear()
+        self.game, = seed_games(1, colonies_per_game=2, torbs_per_colony=30, story_texts_per_colony=0, round_number=5)
+        self.dead_ids = set(Torb.objects.filter(colony__game=self.game, is_alive=False).values_list('id', flat=True))
+
+    def test_dead_torbs_are_archived_after_their_rounds(self):
+        self.assertTrue(self.dead_ids)
+        torb = Torb.objects.get(pk=min(self.dead_ids))
+        self.assertEqual(TorbArchive.archive_dead_torbs(self.game, after_rounds=6), 0)
+        self.assertEqual(TorbArchive.archive_dead_torbs(self.game, after_rounds=5), len(self.dead_ids))
+
+        self.assertFalse(Torb.objects.filter(colony__game=self.game, is_alive=False).exists())
+        archived = TorbArchive.objects.get(torb_id=torb.pk)
+        self.assertEqual((archived.colony_id, archived.private_ID, archived.name, archived.generation, bytes(archived.genome), archived.died_round),
+                         (torb.colony_id, torb.private_ID, torb.name, torb.generation, bytes(torb.genome), 0))
+        self.assertEqual(archived.genes, torb.genes)
+
+    def test_rounds_load_only_the_living(self):
+        # A famine, nobody gathers anything and the weakest starve
+        Colony.objects.filter(game=self.game).update(food=0, gather_rate=0)
+        Torb.objects.filter(colony__game=self.game, is_alive=True, hp__gt=1).update(hp=2)
+        Torb.objects.filter(colony__game=self.game, is_alive=True, private_ID__lte=10).update(hp=1)
+        round_engine = RoundEngine(self.game)
+        round_engine.run()
+        self.assertFalse(self.dead_ids & round_engine.torbs.keys())
+        died = Torb.objects.filter(colony__game=self.game, is_alive=False).exclude(pk__in=self.dead_ids)
+        self.assertTrue(died.exists())
+        self.assertEqual(set(died.values_list('died_round', flat=True)), {5})
+        self.assertEqual(SimGame.from_game(self.game).state()['torbs'].keys(),
+                         set(Torb.objects.filter(colony__game=self.game, is_alive=True).values_list('colony_id', 'private_ID')))
+
+    @override_settings(TORB_ARCHIVE_AFTER_ROUNDS=6)
+    def test_games_archive_every_so_many_rounds(self):
+        self.game.next_round()
+        self.assertEqual(TorbArchive.objects.filter(colony__game=self.game).count(), len(self.dead_ids))
+        self.assertFalse(Torb.objects.filter(pk__in=self.dead_ids).exists())
+        # Round 7 is no archiving round
+        died = set(Torb.objects.filter(colony__game=self.game, is_alive=False).values_list('id', flat=True))
+        self.game.next_round()
+        self.assertEqual(set(Torb.objects.filter(pk__in=died).values_list('id', flat=True)), died)
+
+    def test_orders_skip_the_dead(self):
+        colony = self.game.colony_set.first()
+        living = colony.torb_set.filter(is_alive=True, growing=False).first()
+        dead = colony.torb_set.filter(is_alive=False).first()
+        with self.assertRaises(ValueError):
+            colony.set_breed_torbs([living.id, dead.id])
+        call_command('archive_dead_torbs', after_rounds=0, stdout=io.StringIO())
+        self.assertEqual(TorbArchive.objects.filter(colony__game=self.game).count(), len(self.dead_ids))
@@ -5,7 +5,10 @@ urlpatterns = [
     path('', views.main_page, name='main_page'),
     path('play/<int:colony_id>/overview/', views.colony_view, name='colony_view'),
     path('play/<int:colony_id>/army/', views.army_view, name='army_view'),
+    path('play/<int:colony_id>/story_texts/', views.story_text_feed, name='story_text_feed'),
     path('check_ready_status/<int:colony_id>/', views.check_ready_status, name='check_ready_status'),
+    path('events/<int:game_id>/', views.game_events, name='game_events'),
+    path('cache_stats/', views.cache_stats, name='cache_stats'),
     path('load_colony/', views.load_colony, name='load_colony'),
     path('register/', views.register, name='register'),
     path('login', views.login_view, name='login'),
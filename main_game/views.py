@@ -2,28 +2,28 @@ import logging
 import json
 
 from django.shortcuts import render, redirect, get_object_or_404
-from django.http import JsonResponse, Http404
+from django.http import JsonResponse, Http404, StreamingHttpResponse
+from django.db.models import Count, Prefetch, Q
 from django.contrib.auth import authenticate, login, logout, get_user_model
 from django.contrib.auth.forms import UserCreationForm, AuthenticationForm
 from django.contrib.auth.decorators import login_required
-from .models import Torb, Colony, StoryText, Game, Player
+from django.contrib.admin.views.decorators import staff_member_required
+from . import cache, events
+from .models import Torb, Colony, StoryText, Game, Player, Army
 
 logger = logging.getLogger(__name__)
 
 @login_required
 def colony_view(request, colony_id):
     try:
-        colony = get_object_or_404(Colony, id=colony_id)
+        colony = get_object_or_404(Colony.objects.select_related('game', 'player'), id=colony_id)
         player = colony.player
     except Http404:
         return redirect('main_page')
     
-    if player.user != request.user:
+    if player.user_id != request.user.id:
         return redirect('main_page')
     
-    torbs = colony.torb_set.all().order_by('private_ID')
-    story_texts = StoryText.objects.filter(colony=colony).order_by('timestamp')
-    
     if request.method == 'POST':
         selected_torbs = request.POST.getlist('selected_torbs')
         action = request.POST.get('action')
@@ -35,21 +35,60 @@ def colony_view(request, colony_id):
             
         return redirect('colony_view', colony_id=colony.id)
     
-    gene_names = list(torbs.first().genes.keys()) if torbs.exists() else []
-    logger.debug(f"Rendering colony_view with colony: {colony}, num_torbs: {colony.torb_count}, torbs: {torbs}, gene_names: {gene_names}, story_texts: {story_texts}")
+    # The dead are not listed, see TorbArchive
+    torbs = cache.attach_genomes(list(colony.torb_set.filter(is_alive=True).defer('genome').order_by('private_ID')))
+    story_texts = StoryText.objects.filter(colony=colony).with_is_new(colony.game.round_number).recent(colony.game.round_number)
+    has_older_story_texts = StoryText.objects.filter(colony=colony).has_older(colony.game.round_number)
+    gene_names = list(torbs[0].genes.keys()) if torbs else []
+    num_torbs = len(torbs)
+    logger.debug("Rendering colony_view with colony: %s, num_torbs: %s, gene_names: %s", colony, num_torbs, gene_names)
 
     return render(request, 'main_game/colony.html', {
         'colony': colony,
-        'num_torbs': colony.torb_count,
+        'num_torbs': num_torbs,
         'torbs': torbs,
         'gene_names': gene_names,
         'story_texts': story_texts,
+        'has_older_story_texts': has_older_story_texts,
+        })
+
+@login_required
+def story_text_feed(request, colony_id):
+    colony = get_object_or_404(Colony.objects.select_related('game', 'player'), id=colony_id)
+    if colony.player is None or colony.player.user_id != request.user.id:
+        raise Http404
+    
+    try:
+        cursors = {cursor: int(request.GET[cursor]) for cursor in ('before', 'after') if request.GET.get(cursor)}
+    except ValueError:
+        return JsonResponse({'error': "Cursors must be StoryText ids."}, status=400)
+    
+    story_texts, has_more = StoryText.objects.filter(colony=colony).with_is_new(colony.game.round_number).page(**cursors)
+    return JsonResponse({
+        'story_texts': [story_text.as_json() for story_text in story_texts],
+        'has_more': has_more,
+        'round_number': colony.game.round_number,
         })
 
 def check_ready_status(request, colony_id):
     colony = get_object_or_404(Colony, id=colony_id)
     return JsonResponse({'ready': colony.ready})
 
+@login_required
+def game_events(request, game_id):
+    # A plain generator, streamed by WSGI and ASGI servers alike until events.STREAM_SECONDS pass
+    if not Colony.objects.filter(game_id=game_id, player__user=request.user).exists():
+        raise Http404
+    game = Game.objects.annotate(
+        unready=Count('colony', filter=Q(colony__ready=False))).get(id=game_id)
+    
+    response = StreamingHttpResponse(
+        events.game_events.stream(game_id, events.game_events_for(game.round_number, game.unready)),
+        content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'
+    return response
+
 @login_required
 def load_colony(request):
     user = request.user
@@ -70,7 +109,7 @@ def load_colony(request):
             colony.player = player
             colony.save()
 
-    colonies = Colony.objects.filter(player__user=user)
+    colonies = Colony.objects.filter(player__user=user).order_by('id')
     games = Game.objects.filter(private=False) | Game.objects.filter(allowed_players__in=[user])
 
     return render(request, 'main_game/load_colony.html', {
@@ -81,19 +120,14 @@ def load_colony(request):
 
 @login_required
 def army_view(request, colony_id):
-    colony = get_object_or_404(Colony, id=colony_id)
+    colony = get_object_or_404(
+        Colony.objects.select_related('game', 'player', 'army'),
+        id=colony_id)
     player = colony.player
 
-    if player.user != request.user:
+    if player.user_id != request.user.id:
         return redirect('main_page')
 
-    torbs = colony.torb_set.all()
-    num_soldiers = len([torb for torb in torbs if torb.action == "soldiering"])
-    num_training = len([torb for torb in torbs if torb.action == "training"])
-    known_colonies = colony.discovered_colonies.all().order_by('id')
-    all_colonies = colony.game.colony_set.all().order_by('id')
-    story_texts = StoryText.objects.filter(colony=colony).order_by('timestamp')
-    
     if request.method == 'POST':
         selected_colony_id = request.POST.get('selected_colony')
         action = request.POST.get('action')
@@ -104,16 +138,32 @@ def army_view(request, colony_id):
             logger.error(f"Invalid action: {e}")
 
         return redirect('army_view', colony_id=colony.id)
+    
+    known_colonies = set(colony.discovered_colonies.values_list('id', flat=True))
+    all_colonies = colony.game.colony_set.prefetch_related(
+        Prefetch('army', queryset=Army.objects.with_totals())
+    ).annotate(
+        alive_torb_count=Count('torb', filter=Q(torb__is_alive=True))
+    ).order_by('id')
+    story_texts = StoryText.objects.filter(colony=colony).with_is_new(colony.game.round_number).recent(colony.game.round_number)
+    has_older_story_texts = StoryText.objects.filter(colony=colony).has_older(colony.game.round_number)
+    
     return render(request, 'main_game/army.html', {
         'colony': colony,
         'player_colony': colony,
         'story_texts': story_texts,
-        'num_soldiers': num_soldiers,
-        'num_training': num_training,
+        'has_older_story_texts': has_older_story_texts,
+        'num_soldiers': colony.num_soldiers,
+        'num_training': colony.num_training,
         'known_colonies': known_colonies,
         'all_colonies': all_colonies
         })
 
+@staff_member_required
+def cache_stats(request):
+    # Hits and misses of this process's read-through cache, per kind of entry
+    return JsonResponse(cache.stats())
+
 def main_page(request):
     if request.user.is_authenticated:
         return redirect('load_colony')
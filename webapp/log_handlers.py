@@ -0,0 +1,28 @@
+import atexit
+import logging
+import queue
+from logging.handlers import QueueHandler, QueueListener
+
+class QueuedFileHandler(QueueHandler):
+    """Appends to a log file from a background thread.
+
+    QueueHandler.prepare still formats each record in the thread that logs it, then the
+    record goes to a QueueListener that owns the FileHandler. Only the disk write moves off
+    request and round threads. Records below the logger's level are dropped before any of
+    this, so their %-style arguments are never formatted.
+    """
+
+    def __init__(self, filename, mode='a', encoding='utf-8'):
+        super().__init__(queue.SimpleQueue())
+        self.file_handler = logging.FileHandler(filename, mode=mode, encoding=encoding)
+        self.listener = QueueListener(self.queue, self.file_handler)
+        self.listener.start()
+        # Drains whatever is still queued when the process exits
+        atexit.register(self.close)
+
+    def close(self):
+        if self.listener is not None:
+            self.listener.stop()
+            self.listener = None
+            self.file_handler.close()
+        super().close()
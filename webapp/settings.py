@@ -140,12 +140,35 @@ STATIC_ROOT = os.path.join(BASE_DIR, 'staticfiles')
 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
+# Hand finished rounds to 'manage.py run_round_worker' instead of resolving them in the last ready-up request
+ASYNC_ROUNDS = True
+
+# Time AI colonies get to issue their orders before a round resolves, see main_game/ai.py
+AI_TURN_BUDGET_MS = 1000
+
+# Dead Torbs move to the TorbArchive table this many rounds after they died, checked every as many rounds. 0 keeps them
+TORB_ARCHIVE_AFTER_ROUNDS = 10
+
+# Genomes, EvolutionEngine settings and round numbers are read through this cache, see main_game/cache.py.
+# Local memory is per process, a shared backend such as Redis also shares the entries between workers
+CACHES = {
+    "default": {
+        "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+        "OPTIONS": {"MAX_ENTRIES": 100000},
+    }
+}
+HEREDITUS_CACHE = "default"
+
+# The hereditus logger is noisy at DEBUG, set HEREDITUS_LOG_LEVEL=INFO on busy servers
+HEREDITUS_LOG_LEVEL = os.environ.get("HEREDITUS_LOG_LEVEL", "DEBUG" if DEBUG else "INFO")
+
+# File handlers write through a queue so disk I/O stays off request and round threads
 LOGGING = {
     "version": 1,  # the dictConfig format version
     "disable_existing_loggers": False,  # retain the default loggers
     "handlers": {
         "file": {
-            "class": "logging.FileHandler",
+            "()": "webapp.log_handlers.QueuedFileHandler",
             "filename": "general.log",
             "formatter": "verbose"
         },
@@ -155,7 +178,7 @@ LOGGING = {
             "level": "WARNING",
         },
         "hereditus_file": {
-            "class": "logging.FileHandler",
+            "()": "webapp.log_handlers.QueuedFileHandler",
             "filename": "hereditus.log",
             "formatter": "verbose"
         }
@@ -166,7 +189,7 @@ LOGGING = {
             "handlers": ["file", "console"],
         },
         "hereditus": {
-            "level": "DEBUG",
+            "level": HEREDITUS_LOG_LEVEL,
             "handlers": ["hereditus_file", "console"],
             "propagate": False,
         }